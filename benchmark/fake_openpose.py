@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""Stand-in for openpose.bin, for benchmarking without models or a GPU.
+
+Accepts the command line openpose_api_server.py builds, prints the log lines
+the real binary prints (which monitor_output() parses), sleeps like a network
+would, and writes realistic keypoint JSON (and renders with --write_images),
+for an --image_dir or a --video.
+The same keypoints back the fake pyopenpose module in fake_python/, so the
+warm worker path can be benchmarked too.
+
+Timing is set with environment variables:
+    FAKE_OPENPOSE_LOAD_TIME   seconds to "load the network" (default 0.5)
+    FAKE_OPENPOSE_IMAGE_TIME  seconds per image at the default -1x368 net
+                              resolution and one scale (default 0.1)
+    FAKE_OPENPOSE_PART_TIME   seconds per person for each of the face and
+                              hand networks, when enabled (default 0.05)
+"""
+
+import json
+import os
+import sys
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+LOAD_TIME = float(os.environ.get("FAKE_OPENPOSE_LOAD_TIME", "0.5"))
+IMAGE_TIME = float(os.environ.get("FAKE_OPENPOSE_IMAGE_TIME", "0.1"))
+PART_TIME = float(os.environ.get("FAKE_OPENPOSE_PART_TIME", "0.05"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+# A standing person in BODY_25 order, relative to their bounding box
+BODY_25_TEMPLATE = np.array(
+    [
+        (0.50, 0.08),
+        (0.50, 0.20),
+        (0.38, 0.20),
+        (0.33, 0.35),
+        (0.30, 0.48),
+        (0.62, 0.20),
+        (0.67, 0.35),
+        (0.70, 0.48),
+        (0.50, 0.50),
+        (0.43, 0.50),
+        (0.42, 0.70),
+        (0.42, 0.90),
+        (0.57, 0.50),
+        (0.58, 0.70),
+        (0.58, 0.90),
+        (0.47, 0.06),
+        (0.53, 0.06),
+        (0.44, 0.08),
+        (0.56, 0.08),
+        (0.62, 0.97),
+        (0.65, 0.96),
+        (0.57, 0.93),
+        (0.38, 0.97),
+        (0.35, 0.96),
+        (0.43, 0.93),
+    ],
+    dtype=np.float32,
+)
+# COCO and MPI keypoints taken from the BODY_25 ones
+MODEL_PARTS = {
+    "BODY_25": list(range(25)),
+    "COCO": [0, 1, 2, 3, 4, 5, 6, 7, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18],
+    "MPI": [0, 1, 2, 3, 4, 5, 6, 7, 9, 10, 11, 12, 13, 14, 8],
+}
+
+
+def fake_people(image, model="BODY_25", face=False, hand=False):
+    """Deterministic, plausible people (1 to 3) for an image, in pixels.
+
+    The people only depend on the pixels, so openpose.bin and pyopenpose
+    detect the same ones. A blank (single color) image has nobody on it. Returns (pose, face, hand_left, hand_right) arrays
+    of shape (people, parts, 3); face and hands are None when not requested.
+    """
+    height, width = image.shape[:2]
+    rng = np.random.RandomState(zlib.crc32(np.ascontiguousarray(image).data))
+    num_people = rng.randint(1, 4) if image.std() > 1 else 0
+    parts = MODEL_PARTS[model]
+
+    pose = np.zeros((num_people, len(parts), 3), dtype=np.float32)
+    faces = np.zeros((num_people, 70, 3), dtype=np.float32)
+    hands = np.zeros((2, num_people, 21, 3), dtype=np.float32)
+    for person in range(num_people):
+        box_h = height * rng.uniform(0.4, 0.9)
+        box_w = box_h * 0.5
+        left = rng.uniform(0, max(width - box_w, 1))
+        top = rng.uniform(0, max(height - box_h, 1))
+        points = BODY_25_TEMPLATE[parts] * (box_w, box_h) + (left, top)
+        points += rng.normal(0, box_h * 0.01, points.shape)
+        pose[person, :, :2] = points
+        pose[person, :, 2] = rng.uniform(0.3, 0.95, len(parts))
+        # Some parts are not detected
+        pose[person, rng.rand(len(parts)) < 0.1] = 0
+
+        head = BODY_25_TEMPLATE[0] * (box_w, box_h) + (left, top)
+        angles = np.linspace(0, 2 * np.pi, 70, endpoint=False)
+        faces[person, :, 0] = head[0] + np.cos(angles) * box_h * 0.04
+        faces[person, :, 1] = head[1] + np.sin(angles) * box_h * 0.05
+        faces[person, :, 2] = rng.uniform(0.2, 0.9, 70)
+        for side, wrist in enumerate([7, 4]):
+            center = BODY_25_TEMPLATE[wrist] * (box_w, box_h) + (left, top)
+            hands[side, person, :, :2] = center + rng.normal(0, box_h * 0.02, (21, 2))
+            hands[side, person, :, 2] = rng.uniform(0.1, 0.8, 21)
+
+    return (
+        pose,
+        faces if face else None,
+        hands[0] if hand else None,
+        hands[1] if hand else None,
+    )
+
+
+def image_time(net_resolution="-1x368", scale_number=1):
+    """Seconds per image, growing with the network input size and scales."""
+    width, height = (int(v) for v in str(net_resolution).split("x"))
+    if width == -1:
+        width = height * 4 // 3
+    if height == -1:
+        height = width * 3 // 4
+    return IMAGE_TIME * width * height / (490 * 368) * int(scale_number)
+
+
+def face_hand_time(num_people, face=False, hand=False):
+    """Seconds the face and hand networks take, which run once per person."""
+    return PART_TIME * num_people * (int(bool(face)) + int(bool(hand)))
+
+
+def keypoint_list(array, person):
+    if array is None:
+        return []
+    return [float(v) for v in array[person].reshape(-1)]
+
+
+def write_json(path, pose, face, hand_left, hand_right, keypoint_scale, width, height):
+    """Write keypoints like openpose.bin --write_json."""
+    if keypoint_scale in (3, 4):
+        scale = np.array([1.0 / max(width - 1, 1), 1.0 / max(height - 1, 1)])
+        for array in [pose, face, hand_left, hand_right]:
+            if array is not None:
+                array[..., :2] *= scale
+                if keypoint_scale == 4:
+                    array[..., :2] = array[..., :2] * 2 - 1
+
+    people = []
+    for person in range(len(pose)):
+        people.append(
+            {
+                "person_id": [-1],
+                "pose_keypoints_2d": keypoint_list(pose, person),
+                "face_keypoints_2d": keypoint_list(face, person),
+                "hand_left_keypoints_2d": keypoint_list(hand_left, person),
+                "hand_right_keypoints_2d": keypoint_list(hand_right, person),
+                "pose_keypoints_3d": [],
+                "face_keypoints_3d": [],
+                "hand_left_keypoints_3d": [],
+                "hand_right_keypoints_3d": [],
+            }
+        )
+    with open(path, "w") as f:
+        json.dump({"version": 1.3, "people": people}, f)
+
+
+def limit_people(arrays, number_people_max):
+    """Keep the first number_people_max people (-1: all) of each array."""
+    if number_people_max < 0:
+        return arrays
+    return tuple(
+        array[:number_people_max] if array is not None else None for array in arrays
+    )
+
+
+def input_frames(options):
+    """Yield (output base name, image) for the frames OpenPose would process.
+
+    Images of --image_dir in name order, or the frames of --video (named
+    <video>_<frame number>), within --frame_first/--frame_last/--frame_step.
+    """
+    first = int(options.get("frame_first", 0))
+    last = int(options.get("frame_last", -1))
+    step = int(options.get("frame_step", 1))
+
+    def selected(index):
+        return (
+            index >= first
+            and (last < 0 or index <= last)
+            and not (index - first) % step
+        )
+
+    if options.get("video"):
+        capture = cv2.VideoCapture(options["video"])
+        base_name = os.path.splitext(os.path.basename(options["video"]))[0]
+        index = 0
+        while last < 0 or index <= last:
+            ok, image = capture.read()
+            if not ok:
+                break
+            if selected(index):
+                yield f"{base_name}_{index:012d}", image
+            index += 1
+        capture.release()
+        return
+
+    names = [
+        name
+        for name in sorted(os.listdir(options["image_dir"]))
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    for index, name in enumerate(names):
+        if not selected(index):
+            continue
+        image = cv2.imread(os.path.join(options["image_dir"], name))
+        if image is not None:
+            yield os.path.splitext(name)[0], image
+
+
+def write_render(path, image, pose, disable_blending):
+    """Write a simple skeleton render like openpose.bin --write_images."""
+    canvas = np.zeros_like(image) if disable_blending else image.copy()
+    for person in pose:
+        for a, b in zip(range(len(person) - 1), range(1, len(person))):
+            if person[a, 2] > 0 and person[b, 2] > 0:
+                cv2.line(
+                    canvas,
+                    tuple(int(v) for v in person[a, :2]),
+                    tuple(int(v) for v in person[b, :2]),
+                    (0, 0, 255),
+                    3,
+                )
+    cv2.imwrite(path, canvas)
+
+
+def parse_args(argv):
+    """Parse openpose.bin style flags (--flag value, or --flag alone)."""
+    options = {}
+    i = 0
+    while i < len(argv):
+        name = argv[i].lstrip("-")
+        if i + 1 < len(argv) and not argv[i + 1].startswith("--"):
+            options[name] = argv[i + 1]
+            i += 2
+        else:
+            options[name] = True
+            i += 1
+    return options
+
+
+def main(argv):
+    options = parse_args(argv)
+    print("Starting OpenPose demo...", flush=True)
+    print("Configuring OpenPose...", flush=True)
+    print("Starting thread(s)...", flush=True)
+    print(
+        "Auto-detecting all available GPUs... Detected 1 GPU(s), "
+        "using 1 of them starting at GPU 0.",
+        flush=True,
+    )
+    started = time.time()
+    time.sleep(LOAD_TIME)
+
+    if options.get("video"):
+        if not os.path.isfile(options["video"]):
+            print(
+                f"Error: video {options['video']} could not be opened.",
+                file=sys.stderr,
+                flush=True,
+            )
+            return 1
+    else:
+        image_dir = options.get("image_dir")
+        if not image_dir or not os.path.isdir(image_dir):
+            print(
+                f"Error: folder {image_dir} does not exist.",
+                file=sys.stderr,
+                flush=True,
+            )
+            return 1
+
+    model = options.get("model_pose", "BODY_25")
+    keypoint_scale = int(options.get("keypoint_scale", 0))
+    number_people_max = int(options.get("number_people_max", -1))
+    for base_name, image in input_frames(options):
+        height, width = image.shape[:2]
+        time.sleep(
+            image_time(
+                options.get("net_resolution", "-1x368"),
+                options.get("scale_number", 1),
+            )
+        )
+
+        pose, face, hand_left, hand_right = limit_people(
+            fake_people(image, model, "face" in options, "hand" in options),
+            number_people_max,
+        )
+        time.sleep(face_hand_time(len(pose), "face" in options, "hand" in options))
+        if options.get("write_images"):
+            os.makedirs(options["write_images"], exist_ok=True)
+            write_render(
+                os.path.join(options["write_images"], f"{base_name}_rendered.png"),
+                image,
+                pose,
+                "disable_blending" in options,
+            )
+        if options.get("write_json"):
+            os.makedirs(options["write_json"], exist_ok=True)
+            write_json(
+                os.path.join(options["write_json"], f"{base_name}_keypoints.json"),
+                pose,
+                face,
+                hand_left,
+                hand_right,
+                keypoint_scale,
+                width,
+                height,
+            )
+
+    print(
+        "OpenPose demo successfully finished. "
+        f"Total time: {time.time() - started:.6f} seconds.",
+        flush=True,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
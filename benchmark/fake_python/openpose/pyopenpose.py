@@ -0,0 +1,83 @@
+"""Stand-in for OpenPose's pyopenpose module, for benchmarking.
+
+Point OPENPOSE_PYTHON_PATH at benchmark/fake_python to have
+openpose_worker.py load it. Detects the same people as fake_openpose.py and
+takes the same FAKE_OPENPOSE_* timings.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from fake_openpose import (  # noqa: E402
+    LOAD_TIME,
+    face_hand_time,
+    fake_people,
+    image_time,
+    limit_people,
+)
+
+
+class Datum:
+    def __init__(self):
+        self.cvInputData = None
+        self.cvOutputData = None
+        self.poseKeypoints = None
+        self.faceKeypoints = None
+        self.handKeypoints = None
+
+
+class VectorDatum(list):
+    pass
+
+
+class WrapperPython:
+    def __init__(self):
+        self.params = {}
+
+    def configure(self, params):
+        self.params = dict(params)
+
+    def start(self):
+        time.sleep(LOAD_TIME)
+
+    def stop(self):
+        pass
+
+    def emplaceAndPop(self, datums):
+        for datum in datums:
+            time.sleep(
+                image_time(
+                    self.params.get("net_resolution", "-1x368"),
+                    self.params.get("scale_number", 1),
+                )
+            )
+            pose, face, hand_left, hand_right = limit_people(
+                fake_people(
+                    datum.cvInputData,
+                    self.params.get("model_pose", "BODY_25"),
+                    bool(self.params.get("face")),
+                    bool(self.params.get("hand")),
+                ),
+                int(self.params.get("number_people_max", -1)),
+            )
+            time.sleep(
+                face_hand_time(
+                    len(pose), self.params.get("face"), self.params.get("hand")
+                )
+            )
+            # Like pyopenpose: an empty array when nothing was computed
+            datum.poseKeypoints = pose if len(pose) else np.array(0.0)
+            datum.faceKeypoints = face if face is not None else np.array(0.0)
+            datum.handKeypoints = [
+                hand if hand is not None else np.array(0.0)
+                for hand in (hand_left, hand_right)
+            ]
+            datum.cvOutputData = datum.cvInputData
+        return True
@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""Load test the OpenPose API server.
+
+Sends a mix of requests (/process, /process_batch, /infer and /status) from
+several concurrent clients and reports latency percentiles and throughput per
+request type. Asynchronous jobs are timed from submission until their "done"
+event on /jobs/<job_id>/events, so the latency includes queueing.
+
+By default a server is started on a free port with fake_openpose.py standing
+in for openpose.bin (and fake_python/ for pyopenpose), so no models are
+needed. --real starts it with the configured OpenPose binary and models
+instead, and --url benchmarks a server that is already running.
+
+    python benchmark/run_benchmark.py --concurrency 8 --requests 200
+    python benchmark/run_benchmark.py --mix process=1 --warm-worker 0
+    python benchmark/run_benchmark.py --server flask --mix status=10,infer=1
+    python benchmark/run_benchmark.py --real --duration 120 --json out.json
+    python benchmark/run_benchmark.py --url http://127.0.0.1:2500 \\
+        --image-dir /images/bench
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(os.path.dirname(BENCHMARK_DIR), "openpose_api_server.py")
+FAKE_BIN = os.path.join(BENCHMARK_DIR, "fake_openpose.py")
+FAKE_PYTHON_PATH = os.path.join(BENCHMARK_DIR, "fake_python")
+
+REQUEST_TYPES = ["process", "batch", "infer", "status"]
+PERCENTILES = [50, 95, 99]
+
+
+def parse_mix(text):
+    """Parse "process=4,infer=2" into {request type: weight}."""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in REQUEST_TYPES:
+            raise argparse.ArgumentTypeError(
+                f"Unknown request type: {name}. Must be one of: {', '.join(REQUEST_TYPES)}"
+            )
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one positive weight")
+    return mix
+
+
+def make_images(image_dir, count, width, height, seed=0, empty=0.0):
+    """Write count synthetic JPEG images to image_dir and return their paths.
+
+    A share empty of them is blank, which the fake OpenPose finds nobody on.
+    """
+    os.makedirs(image_dir, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    paths = []
+    for i in range(count):
+        image = np.full((height, width, 3), rng.randint(0, 255, 3), dtype=np.uint8)
+        for _ in range(8 if i >= count * empty else 0):
+            center = (int(rng.randint(width)), int(rng.randint(height)))
+            axes = (int(rng.randint(10, width // 4)), int(rng.randint(10, height // 4)))
+            color = tuple(int(c) for c in rng.randint(0, 255, 3))
+            cv2.ellipse(image, center, axes, 0, 0, 360, color, -1)
+        path = os.path.join(image_dir, f"bench_{i:04d}.jpg")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def fake_model_folder(root):
+    """A model folder that passes the server's model checks."""
+    for model in ["body_25", "coco", "mpi"]:
+        model_dir = os.path.join(root, "pose", model)
+        os.makedirs(model_dir, exist_ok=True)
+        open(os.path.join(model_dir, "pose_deploy_linevec.prototxt"), "w").close()
+    return root + os.sep
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir):
+    """Start openpose_api_server.py and wait until /status answers.
+
+    Returns (process, base URL, log path).
+    """
+    port = free_port()
+    env = dict(os.environ)
+    env.update(
+        {
+            "OPENPOSE_API_PORT": str(port),
+            "OPENPOSE_JOB_WORKSPACE": os.path.join(workdir, "jobs"),
+            "OPENPOSE_CACHE_DIR": os.path.join(workdir, "cache"),
+            "OPENPOSE_MAX_QUEUE_SIZE": str(args.max_queue_size),
+            "PYTHONUNBUFFERED": "1",
+        }
+    )
+    if not args.real:
+        env.update(
+            {
+                "OPENPOSE_BIN": FAKE_BIN,
+                "OPENPOSE_MODEL_FOLDER": fake_model_folder(
+                    os.path.join(workdir, "models")
+                ),
+                "OPENPOSE_PYTHON_PATH": FAKE_PYTHON_PATH,
+                "FAKE_OPENPOSE_LOAD_TIME": str(args.fake_load_time),
+                "FAKE_OPENPOSE_IMAGE_TIME": str(args.fake_image_time),
+                "FAKE_OPENPOSE_PART_TIME": str(args.fake_part_time),
+            }
+        )
+    if args.workers is not None:
+        env["OPENPOSE_WORKERS"] = str(args.workers)
+    if args.warm_worker is not None:
+        env["OPENPOSE_WARM_WORKER"] = str(args.warm_worker)
+    if args.server is not None:
+        env["OPENPOSE_SERVER"] = args.server
+
+    log_path = os.path.join(workdir, "server.log")
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT],
+        cwd=os.path.dirname(SERVER_SCRIPT),
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            urllib.request.urlopen(f"{url}/status", timeout=1).read()
+            return process, url, log_path
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    with open(log_path) as f:
+        sys.stderr.write(f.read())
+    raise SystemExit("The server did not start (log above)")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+class Client:
+    """Sends benchmark requests to one server and times them."""
+
+    def __init__(self, args, url, image_paths, output_dir):
+        self.args = args
+        self.url = url.rstrip("/")
+        self.image_paths = image_paths
+        self.output_dir = output_dir
+        self.options = json.loads(args.options) if args.options else {}
+        self.image_bytes = {}
+        for path in image_paths:
+            with open(path, "rb") as f:
+                self.image_bytes[path] = f.read()
+        self.local = threading.local()  # keep-alive connection per client thread
+
+    def request(self, path, body=None, headers=None):
+        """Return (HTTP status, parsed JSON body)."""
+        data = None
+        headers = dict(headers or {})
+        if isinstance(body, dict):
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        elif body is not None:
+            data = body
+        if self.args.keep_alive:
+            return self.request_keep_alive(path, data, headers)
+        req = urllib.request.Request(f"{self.url}{path}", data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.args.timeout) as response:
+                return response.status, json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b"{}")
+            except ValueError:
+                return e.code, {}
+
+    def request_keep_alive(self, path, data, headers):
+        """request() over this thread's persistent connection."""
+        for attempt in range(2):
+            connection = getattr(self.local, "connection", None)
+            if connection is None:
+                url = urllib.parse.urlsplit(self.url)
+                connection = self.local.connection = http.client.HTTPConnection(
+                    url.hostname, url.port or 80, timeout=self.args.timeout
+                )
+            try:
+                connection.request(
+                    "POST" if data is not None else "GET", path, data, headers
+                )
+                response = connection.getresponse()
+                content = response.read()
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle connection: reconnect once
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                connection.close()
+                self.local.connection = None
+            try:
+                return response.status, json.loads(content or b"{}")
+            except ValueError:
+                return response.status, {}
+
+    def wait_for_job(self, job_id):
+        """Follow the job's NDJSON event stream until it is done; return the job."""
+        req = urllib.request.Request(f"{self.url}/jobs/{job_id}/events?format=ndjson")
+        with urllib.request.urlopen(req, timeout=self.args.timeout) as response:
+            for line in response:
+                line = line.strip()
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "done":
+                    return event["job"]
+                if event["type"] == "snapshot" and event["job"].get("finished_at"):
+                    return event["job"]
+        return None
+
+    def job_options(self):
+        options = {"output_dir": self.output_dir, "use_cache": self.args.cache}
+        options.update(self.options)
+        return options
+
+    def submit_and_wait(self, path, body):
+        status, reply = self.request(path, body)
+        if status != 200 or not reply.get("success"):
+            return {"ok": False, "status": status}
+        job = self.wait_for_job(reply["job_id"])
+        if job is None:
+            return {"ok": False, "status": status}
+        return {
+            "ok": job["state"] == "done" and bool(job.get("success")),
+            "status": status,
+            "queue_wait": job.get("queue_wait"),
+            "duration": job.get("duration"),
+        }
+
+    def process(self, rng):
+        body = self.job_options()
+        body["image_path"] = rng.choice(self.image_paths)
+        return self.submit_and_wait("/process", body)
+
+    def batch(self, rng):
+        body = self.job_options()
+        size = min(self.args.batch_size, len(self.image_paths))
+        body["image_paths"] = rng.sample(self.image_paths, size)
+        return self.submit_and_wait("/process_batch", body)
+
+    def infer(self, rng):
+        path = rng.choice(self.image_paths)
+        query = {"use_cache": str(self.args.cache).lower()}
+        query.update({key: str(value).lower() for key, value in self.options.items()})
+        status, reply = self.request(
+            f"/infer?{urllib.parse.urlencode(query)}",
+            self.image_bytes[path],
+            {"Content-Type": "image/jpeg"},
+        )
+        return {"ok": status == 200 and bool(reply.get("success")), "status": status}
+
+    def status(self, rng):
+        status, _ = self.request("/status")
+        return {"ok": status == 200, "status": status}
+
+    def run(self, kind, rng):
+        """Send one request of the given type; return its timed result."""
+        started = time.time()
+        try:
+            result = getattr(self, kind)(rng)
+        except (OSError, ValueError) as e:
+            result = {"ok": False, "status": None, "error": str(e)}
+        result["type"] = kind
+        result["latency"] = time.time() - started
+        return result
+
+
+def run_load(client, args, mix):
+    """Run the benchmark; return (results, wall time in seconds)."""
+    kinds = [kind for kind, weight in mix.items() if weight > 0]
+    weights = [mix[kind] for kind in kinds]
+    results = []
+    lock = threading.Lock()
+    issued = [0]
+    started = time.time()
+    deadline = started + args.duration if args.duration else None
+
+    def next_request():
+        with lock:
+            if deadline is not None:
+                return time.time() < deadline
+            if issued[0] >= args.requests:
+                return False
+            issued[0] += 1
+            return True
+
+    def client_loop(index):
+        rng = random.Random(args.seed + index)
+        while next_request():
+            result = client.run(rng.choices(kinds, weights)[0], rng)
+            with lock:
+                results.append(result)
+
+    threads = [
+        threading.Thread(target=client_loop, args=(i,), daemon=True)
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.time() - started
+
+
+def summarize(results, elapsed):
+    """Latency percentiles (ms) and throughput per request type and overall."""
+    groups = defaultdict(list)
+    for result in results:
+        groups[result["type"]].append(result)
+    groups["all"] = results
+
+    summary = {}
+    for kind, group in groups.items():
+        ok = [r for r in group if r["ok"]]
+        latencies = np.array([r["latency"] for r in ok]) * 1000
+        stats = {
+            "requests": len(group),
+            "errors": len(group) - len(ok),
+            "rejected": sum(1 for r in group if r["status"] == 429),
+            "throughput": len(ok) / elapsed if elapsed else 0.0,
+        }
+        if len(latencies):
+            stats["mean_ms"] = float(latencies.mean())
+            for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+                stats[f"p{p}_ms"] = float(value)
+            stats["max_ms"] = float(latencies.max())
+        for key in ["queue_wait", "duration"]:
+            values = [r[key] for r in ok if r.get(key) is not None]
+            if values:
+                stats[f"{key}_p50_ms"] = float(np.percentile(values, 50) * 1000)
+        summary[kind] = stats
+    return summary
+
+
+def print_summary(summary, elapsed):
+    columns = ["requests", "errors", "rejected", "throughput", "mean_ms"]
+    columns += [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+    columns += ["queue_wait_p50_ms", "duration_p50_ms"]
+    headers = ["type", "reqs", "errors", "429", "req/s", "mean", "p50", "p95", "p99"]
+    headers += ["max", "queue p50", "run p50"]
+    rows = [headers]
+    for kind in [k for k in REQUEST_TYPES if k in summary] + ["all"]:
+        row = [kind]
+        for column in columns:
+            value = summary[kind].get(column)
+            if value is None:
+                row.append("-")
+            elif isinstance(value, int):
+                row.append(str(value))
+            else:
+                row.append(f"{value:.1f}" if column != "throughput" else f"{value:.2f}")
+        rows.append(row)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(headers))]
+    for row in rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+    print(f"\nLatencies in ms over successful requests, wall time {elapsed:.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="benchmark a server that is already running")
+    target.add_argument(
+        "--real",
+        action="store_true",
+        help="start the server with the real OpenPose binary and models",
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="requests to send")
+    parser.add_argument(
+        "--duration", type=float, help="run for this many seconds instead"
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default="process=4,infer=3,batch=1,status=2",
+        help="relative weights of the request types",
+    )
+    parser.add_argument("--batch-size", type=int, default=4, help="images per batch")
+    parser.add_argument("--images", type=int, default=16, help="distinct images")
+    parser.add_argument(
+        "--image-size", default="640x480", help="size of the generated images"
+    )
+    parser.add_argument(
+        "--empty-images",
+        type=float,
+        default=0.0,
+        help="share of blank images, with nobody on them (0 to 1)",
+    )
+    parser.add_argument(
+        "--image-dir",
+        help="where to write the images (must be readable by the server)",
+    )
+    parser.add_argument(
+        "--output-dir", help="output_dir of the jobs (default: a temporary dir)"
+    )
+    parser.add_argument(
+        "--options", help="extra processing options, e.g. '{\"detect_hands\": true}'"
+    )
+    parser.add_argument(
+        "--cache", action="store_true", help="let requests use the result cache"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=2, help="untimed requests per type first"
+    )
+    parser.add_argument("--timeout", type=float, default=600, help="per request (s)")
+    parser.add_argument(
+        "--keep-alive",
+        action="store_true",
+        help="reuse one connection per client (like a requests.Session)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the summary to this file")
+    server = parser.add_argument_group("started server")
+    server.add_argument("--workers", type=int, help="OPENPOSE_WORKERS")
+    server.add_argument(
+        "--warm-worker", type=int, choices=[0, 1], help="OPENPOSE_WARM_WORKER"
+    )
+    server.add_argument(
+        "--max-queue-size", type=int, default=256, help="OPENPOSE_MAX_QUEUE_SIZE"
+    )
+    server.add_argument(
+        "--server", choices=["gunicorn", "flask"], help="OPENPOSE_SERVER"
+    )
+    server.add_argument(
+        "--fake-load-time", type=float, default=0.5, help="fake network load (s)"
+    )
+    server.add_argument(
+        "--fake-image-time", type=float, default=0.1, help="fake inference (s/image)"
+    )
+    server.add_argument(
+        "--fake-part-time",
+        type=float,
+        default=0.05,
+        help="fake face/hand inference (s/person each)",
+    )
+    args = parser.parse_args()
+    if isinstance(args.mix, str):
+        args.mix = parse_mix(args.mix)
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+
+    workdir = tempfile.mkdtemp(prefix="openpose_bench_")
+    process = None
+    try:
+        image_paths = make_images(
+            args.image_dir or os.path.join(workdir, "images"),
+            args.images,
+            width,
+            height,
+            args.seed,
+            args.empty_images,
+        )
+        output_dir = args.output_dir or os.path.join(workdir, "output")
+        if args.url:
+            url = args.url
+        else:
+            process, url, log_path = start_server(args, workdir)
+            print(f"Server started at {url} (log: {log_path})")
+
+        client = Client(
+            args, url, [os.path.abspath(p) for p in image_paths], output_dir
+        )
+        rng = random.Random(args.seed)
+        for kind in args.mix:
+            for _ in range(args.warmup if args.mix[kind] > 0 else 0):
+                result = client.run(kind, rng)
+                if not result["ok"]:
+                    print(f"Warm-up {kind} request failed: {result}", file=sys.stderr)
+
+        length = f"{args.duration} s" if args.duration else f"{args.requests} requests"
+        print(f"Running {length} from {args.concurrency} clients...")
+        results, elapsed = run_load(client, args, args.mix)
+        summary = summarize(results, elapsed)
+        print_summary(summary, elapsed)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(
+                    {
+                        "config": {
+                            key: value
+                            for key, value in vars(args).items()
+                            if key != "json"
+                        },
+                        "elapsed": elapsed,
+                        "summary": summary,
+                    },
+                    f,
+                    indent=2,
+                )
+    finally:
+        if process is not None:
+            stop_server(process)
+            if process.returncode not in (0, -15):
+                print(f"Server log kept in {workdir}", file=sys.stderr)
+                return
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Vectorized keypoint statistics for one image or a whole batch.
+
+All people are stacked into (people, parts, 3) arrays (one per section: pose,
+face, left and right hand), and per-person and per-part statistics are
+computed in a single pass over those arrays instead of person by person.
+"""
+
+import numpy as np
+
+from openpose_render import model_from_num_parts, people_array
+
+SECTION_KEYS = {
+    "pose": "pose_keypoints_2d",
+    "face": "face_keypoints_2d",
+    "hand_left": "hand_left_keypoints_2d",
+    "hand_right": "hand_right_keypoints_2d",
+}
+SECTION_PARTS = {"face": 70, "hand_left": 21, "hand_right": 21}
+
+# BODY_25 foot keypoints (big toe, small toe and heel of both feet)
+FOOT_PARTS = slice(19, 25)
+
+DEFAULT_THRESHOLDS = {
+    "pose": 0.05,
+    "feet": 0.03,
+    "face": 0.4,
+    "hand": 0.2,
+}
+
+
+def stack_people(people):
+    """Stack the keypoints of people (OpenPose JSON layout) per section.
+
+    Returns {section: (people, parts, 3) float32 array}; sections nobody has
+    keypoints for are left out.
+    """
+    num_parts = 0
+    for person in people:
+        num_parts = len(person.get("pose_keypoints_2d") or []) // 3
+        if num_parts:
+            break
+
+    sections = {"pose": people_array(people, "pose_keypoints_2d", num_parts)}
+    for name, parts in SECTION_PARTS.items():
+        if any(person.get(SECTION_KEYS[name]) for person in people):
+            sections[name] = people_array(people, SECTION_KEYS[name], parts)
+    return sections
+
+
+def part_thresholds(num_parts, thresholds):
+    """Per-part confidence thresholds of the body (feet have their own)."""
+    part_threshold = np.full(num_parts, thresholds["pose"], dtype=np.float32)
+    if model_from_num_parts(num_parts) == "BODY_25":
+        part_threshold[FOOT_PARTS] = thresholds["feet"]
+    return part_threshold
+
+
+def analyze_sections(sections, thresholds=None):
+    """Per-person and per-part statistics of stacked keypoints.
+
+    Returns a dict of arrays with one entry per person (valid_parts,
+    mean_confidence, bbox, has_face, has_hands, has_feet) and per body part
+    (part_detections, part_mean_confidence).
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    pose = sections["pose"]
+    num_people, num_parts = pose.shape[:2]
+
+    confidence = pose[..., 2]
+    valid = confidence > part_thresholds(num_parts, thresholds)
+    valid_parts = valid.sum(axis=1)
+
+    # Mean confidence over each person's valid parts
+    mean_confidence = np.divide(
+        np.where(valid, confidence, 0).sum(axis=1),
+        valid_parts,
+        out=np.zeros(num_people, dtype=np.float32),
+        where=valid_parts > 0,
+    )
+
+    # Bounding boxes (x_min, y_min, x_max, y_max) of the valid parts
+    xy = pose[..., :2]
+    mins = np.where(valid[..., None], xy, np.inf).min(axis=1, initial=np.inf)
+    maxs = np.where(valid[..., None], xy, -np.inf).max(axis=1, initial=-np.inf)
+    bbox = np.concatenate([mins, maxs], axis=1)
+
+    def any_valid(name, threshold):
+        if name not in sections or sections[name].shape[0] != num_people:
+            return np.zeros(num_people, dtype=bool)
+        return (sections[name][..., 2] > threshold).any(axis=1)
+
+    if model_from_num_parts(num_parts) == "BODY_25":
+        has_feet = valid[:, FOOT_PARTS].any(axis=1)
+    else:
+        has_feet = np.zeros(num_people, dtype=bool)
+
+    return {
+        "num_parts": num_parts,
+        "valid_parts": valid_parts,
+        "mean_confidence": mean_confidence,
+        "bbox": bbox,
+        "has_body": valid_parts > 0,
+        "has_face": any_valid("face", thresholds["face"]),
+        "has_hands": any_valid("hand_left", thresholds["hand"])
+        | any_valid("hand_right", thresholds["hand"]),
+        "has_feet": has_feet,
+        "part_detections": valid.sum(axis=0),
+        "part_mean_confidence": np.divide(
+            np.where(valid, confidence, 0).sum(axis=0),
+            valid.sum(axis=0),
+            out=np.zeros(num_parts, dtype=np.float32),
+            where=valid.sum(axis=0) > 0,
+        ),
+    }
+
+
+def person_stats(stats, person):
+    """JSON-friendly statistics of one person from analyze_sections()."""
+    bbox = stats["bbox"][person]
+    return {
+        "valid_parts": int(stats["valid_parts"][person]),
+        "mean_confidence": float(stats["mean_confidence"][person]),
+        "bbox": [float(v) for v in bbox] if stats["has_body"][person] else None,
+        "has_face": bool(stats["has_face"][person]),
+        "has_hands": bool(stats["has_hands"][person]),
+        "has_feet": bool(stats["has_feet"][person]),
+    }
+
+
+def keypoint_stats(people, thresholds=None):
+    """Statistics of all people detected in one image (OpenPose JSON layout)."""
+    return sections_stats(stack_people(people), thresholds)
+
+
+def sections_stats(sections, thresholds=None):
+    """Statistics of all people of one image, from stacked sections.
+
+    Keeps the top-level fields /status always had (num_people_detected,
+    has_*_keypoints, model_used), now over every person, and adds per-person
+    and per-part details.
+    """
+    stats = analyze_sections(sections, thresholds)
+    num_people = len(stats["valid_parts"])
+    return {
+        "num_people_detected": num_people,
+        "has_face_keypoints": bool(stats["has_face"].any()),
+        "has_hand_keypoints": bool(stats["has_hands"].any()),
+        "has_feet_keypoints": bool(stats["has_feet"].any()),
+        "model_used": model_from_num_parts(stats["num_parts"]) or "unknown",
+        "people": [person_stats(stats, person) for person in range(num_people)],
+        "part_detections": stats["part_detections"].tolist(),
+    }
+
+
+def batch_stats(images, thresholds=None):
+    """Statistics over the people of many images ([people, ...] per image)."""
+    everyone = [person for people in images for person in people]
+    counts = [len(people) for people in images]
+    return sections_batch_stats(stack_people(everyone), counts, thresholds)
+
+
+def sections_batch_stats(sections, counts, thresholds=None):
+    """Statistics over many images, from the stacked sections of all their people.
+
+    counts[i] is the number of people of image i.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    num_people = int(counts.sum())
+    summary = {
+        "images": len(counts),
+        "people": num_people,
+        "people_per_image": float(counts.mean()) if len(counts) else 0.0,
+        "images_without_people": int((counts == 0).sum()),
+        "max_people_per_image": int(counts.max()) if len(counts) else 0,
+    }
+    if not num_people:
+        return summary
+
+    stats = analyze_sections(sections, thresholds)
+    summary.update(
+        {
+            "model_used": model_from_num_parts(stats["num_parts"]) or "unknown",
+            "mean_valid_parts": float(stats["valid_parts"].mean()),
+            "mean_confidence": float(stats["mean_confidence"].mean()),
+            "people_with_face": int(stats["has_face"].sum()),
+            "people_with_hands": int(stats["has_hands"].sum()),
+            "people_with_feet": int(stats["has_feet"].sum()),
+            "part_detection_rate": (stats["part_detections"] / num_people).tolist(),
+        }
+    )
+    return summary
+
+
+def packed_sections(index, keypoints):
+    """Sections of packed binary keypoints (see openpose_keypoints)."""
+    return {
+        name: np.asarray(keypoints[:, start:end])
+        for name, (start, end) in index["sections"].items()
+    }
@@ -1,81 +1,619 @@
 import os
+import sys
+import base64
+import glob
+import heapq
+import importlib.util
+import itertools
+import shutil
 import subprocess
 import json
+import re
+import tempfile
 import time
-from flask import Flask, request, jsonify
+import uuid
+from collections import OrderedDict
+from concurrent import futures
+from flask import Flask, Response, request, jsonify
 import threading
+import cv2
 import numpy as np
 
+from openpose_analytics import (
+    batch_stats,
+    keypoint_stats,
+    packed_sections,
+    sections_stats,
+)
+from openpose_cache import ResultCache, cache_key, hash_bytes, hash_file
+from openpose_calibration import (
+    DEFAULT_NET_RESOLUTION,
+    DEFAULT_SCALE_NUMBER,
+    MODEL_PROTOTXT,
+    CalibrationTable,
+    parse_net_resolution,
+)
+from openpose_keypoints import (
+    KEYPOINT_FORMATS,
+    image_keypoints,
+    load_keypoints_binary,
+    write_keypoints_binary,
+)
+from openpose_encode import (
+    THUMBNAIL_KINDS,
+    EncoderPool,
+    encode_image,
+    encoding_extension,
+    make_thumbnail,
+    parse_encoding,
+    write_file,
+    write_image,
+)
+from openpose_log import LogBuffer
+from openpose_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from openpose_render import composite, render_skeleton
 
 DEBUG = True
-process_handle = None
 
-app = Flask(__name__)
+# Port the API listens on
+API_PORT = int(os.environ.get("OPENPOSE_API_PORT", "2500"))
+
+# HTTP server: "gunicorn" (one process, HTTP_THREADS threads, keep-alive),
+# "flask" (the development server) or "auto" (gunicorn if it is installed).
+# Jobs and workers live in the server process, so there is only ever one.
+HTTP_SERVER = os.environ.get("OPENPOSE_SERVER", "auto")
+HTTP_THREADS = int(os.environ.get("OPENPOSE_HTTP_THREADS", "32"))
+HTTP_KEEPALIVE = int(os.environ.get("OPENPOSE_HTTP_KEEPALIVE", "5"))
+
+# /stop: seconds a stopped OpenPose process gets to exit before it is killed
+STOP_GRACE_PERIOD = 1.0
+
+# Job deadlines: a job still running "timeout" seconds after it started is
+# stopped and marked timed_out (OPENPOSE_JOB_TIMEOUT by default, 0 for no
+# limit). /infer jobs default to OPENPOSE_INFER_TIMEOUT, nobody waits longer.
+JOB_TIMEOUT = float(os.environ.get("OPENPOSE_JOB_TIMEOUT", "3600"))
+DEADLINE_CHECK_INTERVAL = 1.0
+
+# OpenPose binary and models (paths relative to /openpose inside the container)
+OPENPOSE_BIN = os.environ.get("OPENPOSE_BIN", "./build/examples/openpose/openpose.bin")
+MODEL_FOLDER = os.environ.get("OPENPOSE_MODEL_FOLDER", "/openpose/models/")
+
+# Keep a warm pyopenpose worker around instead of spawning openpose.bin per request.
+# Set OPENPOSE_WARM_WORKER=0 to always use the openpose.bin subprocess path.
+USE_WARM_WORKER = os.environ.get("OPENPOSE_WARM_WORKER", "1") == "1"
+WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "openpose_worker.py"
+)
+
+# Per-job workspaces (only the requested image is staged for OpenPose)
+JOB_WORKSPACE_ROOT = os.environ.get(
+    "OPENPOSE_JOB_WORKSPACE", os.path.join(tempfile.gettempdir(), "openpose_jobs")
+)
+
+# Execution pool. OPENPOSE_WORKERS=0 sizes the pool from the available cores,
+# giving each worker OPENPOSE_WORKER_THREADS OMP/BLAS threads (default 4).
+# OPENPOSE_PIN_CPUS=1 pins every worker to its own slice of CPUs.
+POOL_WORKERS = int(os.environ.get("OPENPOSE_WORKERS", "0"))
+WORKER_THREADS = int(os.environ.get("OPENPOSE_WORKER_THREADS", "0"))
+DEFAULT_WORKER_THREADS = 4
+PIN_WORKER_CPUS = os.environ.get("OPENPOSE_PIN_CPUS", "0") == "1"
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
+
+# Model residency: each worker keeps a warm worker for every configuration
+# (model, face, hand, network settings) it has run, and the least recently
+# used ones are evicted while the warm workers of the pool use more than
+# OPENPOSE_MODEL_MEMORY_MB of memory (RSS). 0 keeps a single configuration
+# per worker, reloaded whenever a job needs another one.
+MODEL_MEMORY_MB = int(os.environ.get("OPENPOSE_MODEL_MEMORY_MB", "0"))
+
+# Warm workers are restarted (and their network reloaded) once they have run
+# OPENPOSE_RECYCLE_JOBS jobs or their RSS passes OPENPOSE_RECYCLE_RSS_MB,
+# so slow memory growth does not build up. 0 disables either limit.
+RECYCLE_JOBS = int(os.environ.get("OPENPOSE_RECYCLE_JOBS", "0"))
+RECYCLE_RSS_MB = int(os.environ.get("OPENPOSE_RECYCLE_RSS_MB", "0"))
+
+# Startup preloading: models (MODEL[+face][+hand], comma separated) the
+# workers load and run a warm-up inference with on OPENPOSE_WARMUP_IMAGE
+# before taking jobs. /ready answers 503 until they are warm. An empty
+# OPENPOSE_PRELOAD disables preloading.
+PRELOAD_MODELS = os.environ.get("OPENPOSE_PRELOAD", "BODY_25")
+WARMUP_IMAGE = os.environ.get(
+    "OPENPOSE_WARMUP_IMAGE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", "test.jpg"),
+)
+
+# Job queue limits: queued jobs beyond MAX_QUEUE_SIZE are rejected with 429,
+# and only the last MAX_FINISHED_JOBS finished jobs are kept for /jobs/<id>
+MAX_QUEUE_SIZE = int(os.environ.get("OPENPOSE_MAX_QUEUE_SIZE", "32"))
+MAX_FINISHED_JOBS = int(os.environ.get("OPENPOSE_MAX_FINISHED_JOBS", "200"))
+
+# Batches: maximum images per /process_batch request, and how often a running
+# openpose.bin batch is checked for finished images (seconds)
+MAX_BATCH_SIZE = int(os.environ.get("OPENPOSE_MAX_BATCH_SIZE", "1000"))
+BATCH_POLL_INTERVAL = 0.2
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+# Threads encoding and writing rendered images (see openpose_encode), shared
+# by all workers
+ENCODER_THREADS = int(os.environ.get("OPENPOSE_ENCODER_THREADS", "2"))
+# Encoder tasks queued or running at a time; a worker waits for room before it
+# takes its next job (default: twice the encoder threads)
+ENCODER_QUEUE_SIZE = int(
+    os.environ.get("OPENPOSE_ENCODER_QUEUE_SIZE", str(2 * ENCODER_THREADS))
+)
+# Batches with face/hand detection find the bodies first, and only run the face
+# and hand networks on images with a body keypoint above this confidence
+FACE_HAND_GATE_THRESHOLD = 0.1
+
+# Adaptive frame sampling of videos: keyframes are at most this many frames
+# apart, and the frames between two keyframes are inferred instead of
+# interpolated when their people moved more than the motion threshold (mean
+# keypoint displacement, as a fraction of the frame diagonal)
+DEFAULT_KEYFRAME_STRIDE = 8
+MAX_KEYFRAME_STRIDE = 64
+DEFAULT_MOTION_THRESHOLD = 0.02
+
+# Progress streaming (/jobs/<id>/events): events kept per job, and seconds
+# between keep-alives on an idle stream
+MAX_JOB_EVENTS = 500
+EVENT_KEEPALIVE = 15
+
+# Output of OpenPose kept per job (/jobs/<id>/log), and the stderr lines a
+# failed openpose.bin run quotes in the job's status message
+JOB_LOG_LINES = int(os.environ.get("OPENPOSE_JOB_LOG_LINES", "1000"))
+ERROR_LOG_LINES = 20
 
-# Global variables to track processing status
-processing_status = {
-    "is_processing": False,
-    "current_image": None,
-    "status_message": "Idle",
-    "progress": 0,
-}
+# Synchronous /infer: how long a request waits for its result (seconds), and
+# the largest accepted upload (MB)
+INFER_TIMEOUT = float(os.environ.get("OPENPOSE_INFER_TIMEOUT", "60"))
+MAX_UPLOAD_MB = int(os.environ.get("OPENPOSE_MAX_UPLOAD_MB", "32"))
 
-# Lock for thread safety
+# Result cache: results of identical requests (same image bytes and options)
+# are kept on disk, least recently used evicted first beyond either budget.
+# OPENPOSE_CACHE_MAX_ENTRIES=0 disables the cache.
+CACHE_DIR = os.environ.get(
+    "OPENPOSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "openpose_cache")
+)
+CACHE_MAX_MB = int(os.environ.get("OPENPOSE_CACHE_MAX_MB", "1024"))
+CACHE_MAX_ENTRIES = int(os.environ.get("OPENPOSE_CACHE_MAX_ENTRIES", "1000"))
+
+# Latency budgets: inference times measured per model and network settings
+# (see openpose_calibration.py), kept current by every warm worker inference
+CALIBRATION_FILE = os.environ.get(
+    "OPENPOSE_CALIBRATION_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json"),
+)
+MAX_SCALE_NUMBER = 4
+
+# Job stages, in pipeline order. Each is timestamped when it is reached:
+# OpenPose launched, network loaded, first keypoints out, OpenPose exited (or
+# the warm worker answered the last image), renders drawn, outputs written.
+# openpose.bin does not log when its network is loaded, so for it
+# network_init is the "Starting thread(s)" line and first_frame includes
+# the network load.
+JOB_STAGES = ["spawn", "network_init", "first_frame", "exit", "render", "write"]
+# Stages that can happen many times per job keep their last timestamp
+REPEATED_STAGES = {"exit", "render", "write"}
+
+# Progress of an openpose.bin run, from its log lines (see monitor_output).
+# Video runs report frames done instead.
+OPENPOSE_PROGRESS_MARKERS = [
+    ("Starting processing", 35),
+    ("Processing", 50),
+    ("Finished", 75),
+    ("Rendering pose keypoints", 60),
+    ("Parsing complete", 70),
+]
+
+app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+
+# Lock for thread safety (job and worker status)
 status_lock = threading.Lock()
+# Notified (with status_lock held) whenever a job records an event
+job_events = threading.Condition(status_lock)
+
+
+class Job:
+    """One /process, /process_batch, /process_video or /infer request, from
+    queued to finished."""
+
+    def __init__(self, options, priority=0, kind="image", timeout=None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind  # "image", "batch", "video" or "infer"
+        # keyword arguments for process_image() / process_batch() /
+        # process_video() / infer_image()
+        self.options = options
+        self.priority = priority
+        self.state = "queued"  # queued, running, done, failed, stopped, timed_out
+        self.status_message = "Queued"
+        self.progress = 0
+        self.success = None
+        self.outputs = None
+        self.stop_requested = False
+        self.timeout = timeout  # seconds it may run for, None for no limit
+        self.timed_out = False
+        self.worker = None
+        self.results = []  # per-image results of a batch, in completion order
+        self.summary = None
+        self.response = None  # in-memory result of an /infer job
+        self.frames_total = None  # frames a video job processes (if known)
+        self.frames_done = 0
+        self.frames_path = None  # NDJSON keypoints of a video job, as written
+        # Warm worker configuration the job runs with (see ModelResidency)
+        self.config_key = config_key(job_warm_config(options))
+        self.keypoint_stats = None  # computed once when the job finishes
+        self.events = []  # the last MAX_JOB_EVENTS events, for /jobs/<id>/events
+        self.events_dropped = 0  # ID of events[0]
+        self.log = LogBuffer(JOB_LOG_LINES)  # OpenPose output, see monitor_output
+        self.finished = threading.Event()
+        self.stage_times = {}  # stage -> time it was reached, see JOB_STAGES
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def update(self, message=None, progress=None):
+        """Record a status update (called with status_lock held)."""
+        if message is not None:
+            self.status_message = message
+        if progress is not None:
+            self.progress = progress
+        self.record_event("status", message=self.status_message, progress=self.progress)
+
+    def record_event(self, event_type, **data):
+        """Add an event for streaming clients and wake them up (status_lock held)."""
+        event = {
+            "id": self.events_dropped + len(self.events),
+            "type": event_type,
+            "job_id": self.job_id,
+            "state": self.state,
+            "time": time.time(),
+        }
+        event.update(data)
+        self.events.append(event)
+        if len(self.events) > MAX_JOB_EVENTS:
+            del self.events[0]
+            self.events_dropped += 1
+        job_events.notify_all()
+
+    def mark(self, stage):
+        """Timestamp a stage of the job (call with status_lock held)."""
+        if stage not in self.stage_times or stage in REPEATED_STAGES:
+            self.stage_times[stage] = time.time()
+
+    def stage_durations(self):
+        """Seconds spent on each reached stage (call with status_lock held).
 
+        A stage lasts from the previous reached stage (or the job start) on.
+        """
+        durations = {}
+        previous = self.started_at
+        for stage in JOB_STAGES:
+            if stage in self.stage_times:
+                durations[stage] = max(0.0, self.stage_times[stage] - previous)
+                previous = max(previous, self.stage_times[stage])
+        return durations
+
+    def events_since(self, event_id):
+        """Events with an ID of event_id or later (call with status_lock held)."""
+        return self.events[max(0, event_id - self.events_dropped) :]
+
+    def is_finished(self):
+        return self.state in ("done", "failed", "stopped", "timed_out")
+
+    def deadline(self):
+        """Time by which the running job is stopped, or None."""
+        if self.timeout is None or self.started_at is None:
+            return None
+        return self.started_at + self.timeout
+
+    def to_dict(self, results_since=0):
+        """Snapshot of the job for API responses (call with status_lock held).
+
+        Batch jobs include their per-image results from index results_since on.
+        """
+        snapshot = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "state": self.state,
+            "priority": self.priority,
+            "worker_id": self.worker.worker_id if self.worker else None,
+            "image_path": self.options.get("image_path"),
+            "status_message": self.status_message,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timeout": self.timeout,
+        }
+        if self.started_at is not None:
+            snapshot["queue_wait"] = self.started_at - self.created_at
+            snapshot["stage_times"] = {
+                stage: self.stage_times[stage] - self.started_at
+                for stage in JOB_STAGES
+                if stage in self.stage_times
+            }
+            snapshot["stage_durations"] = self.stage_durations()
+            snapshot["deadline"] = self.deadline()
+        if self.finished_at is not None:
+            snapshot["success"] = self.success
+            snapshot["outputs"] = self.outputs
+            if self.started_at is not None:
+                snapshot["duration"] = self.finished_at - self.started_at
+            if self.keypoint_stats is not None:
+                snapshot["keypoint_stats"] = self.keypoint_stats
+        if self.kind == "batch":
+            snapshot["images_total"] = len(self.options["image_paths"])
+            snapshot["images_done"] = len(self.results)
+            snapshot["results_since"] = results_since
+            snapshot["results"] = self.results[results_since:]
+            snapshot["summary"] = self.summary
+        if self.kind == "video":
+            snapshot["video_path"] = self.options.get("video_path")
+            snapshot["frames_total"] = self.frames_total
+            snapshot["frames_done"] = self.frames_done
+            snapshot["summary"] = self.summary
+        return snapshot
+
+
+class JobQueue:
+    """Bounded in-memory job queue.
+
+    Higher priority jobs run first, jobs of equal priority run FIFO. Every
+    submitted job stays looked up by ID until it is one of more than
+    MAX_FINISHED_JOBS finished jobs.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.jobs = OrderedDict()
+        self.average_duration = None
+        self.waiting = set()  # workers blocked in next_job()
+
+    def submit(self, job):
+        """Queue a job. Returns False if the queue is full."""
+        with self.condition:
+            if len(self.heap) >= self.maxsize:
+                return False
+            heapq.heappush(self.heap, (-job.priority, next(self.counter), job))
+            self.jobs[job.job_id] = job
+            self.trim()
+            # Every idle worker, the job may be routed to a particular one
+            self.condition.notify_all()
+            return True
+
+    def next_job(self, worker=None):
+        """Block until a job is queued for worker and return it.
+
+        Jobs are taken in priority order, except that a worker leaves a job
+        to another idle worker that already has the job's configuration
+        loaded (and it does not).
+        """
+        with self.condition:
+            self.waiting.add(worker)
+            try:
+                while True:
+                    entry = self.pick(worker)
+                    if entry is not None:
+                        self.heap.remove(entry)
+                        heapq.heapify(self.heap)
+                        if self.heap:
+                            # Jobs left for this worker may be for the others now
+                            self.condition.notify_all()
+                        return entry[2]
+                    self.condition.wait()
+            finally:
+                self.waiting.discard(worker)
+
+    def pick(self, worker):
+        """The queue entry worker should run next, or None (condition held)."""
+        others = [other for other in self.waiting if other not in (worker, None)]
+        for entry in sorted(self.heap, key=lambda entry: entry[:2]):
+            key = entry[2].config_key
+            if worker is None or worker.models.is_resident(key):
+                return entry
+            if not any(other.models.is_resident(key) for other in others):
+                return entry
+        return None
+
+    def get(self, job_id):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job):
+        """Take a job off the queue. Returns False if it is not queued (any more)."""
+        with self.condition:
+            for entry in self.heap:
+                if entry[2] is job:
+                    self.heap.remove(entry)
+                    heapq.heapify(self.heap)
+                    return True
+        return False
+
+    def depth(self):
+        with self.condition:
+            return len(self.heap)
+
+    def position(self, job):
+        """1-based position of a queued job (1 runs next), or None."""
+        with self.condition:
+            entries = sorted(self.heap, key=lambda entry: entry[:2])
+            for index, entry in enumerate(entries):
+                if entry[2] is job:
+                    return index + 1
+        return None
+
+    def record_duration(self, duration):
+        """Track a moving average of job durations (for Retry-After hints)."""
+        with self.condition:
+            if self.average_duration is None:
+                self.average_duration = duration
+            else:
+                self.average_duration = 0.8 * self.average_duration + 0.2 * duration
+
+    def trim(self):
+        """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished()]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+
+job_queue = JobQueue(MAX_QUEUE_SIZE)
+encoder_pool = EncoderPool(ENCODER_THREADS, ENCODER_QUEUE_SIZE)
+result_cache = ResultCache(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024, CACHE_MAX_ENTRIES)
+calibration = CalibrationTable(CALIBRATION_FILE)
+
+# Prometheus metrics, served at /metrics
+metrics = MetricsRegistry()
+jobs_finished = metrics.counter(
+    "openpose_jobs_total", "Finished jobs by kind and final state", ["kind", "state"]
+)
+jobs_rejected = metrics.counter(
+    "openpose_jobs_rejected_total", "Jobs rejected because the queue was full"
+)
+job_queue_wait = metrics.histogram(
+    "openpose_job_queue_wait_seconds", "Time jobs waited for a worker", ["kind"]
+)
+job_duration = metrics.histogram(
+    "openpose_job_duration_seconds", "Time jobs took once running", ["kind"]
+)
+stage_duration = metrics.histogram(
+    "openpose_job_stage_seconds",
+    "Time jobs spent on each stage (spawn, network_init, first_frame, exit, "
+    "render, write)",
+    ["kind", "stage"],
+)
+network_loads = metrics.histogram(
+    "openpose_network_load_seconds", "Warm worker network (re)loads", ["model"]
+)
+encode_duration = metrics.histogram(
+    "openpose_encode_seconds",
+    "Time taken to encode and write a rendered image (and its thumbnail)",
+    ["format"],
+)
+output_bytes = metrics.counter(
+    "openpose_output_bytes_total", "Bytes of output files written", ["kind"]
+)
+queue_depth_gauge = metrics.gauge("openpose_queue_depth", "Jobs waiting in the queue")
+workers_busy = metrics.gauge("openpose_workers_busy", "Workers running a job")
+worker_busy_seconds = metrics.counter(
+    "openpose_worker_busy_seconds_total", "Time each worker spent on jobs", ["worker"]
+)
+worker_busy_ratio = metrics.gauge(
+    "openpose_worker_busy_ratio",
+    "Fraction of the time since the server started each worker was busy",
+    ["worker"],
+)
+cache_lookups = metrics.counter(
+    "openpose_cache_lookups_total", "Result cache lookups", ["result"]
+)
+cache_bytes = metrics.gauge("openpose_cache_bytes", "Size of the result cache")
+model_evictions = metrics.counter(
+    "openpose_model_evictions_total",
+    "Warm worker configurations unloaded to load another one",
+    ["model"],
+)
+resident_model_bytes = metrics.gauge(
+    "openpose_resident_model_bytes", "Memory of the warm workers (RSS)"
+)
+worker_recycles = metrics.counter(
+    "openpose_worker_recycles_total",
+    "Warm workers restarted after OPENPOSE_RECYCLE_JOBS jobs or RSS limit",
+    ["reason"],
+)
+
+
+def update_status(
+    message,
+    progress=None,
+    is_processing=None,
+    current_image=None,
+    job=None,
+    worker=None,
+    job_fields=None,
+):
+    """Update a worker's processing status (and the given job's status) safely.
+
+    job_fields ({attribute: value}) are set on the job in the same update. A
+    job's update leaves its worker alone once the worker has moved on to
+    another job (see run_job).
+    """
+    if worker is None and job is not None:
+        worker = job.worker
+    prefix = f"[worker {worker.worker_id}] " if worker is not None else ""
 
-def update_status(message, progress=None, is_processing=None, current_image=None):
-    """Update the processing status safely."""
-    global processing_status
     with status_lock:
+        if job is not None:
+            for name, value in (job_fields or {}).items():
+                setattr(job, name, value)
+            job.update(message, progress)
+            if worker is not None and worker.current_job is not job:
+                worker = None
+        status = worker.status if worker is not None else {}
+        if worker is not None:
+            worker.updated_at = time.time()
         if message is not None:
-            processing_status["status_message"] = message
+            status["status_message"] = message
             if DEBUG:
-                print(f"Status update: {message}", flush=True)
+                print(f"{prefix}Status update: {message}", flush=True)
         if progress is not None:
-            processing_status["progress"] = progress
+            status["progress"] = progress
             if DEBUG:
-                print(f"Progress update: {progress}%", flush=True)
+                print(f"{prefix}Progress update: {progress}%", flush=True)
         if is_processing is not None:
-            processing_status["is_processing"] = is_processing
+            status["is_processing"] = is_processing
             if DEBUG:
-                print(f"Processing state: {is_processing}", flush=True)
+                print(f"{prefix}Processing state: {is_processing}", flush=True)
         if current_image is not None:
-            processing_status["current_image"] = current_image
+            status["current_image"] = current_image
 
 
-def monitor_output(pipe, progress_markers):
-    """Monitor output from a pipe and update status accordingly."""
-    for line in iter(pipe.readline, ""):
-        if not line:
-            continue
+def mark_stage(job, stage):
+    """Timestamp a stage (see JOB_STAGES) of job, if there is one."""
+    if job is not None:
+        with status_lock:
+            job.mark(stage)
 
-        # Skip OpenPose warning messages about CUDA vs CPU accuracy
-        if "WARNING" in line and "CUDA version" in line:
-            continue
-        if "--------------------------------" in line:
-            continue
-        if "accuracy boost is almost insignificant" in line:
-            continue
 
-        update_status(line.strip(), None)
+def monitor_output(pipe, stream, log=None, progress_markers=(), job=None, worker=None):
+    """Capture the output of an OpenPose process, line by line.
+
+    Lines go to log, or to the log of the job worker is running (a warm
+    worker outlives its jobs; output between jobs is printed). Only lines
+    with one of the progress_markers, (text, progress) pairs, that changes
+    the progress update the status: the first marker found sets the
+    progress and the line the status message.
+    """
+    prefix = f"[worker {worker.worker_id}] " if worker is not None else ""
+    last_progress = None
+    for line in iter(pipe.readline, ""):
+        target = log
+        if target is None and worker is not None:
+            current_job = worker.current_job
+            target = current_job.log if current_job is not None else None
+        if target is not None:
+            target.append(stream, line)
+        else:
+            print(f"{prefix}{line.rstrip()}", flush=True)
 
-        # More specific progress markers
-        if "Starting processing" in line:
-            update_status(None, 35)
-        elif "Processing" in line:
-            update_status(None, 50)
-        elif "Finished" in line:
-            update_status(None, 75)
-        elif "Rendering pose keypoints" in line:
-            update_status(None, 60)
-        elif "Parsing complete" in line:
-            update_status(None, 70)
+        if "Starting thread" in line:
+            mark_stage(job, "network_init")
+        for marker, progress in progress_markers:
+            if marker in line:
+                if progress != last_progress:
+                    update_status(line.strip(), progress, job=job, worker=worker)
+                    last_progress = progress
+                break
 
 
 def has_valid_keypoints(keypoints, threshold=0.1):
-    """Check if keypoints array contains valid detections above threshold."""
-    if not keypoints:
+    """Check if keypoints contain valid detections above threshold.
+
+    keypoints is a flat JSON list or an array of (x, y, confidence) rows.
+    """
+    if keypoints is None or len(keypoints) == 0:
         return False
     try:
         keypoints_array = np.array(keypoints).reshape(-1, 3)
@@ -86,6 +624,963 @@ def has_valid_keypoints(keypoints, threshold=0.1):
         return False
 
 
+def job_keypoint_stats(job, outputs):
+    """keypoint_stats() of a finished job's result, or None if it has no keypoints."""
+    if job.kind == "infer":
+        return keypoint_stats(job.response["people"]) if job.response else None
+    if not outputs:
+        return None
+    if outputs.get("json"):
+        return keypoint_stats(read_people(outputs["json"][0]))
+    if outputs.get("binary"):
+        # Straight from the packed arrays, no JSON involved
+        index, array = load_keypoints_binary(outputs["binary"][0])
+        return sections_stats(packed_sections(index, image_keypoints(index, array)))
+    return None
+
+
+def read_people(json_path):
+    """The people of an OpenPose keypoint JSON file."""
+    with open(json_path, "r") as f:
+        return json.load(f).get("people", [])
+
+
+class WarmWorkerUnavailable(RuntimeError):
+    """The warm worker cannot import pyopenpose (see openpose_worker.py)."""
+
+
+class WarmWorker:
+    """A supervised openpose_worker.py child that keeps the OpenPose network loaded.
+
+    Jobs are sent over the child's stdin and answered on its stdout, one JSON
+    object per line. The network is only reloaded when the configuration
+    (model, face, hand, ...) differs from the one currently loaded.
+    """
+
+    # Shared by all workers: flips to False once a worker reports that it
+    # cannot import pyopenpose (WarmWorkerUnavailable)
+    available = USE_WARM_WORKER
+
+    def __init__(self, owner):
+        self.owner = owner  # the PoolWorker this child belongs to
+        self.process = None
+        self.config = None
+        self.lock = threading.Lock()
+        self.users = 0  # jobs that checked it out (see ModelResidency)
+        self.last_used = 0.0
+        self.jobs = 0  # jobs run since it was (re)started, see RECYCLE_JOBS
+        self.last_job = None
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.owner.command([sys.executable, WORKER_SCRIPT]),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            bufsize=1,  # Line buffered
+            **self.owner.popen_kwargs(),
+        )
+        self.config = None
+        self.jobs = 0
+        print(
+            f"[worker {self.owner.worker_id}] Started OpenPose worker "
+            f"(pid {self.process.pid})",
+            flush=True,
+        )
+
+        # Worker (and OpenPose) logs arrive on stderr
+        stderr_thread = threading.Thread(
+            target=monitor_output,
+            args=(self.process.stderr, "stderr", None, (), None, self.owner),
+        )
+        stderr_thread.daemon = True
+        stderr_thread.start()
+
+    def request(self, message):
+        """Send one command to the worker and wait for its response."""
+        self.send(message)
+        return self.receive()
+
+    def send(self, message):
+        self.process.stdin.write(json.dumps(message) + "\n")
+        self.process.stdin.flush()
+
+    def receive(self):
+        """Read one response. Raises RuntimeError if it is an error
+        (WarmWorkerUnavailable if pyopenpose cannot be used at all)."""
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"OpenPose worker exited (code {self.process.poll()})")
+        response = json.loads(line)
+        if response.get("unavailable"):
+            raise WarmWorkerUnavailable(response.get("error", "pyopenpose unavailable"))
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Unknown worker error"))
+        return response
+
+    def count_job(self, job):
+        """Count the jobs the process has run, see ModelResidency.recycle()."""
+        if job is not None and self.last_job is not job:
+            self.jobs += 1
+            self.last_job = job
+
+    def ensure_configured(self, config, job=None):
+        """Make sure the worker is running with config. Returns True if it (re)loaded."""
+        if self.is_alive() and self.config == config:
+            return False
+        if not self.is_alive():
+            self.start()
+        update_status(
+            f"Loading OpenPose network ({config['model_pose']})...", 15, job=job
+        )
+        response = self.request({"cmd": "configure", "params": config})
+        self.config = config
+        network_loads.observe(response.get("load_time", 0), model=config["model_pose"])
+        update_status(
+            f"OpenPose network loaded in {response.get('load_time', 0):.1f}s",
+            20,
+            job=job,
+        )
+        return True
+
+    def run(self, config, task, job=None, record_time=True):
+        """Run one task on the worker, (re)configuring it first if needed.
+
+        With record_time the inference time updates the calibration table
+        (warm-up inferences are slower and do not).
+        """
+        with self.lock:
+            try:
+                if not self.is_alive():
+                    self.start()
+                self.owner.process_handle = self.process
+                self.count_job(job)
+                mark_stage(job, "spawn")
+                self.ensure_configured(config, job)
+                mark_stage(job, "network_init")
+                response = self.request(dict(task, cmd="process"))
+                if record_time:
+                    record_inference_time(config, response.get("inference_time"))
+                mark_stage(job, "first_frame")
+                mark_stage(job, "exit")
+                return response
+            except WarmWorkerUnavailable:
+                # pyopenpose is not usable here, stop trying
+                WarmWorker.available = False
+                raise
+
+    def run_video(self, config, task, job=None, on_frame=None):
+        """Run a video task (see openpose_worker.process_video) in one session.
+
+        on_frame is called with every per-frame response as it arrives.
+        Returns the final response.
+        """
+        with self.lock:
+            try:
+                if not self.is_alive():
+                    self.start()
+                self.owner.process_handle = self.process
+                self.count_job(job)
+                mark_stage(job, "spawn")
+                self.ensure_configured(config, job)
+                mark_stage(job, "network_init")
+                self.send(dict(task, cmd="process_video"))
+                while True:
+                    response = self.receive()
+                    if response.get("event") != "frame":
+                        mark_stage(job, "exit")
+                        return response
+                    record_inference_time(config, response.get("inference_time"))
+                    mark_stage(job, "first_frame")
+                    if on_frame is not None:
+                        on_frame(response)
+            except WarmWorkerUnavailable:
+                WarmWorker.available = False
+                raise
+
+    def stop(self):
+        """Terminate the worker; it is restarted on the next job."""
+        if self.is_alive():
+            self.process.terminate()
+        self.process = None
+        self.config = None
+
+    def rss(self):
+        """Resident memory of the worker process in bytes (0 if unknown)."""
+        process = self.process
+        if process is None or process.poll() is not None:
+            return 0
+        return process_rss(process.pid)
+
+
+class ModelResidency:
+    """The warm workers of one PoolWorker, one per loaded configuration.
+
+    Jobs run on the warm worker that already has their configuration
+    (model, face, hand, network settings) loaded, started if there is none.
+    With MODEL_MEMORY_MB the warm workers stay resident until the pool
+    evicts the least recently used ones to stay within the memory budget
+    (see WorkerPool.enforce_memory_budget). Without it, the single warm
+    worker is reconfigured whenever a job needs another configuration.
+    """
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.workers = OrderedDict()  # config key -> WarmWorker, LRU first
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.recycles = 0
+
+    def checkout(self, config):
+        """The warm worker for config, marked as in use and most recently used."""
+        key = config_key(config)
+        with self.lock:
+            warm = self.workers.get(key)
+            if warm is None:
+                if MODEL_MEMORY_MB <= 0 and self.workers:
+                    # One configuration per worker: reload the existing one
+                    _, warm = self.workers.popitem()
+                    if warm.config is not None:
+                        self.evictions += 1
+                        model_evictions.inc(model=warm.config["model_pose"])
+                else:
+                    warm = WarmWorker(self.owner)
+                self.workers[key] = warm
+            self.workers.move_to_end(key)
+            warm.users += 1
+            warm.last_used = time.time()
+        return warm
+
+    def release(self, warm):
+        with self.lock:
+            warm.users -= 1
+            warm.last_used = time.time()
+        worker_pool.enforce_memory_budget()
+
+    def run(self, config, task, job=None, record_time=True):
+        """WarmWorker.run() on the warm worker for config."""
+        warm = self.checkout(config)
+        try:
+            return warm.run(config, task, job, record_time)
+        finally:
+            self.release(warm)
+
+    def run_video(self, config, task, job=None, on_frame=None):
+        """WarmWorker.run_video() on the warm worker for config."""
+        warm = self.checkout(config)
+        try:
+            return warm.run_video(config, task, job, on_frame)
+        finally:
+            self.release(warm)
+
+    def is_resident(self, key):
+        """True if a warm worker has the configuration key loaded."""
+        with self.lock:
+            warm = self.workers.get(key)
+            return warm is not None and warm.config is not None and warm.is_alive()
+
+    def evict(self, key, warm):
+        """Stop the warm worker of key unless it is in use or the most
+        recently used one. Returns True if it was evicted."""
+        with self.lock:
+            if self.workers.get(key) is not warm or warm.users:
+                return False
+            if key == next(reversed(self.workers)):
+                return False
+            del self.workers[key]
+            self.evictions += 1
+        if warm.config is not None:
+            model_evictions.inc(model=warm.config["model_pose"])
+            print(
+                f"[worker {self.owner.worker_id}] Evicted {warm.config['model_pose']} "
+                f"({warm.rss() / 1024 / 1024:.0f} MB)",
+                flush=True,
+            )
+        warm.stop()
+        return True
+
+    def recycle(self):
+        """Restart the idle warm workers that have run RECYCLE_JOBS jobs or
+        grown past RECYCLE_RSS_MB, reloading the configuration they had."""
+        if RECYCLE_JOBS <= 0 and RECYCLE_RSS_MB <= 0:
+            return
+        with self.lock:
+            idle = [warm for warm in self.workers.values() if not warm.users]
+            for warm in idle:
+                warm.users += 1  # not evicted meanwhile
+        for warm in idle:
+            try:
+                reason = None
+                rss = warm.rss()
+                if RECYCLE_JOBS > 0 and warm.jobs >= RECYCLE_JOBS:
+                    reason = "jobs"
+                elif RECYCLE_RSS_MB > 0 and rss > RECYCLE_RSS_MB * 1024 * 1024:
+                    reason = "memory"
+                if reason is None or not warm.is_alive():
+                    continue
+                config = warm.config
+                print(
+                    f"[worker {self.owner.worker_id}] Recycling OpenPose worker "
+                    f"(pid {warm.process.pid}, {warm.jobs} jobs, "
+                    f"{rss / 1024 / 1024:.0f} MB)",
+                    flush=True,
+                )
+                with warm.lock:
+                    warm.stop()
+                    self.recycles += 1
+                    worker_recycles.inc(reason=reason)
+                    if config is not None:
+                        try:
+                            warm.ensure_configured(config)
+                        except (OSError, ValueError, RuntimeError) as e:
+                            # Started again by the next job that needs it
+                            print(f"Reloading recycled worker failed: {e}", flush=True)
+                            warm.stop()
+            finally:
+                with self.lock:
+                    warm.users -= 1
+
+    def stop(self):
+        """Terminate every warm worker."""
+        with self.lock:
+            workers = list(self.workers.values())
+        for warm in workers:
+            warm.stop()
+
+    def snapshot(self):
+        """The resident configurations, least recently used first."""
+        with self.lock:
+            items = list(self.workers.items())
+        resident = []
+        for key, warm in items:
+            config = warm.config
+            if config is None or not warm.is_alive():
+                continue
+            settings = {
+                name: value
+                for name, value in config.items()
+                if name not in ("model_folder", "display", "render_pose")
+            }
+            resident.append(
+                {
+                    "model": config["model_pose"],
+                    "face": config["face"],
+                    "hands": config["hand"],
+                    "config": settings,
+                    "pid": warm.process.pid if warm.process else None,
+                    "rss_mb": round(warm.rss() / 1024 / 1024, 1),
+                    "in_use": warm.users > 0,
+                    "last_used": warm.last_used,
+                    "jobs": warm.jobs,
+                }
+            )
+        return resident
+
+
+def process_rss(pid):
+    """Resident memory of a process in bytes, from /proc (0 if unknown)."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def available_cpus():
+    """CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pool_dimensions():
+    """Return (number of workers, threads per worker) for this host."""
+    cpus = len(available_cpus())
+    workers, threads = POOL_WORKERS, WORKER_THREADS
+    if workers <= 0:
+        if threads <= 0:
+            threads = min(cpus, DEFAULT_WORKER_THREADS)
+        workers = max(1, cpus // threads)
+    elif threads <= 0:
+        threads = max(1, cpus // workers)
+    return workers, threads
+
+
+class PoolWorker:
+    """One slot of the execution pool.
+
+    Runs one job at a time with its own OMP/BLAS thread budget, optional CPU
+    affinity and its own warm OpenPose workers, and keeps the status, process
+    handle and current job that used to be global.
+    """
+
+    def __init__(self, worker_id, threads, cpus=None):
+        self.worker_id = worker_id
+        self.threads = threads
+        self.cpus = cpus
+        self.status = {
+            "is_processing": False,
+            "current_image": None,
+            "status_message": "Idle",
+            "progress": 0,
+        }
+        self.updated_at = 0.0
+        self.process_handle = None
+        self.current_job = None
+        self.last_job = None
+        self.jobs_completed = 0
+        self.busy_seconds = 0.0  # time spent on finished jobs
+        self.models = ModelResidency(self)  # its warm workers
+        self.thread = None
+        # Preload models (see warm_up_model), warmed up before the first job
+        self.preload = []
+
+    def popen_kwargs(self):
+        """Environment (thread budget) for child processes."""
+        env = dict(os.environ)
+        for name in THREAD_ENV_VARS:
+            env[name] = str(self.threads)
+        return {"env": env}
+
+    def command(self, cmd):
+        """cmd pinned to this worker's CPUs, if it has any.
+
+        taskset sets the affinity before the child starts, unlike a
+        preexec_fn, which is unsafe to run in this threaded server.
+        """
+        if not self.cpus:
+            return cmd
+        return ["taskset", "-c", ",".join(str(cpu) for cpu in self.cpus)] + cmd
+
+    def run(self):
+        """Warm up the preload models, then take jobs off the queue whenever
+        this worker is idle."""
+        for entry in self.preload:
+            warm_up_model(self, entry)
+        while True:
+            # Backpressure: don't take a job while the encoders are behind
+            encoder_pool.wait_for_room()
+            job = job_queue.next_job(self)
+            run_job(job, self)
+            self.models.recycle()
+
+    def snapshot(self):
+        """Status of this worker (call with status_lock held)."""
+        snapshot = dict(self.status)
+        snapshot["worker_id"] = self.worker_id
+        snapshot["job_id"] = self.current_job.job_id if self.current_job else None
+        snapshot["last_job_id"] = self.last_job.job_id if self.last_job else None
+        snapshot["jobs_completed"] = self.jobs_completed
+        snapshot["threads"] = self.threads
+        snapshot["cpus"] = self.cpus
+        snapshot["updated_at"] = self.updated_at
+        return snapshot
+
+
+class WorkerPool:
+    """A fixed set of PoolWorkers pulling jobs from the shared queue."""
+
+    def __init__(self, size, threads, pin_cpus=False, preload=()):
+        cpus = available_cpus()
+        if pin_cpus and shutil.which("taskset") is None:
+            print("taskset not found, workers are not pinned to CPUs", flush=True)
+            pin_cpus = False
+        self.workers = []
+        for worker_id in range(size):
+            worker_cpus = None
+            if pin_cpus:
+                first = worker_id * threads
+                worker_cpus = sorted(
+                    {cpus[(first + i) % len(cpus)] for i in range(threads)}
+                )
+            self.workers.append(PoolWorker(worker_id, threads, worker_cpus))
+        # Every worker preloads a model (round robin, so each model is loaded
+        # by at least one worker). A worker with several keeps the last one.
+        for index in range(len(preload) and max(len(preload), size)):
+            model, face, hands = preload[index % len(preload)]
+            self.workers[index % size].preload.append(
+                {
+                    "model": model,
+                    "face": face,
+                    "hands": hands,
+                    "state": "pending",
+                    "seconds": None,
+                    "inference_ms": None,
+                    "error": None,
+                }
+            )
+        self.lock = threading.Lock()
+        self.memory_lock = threading.Lock()
+        self.watchdog = None
+        self.created_at = time.time()
+
+    def start(self):
+        """Start the worker threads (and the deadline watchdog) that are not
+        running yet."""
+        with self.lock:
+            for worker in self.workers:
+                if worker.thread is None or not worker.thread.is_alive():
+                    worker.thread = threading.Thread(target=worker.run, daemon=True)
+                    worker.thread.start()
+            if self.watchdog is None or not self.watchdog.is_alive():
+                self.watchdog = threading.Thread(
+                    target=self.enforce_deadlines, daemon=True
+                )
+                self.watchdog.start()
+
+    def enforce_deadlines(self):
+        """Stop the running jobs that are past their deadline, forever."""
+        while True:
+            time.sleep(DEADLINE_CHECK_INTERVAL)
+            now = time.time()
+            overdue = []
+            with status_lock:
+                for worker in self.workers:
+                    job = worker.current_job
+                    deadline = job.deadline() if job is not None else None
+                    if deadline is None or now < deadline or job.stop_requested:
+                        continue
+                    job.stop_requested = True
+                    job.timed_out = True
+                    overdue.append((worker, job))
+            for worker, job in overdue:
+                print(
+                    f"[worker {worker.worker_id}] Job {job.job_id} exceeded its "
+                    f"{job.timeout:g}s timeout, stopping it",
+                    flush=True,
+                )
+            if overdue:
+                stop_workers([worker for worker, _ in overdue], "Job timed out")
+
+    def status(self):
+        """Combined status of all workers.
+
+        The top-level fields follow the most recently updated busy worker (or
+        the most recently updated one when all are idle).
+        """
+        with status_lock:
+            workers = [worker.snapshot() for worker in self.workers]
+        busy = [worker for worker in workers if worker["is_processing"]]
+        primary = max(busy or workers, key=lambda worker: worker["updated_at"])
+        return {
+            "is_processing": bool(busy),
+            "current_image": primary["current_image"],
+            "status_message": primary["status_message"],
+            "progress": primary["progress"],
+            "current_job_id": primary["job_id"],
+            "last_job_id": primary["last_job_id"],
+            "workers": workers,
+        }
+
+    def enforce_memory_budget(self):
+        """Evict least recently used warm workers beyond MODEL_MEMORY_MB.
+
+        Warm workers in use and the most recently used one of each worker
+        are never evicted.
+        """
+        if MODEL_MEMORY_MB <= 0:
+            return
+        budget = MODEL_MEMORY_MB * 1024 * 1024
+        with self.memory_lock:
+            resident = []
+            for worker in self.workers:
+                with worker.models.lock:
+                    items = list(worker.models.workers.items())
+                for key, warm in items:
+                    resident.append((warm.last_used, worker, key, warm, warm.rss()))
+            total = sum(entry[4] for entry in resident)
+            for _, worker, key, warm, rss in sorted(resident, key=lambda e: e[0]):
+                if total <= budget:
+                    break
+                if worker.models.evict(key, warm):
+                    total -= rss
+
+    def residency(self):
+        """Resident configurations of every worker, their memory and evictions."""
+        workers = []
+        total = 0.0
+        evictions = 0
+        recycles = 0
+        for worker in self.workers:
+            resident = worker.models.snapshot()
+            total += sum(entry["rss_mb"] for entry in resident)
+            evictions += worker.models.evictions
+            recycles += worker.models.recycles
+            workers.append({"worker_id": worker.worker_id, "resident": resident})
+        return {
+            "memory_budget_mb": MODEL_MEMORY_MB or None,
+            "resident_mb": round(total, 1),
+            "evictions": evictions,
+            "recycles": recycles,
+            "workers": workers,
+        }
+
+    def readiness(self):
+        """Warm-up state of every preload model.
+
+        A model is warm once a worker has loaded it and run the warm-up
+        inference, and stays warm: the memory budget or a job with other
+        settings may unload it since, which resident_workers (the workers
+        that have it loaded now) and each worker's "resident" only report.
+        """
+        models = OrderedDict()
+        with status_lock:
+            for worker in self.workers:
+                for entry in worker.preload:
+                    key = (entry["model"], entry["face"], entry["hands"])
+                    model = models.setdefault(
+                        key,
+                        {
+                            "model": entry["model"],
+                            "face": entry["face"],
+                            "hands": entry["hands"],
+                            "warm": False,
+                            "workers": {},
+                            "resident_workers": [],
+                        },
+                    )
+                    config = warm_worker_config(*key, False)
+                    resident = worker.models.is_resident(config_key(config))
+                    if resident:
+                        model["resident_workers"].append(worker.worker_id)
+                    model["warm"] = model["warm"] or entry["state"] == "warm"
+                    model["workers"][worker.worker_id] = {
+                        "state": entry["state"],
+                        "resident": resident,
+                        "seconds": entry["seconds"],
+                        "inference_ms": entry["inference_ms"],
+                        "error": entry["error"],
+                    }
+        models = list(models.values())
+        return {"ready": all(model["warm"] for model in models), "models": models}
+
+
+def parse_preload_models(value):
+    """Parse OPENPOSE_PRELOAD ("BODY_25,COCO+face+hand") into (model, face, hands).
+
+    Raises ValueError for unknown models or options.
+    """
+    specs = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        model, *flags = [part.strip().lower() for part in item.split("+")]
+        model = model.upper()
+        if model not in ["BODY_25", "COCO", "MPI"]:
+            raise ValueError(
+                f"Invalid OPENPOSE_PRELOAD model: {model}. Must be BODY_25, COCO or MPI"
+            )
+        unknown = set(flags) - {"face", "hand", "hands"}
+        if unknown:
+            raise ValueError(
+                f"Invalid OPENPOSE_PRELOAD option: {', '.join(sorted(unknown))}. "
+                "Must be face or hand"
+            )
+        spec = (model, "face" in flags, bool({"hand", "hands"} & set(flags)))
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+worker_pool = WorkerPool(
+    *pool_dimensions(),
+    pin_cpus=PIN_WORKER_CPUS,
+    preload=parse_preload_models(PRELOAD_MODELS),
+)
+
+
+def network_settings(net_resolution=None, scale_number=None, scale_gap=None):
+    """The network settings a job sets; OpenPose defaults apply to the others."""
+    settings = {
+        "net_resolution": net_resolution,
+        "scale_number": scale_number,
+        "scale_gap": scale_gap,
+    }
+    return {key: value for key, value in settings.items() if value is not None}
+
+
+def record_inference_time(config, seconds):
+    """Update the calibration table with a warm worker inference time."""
+    if seconds is None:
+        return
+    calibration.record(
+        config["model_pose"],
+        config["face"],
+        config["hand"],
+        config.get("net_resolution", DEFAULT_NET_RESOLUTION),
+        config.get("scale_number", DEFAULT_SCALE_NUMBER),
+        seconds * 1000,
+    )
+
+
+def job_warm_config(options):
+    """The warm worker configuration of a job's options (see warm_worker_config)."""
+    network = network_settings(
+        options.get("net_resolution"),
+        options.get("scale_number"),
+        options.get("scale_gap"),
+    )
+    if options.get("number_people_max", -1) > 0:
+        network["number_people_max"] = options["number_people_max"]
+    return warm_worker_config(
+        options.get("model", "BODY_25"),
+        options.get("detect_face", False),
+        options.get("detect_hands", False),
+        options.get("detect_feet", False),
+        network,
+    )
+
+
+def config_key(config):
+    """Hashable identity of a warm worker configuration."""
+    return json.dumps(config, sort_keys=True)
+
+
+def warm_worker_config(model, detect_face, detect_hands, detect_feet, network=None):
+    """Build the pyopenpose params for a job (the worker reloads when these change).
+
+    Rendering happens in Python, so only settings that change inference matter.
+    network holds the job's network_settings().
+    """
+    config = {
+        "model_folder": MODEL_FOLDER,
+        "model_pose": model,
+        "face": bool(detect_face),
+        "hand": bool(detect_hands),
+        "display": 0,
+        "render_pose": 0,
+    }
+    if model in MODEL_PROTOTXT:
+        config["prototxt_path"] = MODEL_PROTOTXT[model]
+    if detect_feet and model == "BODY_25":
+        config["maximize_positives"] = True
+    config.update(network or {})
+    return config
+
+
+def warm_up_model(worker, entry):
+    """Load a preload model on worker and run a warm-up inference with it.
+
+    Uses the warm worker (which keeps the model loaded), or a single
+    openpose.bin run when pyopenpose is not available. entry is one of the
+    worker's preload entries and records the outcome for /ready.
+    """
+    label = entry["model"] + "".join(
+        f"+{name}" for name in ["face", "hands"] if entry[name]
+    )
+    with status_lock:
+        entry["state"] = "loading"
+    update_status(f"Preloading {label}...", worker=worker)
+    started = time.time()
+    try:
+        if not os.path.isfile(WARMUP_IMAGE):
+            raise OSError(f"Warm-up image {WARMUP_IMAGE} not found")
+        response = None
+        if WarmWorker.available:
+            config = warm_worker_config(
+                entry["model"], entry["face"], entry["hands"], False
+            )
+            try:
+                response = worker.models.run(
+                    config, {"image_path": WARMUP_IMAGE}, record_time=False
+                )
+            except (OSError, ValueError, RuntimeError) as e:
+                if WarmWorker.available:
+                    raise
+                print(
+                    f"[worker {worker.worker_id}] Warm worker unavailable "
+                    f"({str(e)}), warming up openpose.bin",
+                    flush=True,
+                )
+        if response is None:
+            warm_up_openpose_bin(worker, entry)
+            inference_time = None
+        else:
+            inference_time = response.get("inference_time")
+    except (OSError, ValueError, RuntimeError, subprocess.SubprocessError) as e:
+        print(f"[worker {worker.worker_id}] Preloading {label} failed: {e}", flush=True)
+        with status_lock:
+            entry["state"] = "failed"
+            entry["error"] = str(e)
+        update_status(f"Preloading {label} failed: {str(e)}", worker=worker)
+        return False
+    finally:
+        worker.process_handle = None
+
+    with status_lock:
+        entry["state"] = "warm"
+        entry["error"] = None
+        entry["seconds"] = round(time.time() - started, 3)
+        if inference_time is not None:
+            entry["inference_ms"] = round(inference_time * 1000, 1)
+    update_status(f"Idle ({label} warm)", worker=worker)
+    return True
+
+
+def warm_up_openpose_bin(worker, entry):
+    """Run openpose.bin once on the warm-up image (loads the model files into
+    the page cache and checks that the model works). Raises RuntimeError."""
+    workspace = create_job_workspace(WARMUP_IMAGE, f"preload_{worker.worker_id}")
+    try:
+        cmd = build_openpose_command(
+            workspace["input"],
+            entry["model"],
+            workspace["json"],
+            entry["face"],
+            entry["hands"],
+            False,
+            0,
+        )
+        process = subprocess.Popen(
+            worker.command(cmd),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            **worker.popen_kwargs(),
+        )
+        worker.process_handle = process
+        _, stderr_output = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"openpose.bin failed (code {process.returncode}): "
+                f"{stderr_output.strip()[-500:]}"
+            )
+    finally:
+        remove_job_workspace(workspace)
+
+
+def process_with_warm_worker(config, task, job):
+    """Run a task on the job's warm worker.
+
+    Returns True/False for success, or None if the caller should fall back to
+    openpose.bin.
+    """
+    try:
+        update_status("Running OpenPose on warm worker...", 25, job=job)
+        result = job.worker.models.run(config, task, job)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Warm worker failed: {str(e)}", flush=True)
+        if job is not None and job.stop_requested:
+            # Killed by a cancel or the deadline, run_job reports it
+            return False
+        if not WarmWorker.available:
+            update_status(
+                f"Warm worker unavailable ({str(e)}), using openpose.bin", 20, job=job
+            )
+            return None
+        update_status(f"OpenPose worker failed: {str(e)}", 100, False, job=job)
+        return False
+
+    update_status(
+        f"Inference finished in {result.get('inference_time', 0):.2f}s", 75, job=job
+    )
+    return True
+
+
+def stage_image(image_path, staged_image):
+    """Put image_path at staged_image without copying it if possible."""
+    try:
+        os.link(image_path, staged_image)
+    except OSError:
+        # Different filesystem (or no hardlink support)
+        try:
+            os.symlink(os.path.abspath(image_path), staged_image)
+        except OSError:
+            shutil.copy2(image_path, staged_image)
+
+
+def create_job_workspace(image_paths, job_id):
+    """Create a per-job workspace holding only the requested image(s).
+
+    OpenPose's --image_dir processes every image in a folder, so the images are
+    staged (hardlink, symlink or copy as a last resort) into their own input
+    directory. Outputs are written to the workspace first and published once
+    they are finished.
+
+    workspace["images"] maps each staged image to its original path, and
+    workspace["image"] is the first staged image.
+    """
+    if isinstance(image_paths, str):
+        image_paths = [image_paths]
+
+    os.makedirs(JOB_WORKSPACE_ROOT, exist_ok=True)
+    root = tempfile.mkdtemp(prefix=f"job_{job_id}_", dir=JOB_WORKSPACE_ROOT)
+    workspace = {"root": root, "images": OrderedDict()}
+    for name in ["input", "black_bg", "on_image", "json", "thumbnails"]:
+        workspace[name] = os.path.join(root, name)
+        os.makedirs(workspace[name])
+
+    try:
+        for index, image_path in enumerate(image_paths):
+            staged_name = os.path.basename(image_path)
+            staged_image = os.path.join(workspace["input"], staged_name)
+            if staged_image in workspace["images"]:
+                # Same file name from another folder
+                staged_image = os.path.join(
+                    workspace["input"], f"{index}_{staged_name}"
+                )
+            stage_image(image_path, staged_image)
+            workspace["images"][staged_image] = image_path
+    except OSError:
+        remove_job_workspace(workspace)
+        raise
+
+    workspace["image"] = next(iter(workspace["images"]), None)
+    return workspace
+
+
+def stage_subset(workspace, staged_images, name):
+    """Stage some of a workspace's images into their own input directory.
+
+    For openpose.bin runs over part of a batch. Returns the directory.
+    """
+    directory = os.path.join(workspace["root"], name)
+    os.makedirs(directory, exist_ok=True)
+    for staged_image in staged_images:
+        stage_image(
+            staged_image, os.path.join(directory, os.path.basename(staged_image))
+        )
+    return directory
+
+
+def workspace_dirs(workspace):
+    """Directories of a workspace by output kind, like a job's output_dirs."""
+    dirs = {
+        "rendered_on_black": workspace["black_bg"],
+        "rendered_on_image": workspace["on_image"],
+        "json": workspace["json"],
+    }
+    for kind in THUMBNAIL_KINDS.values():
+        dirs[kind] = workspace["thumbnails"]
+    return dirs
+
+
+def remove_job_workspace(workspace):
+    """Delete a job workspace and everything left in it."""
+    shutil.rmtree(workspace["root"], ignore_errors=True)
+
+
+def publish_output(staged_path, output_path):
+    """Move a finished output from the job workspace to its final location.
+
+    The file appears atomically, so readers never see a partially written output.
+    """
+    try:
+        os.replace(staged_path, output_path)
+    except OSError:
+        # Workspace and output directory are on different filesystems
+        partial_path = f"{output_path}.partial"
+        shutil.copy2(staged_path, partial_path)
+        os.replace(partial_path, output_path)
+    return output_path
+
 
 def process_image(
     image_path,
@@ -102,31 +1597,37 @@ def process_image(
     hand_render_threshold=0.2,
     feet_render_threshold=0.03,
     keypoint_scale=0,
+    net_resolution=None,
+    scale_number=None,
+    scale_gap=None,
+    use_cache=True,
+    keypoint_format="json",
+    encoding=None,
+    job_id=None,
+    job=None,
 ):
-    """Process an image with OpenPose with multiple visualization options."""
+    """Process an image with OpenPose with multiple visualization options.
 
-    global process_handle
+    OpenPose runs once and writes the keypoint JSON; the black background and
+    on-image renders are then both drawn from those keypoints and written
+    with encoding (see openpose_encode.parse_encoding). The work happens
+    in a per-job workspace, so only this image is processed and outputs of
+    other jobs are never touched.
 
-    update_status(f"Starting to process image: {image_path}", 0, True, image_path)
+    Returns (success, outputs), or for a job with renders to draw a Future of
+    it: the renders are then drawn, encoded and published on the encoder pool
+    once inference is done, so the job's worker can move on.
+    """
 
-    # Get the directory of the image
-    image_dir = os.path.dirname(image_path)
-    image_filename = os.path.basename(image_path)
-    name_without_ext = os.path.splitext(image_filename)[0]
-
-    # Create output subdirectories
-    black_bg_dir = os.path.join(output_dir, "black_bg")
-    src_img_dir = os.path.join(output_dir, "on_image")
+    if job_id is None:
+        job_id = uuid.uuid4().hex[:12]
 
-    json_dir = os.path.join(output_dir, "json")
+    update_status(
+        f"Starting to process image: {image_path}", 0, True, image_path, job=job
+    )
 
-    # Create directories if they don't exist
-    for directory in [
-        black_bg_dir,
-        src_img_dir,
-        json_dir,
-    ]:
-        os.makedirs(directory, exist_ok=True)
+    # Create output subdirectories
+    output_dirs = job_output_dirs(output_dir, encoding)
 
     outputs = {
         "rendered_on_black": [],
@@ -134,344 +1635,2713 @@ def process_image(
         "json": [],
     }
 
-    # Process options
-    process_options = []
-
-    # 1. Render on black background if requested
-    if render_on_black:
-        process_options.append(
-            {"output_dir": black_bg_dir, "disable_blending": True, "name": "black_bg"}
+    if detect_feet and model != "BODY_25":
+        update_status(
+            "Error: Feet detection only available with BODY_25 model",
+            100,
+            False,
+            job=job,
         )
+        return False, outputs
 
-    # 2. Render on original image if requested
-    if render_on_image:
-        process_options.append(
-            {"output_dir": src_img_dir, "disable_blending": False, "name": "on_image"}
+    # Keypoints are published as JSON unless only the packed binary is wanted
+    publish_json = write_json and keypoint_format != "binary"
+    name_without_ext = os.path.splitext(os.path.basename(image_path))[0]
+
+    try:
+        workspace = create_job_workspace(image_path, job_id)
+    except OSError as e:
+        update_status(f"Could not stage image: {str(e)}", 100, False, job=job)
+        return False, outputs
+    staged_json = os.path.join(workspace["json"], f"{name_without_ext}_keypoints.json")
+
+    try:
+        # Same image processed with the same options before: copy the stored
+        # result (keypoint_scale 1/2 renders come from OpenPose itself and are
+        # not cached)
+        key = None
+        if use_cache and result_cache.enabled and keypoint_scale in (0, 3, 4):
+            key = cache_key(
+                hash_file(image_path),
+                dict(
+                    model=model,
+                    detect_face=detect_face,
+                    detect_hands=detect_hands,
+                    detect_feet=detect_feet,
+                    render_on_black=render_on_black,
+                    render_on_image=render_on_image,
+                    render_threshold=render_threshold,
+                    face_render_threshold=face_render_threshold,
+                    hand_render_threshold=hand_render_threshold,
+                    feet_render_threshold=feet_render_threshold,
+                    keypoint_scale=keypoint_scale,
+                    net_resolution=net_resolution,
+                    scale_number=scale_number,
+                    scale_gap=scale_gap,
+                    **(encoding or {}),
+                ),
+            )
+            targets = output_targets(
+                output_dirs,
+                name_without_ext,
+                render_on_black,
+                render_on_image,
+                encoding,
+            )
+            if not publish_json:
+                targets["json"] = staged_json
+            if result_cache.lookup(key, targets):
+                for kind, path in targets.items():
+                    if kind != "json" or publish_json:
+                        outputs.setdefault(kind, []).append(path)
+                if keypoint_format != "json":
+                    publish_keypoints_binary(
+                        outputs,
+                        output_dir,
+                        name_without_ext,
+                        [(image_path, read_people(targets["json"]))],
+                        model,
+                        detect_face,
+                        detect_hands,
+                        keypoint_scale,
+                    )
+                mark_stage(job, "write")
+                update_status(
+                    "Processing completed successfully (cached)", 100, False, job=job
+                )
+                remove_job_workspace(workspace)
+                return True, outputs
+
+        # Feet keypoints are rendered with their own (usually lower) threshold
+        if detect_feet:
+            update_status(
+                f"Feet detection enabled with threshold: {feet_render_threshold}",
+                None,
+                job=job,
+            )
+            render_threshold = min(render_threshold, feet_render_threshold)
+
+        success, staged_outputs, render = run_job_pipeline(
+            workspace,
+            model,
+            detect_face,
+            detect_hands,
+            detect_feet,
+            render_on_black,
+            render_on_image,
+            render_threshold,
+            face_render_threshold,
+            hand_render_threshold,
+            keypoint_scale,
+            job,
+            network_settings(net_resolution, scale_number, scale_gap),
+            encoding,
+        )
+    except Exception as e:
+        print(f"EXCEPTION IN JOB {job_id}: {str(e)}", flush=True)
+        update_status(f"Exception during processing: {str(e)}", 100, False, job=job)
+        remove_job_workspace(workspace)
+        return False, outputs
+
+    def finish(success, staged_outputs, render=None):
+        """Draw the renders (with render), cache and publish the staged
+        outputs, then remove the workspace."""
+        try:
+            if render is not None:
+                success, staged_outputs = render()
+
+            if success and key is not None:
+                result_cache.store(
+                    key,
+                    files={
+                        kind: paths[0]
+                        for kind, paths in staged_outputs.items()
+                        if paths
+                    },
+                )
+
+            packed = None
+            if success and keypoint_format != "json":
+                packed = [(image_path, read_people(staged_json))]
+
+            # Publish whatever the job produced
+            if not publish_json:
+                staged_outputs["json"] = []
+            for kind, paths in staged_outputs.items():
+                for path in paths:
+                    output_path = os.path.join(
+                        output_dirs[kind], os.path.basename(path)
+                    )
+                    outputs.setdefault(kind, []).append(
+                        publish_output(path, output_path)
+                    )
+
+            if packed is not None:
+                publish_keypoints_binary(
+                    outputs,
+                    output_dir,
+                    name_without_ext,
+                    packed,
+                    model,
+                    detect_face,
+                    detect_hands,
+                    keypoint_scale,
+                )
+            mark_stage(job, "write")
+        except Exception as e:
+            print(f"EXCEPTION IN JOB {job_id}: {str(e)}", flush=True)
+            update_status(f"Exception during processing: {str(e)}", 100, False, job=job)
+            return False, outputs
+        finally:
+            remove_job_workspace(workspace)
+
+        if success:
+            update_status("Processing completed successfully", 100, False, job=job)
+        return success, outputs
+
+    if success and render is not None and job is not None:
+        # The worker moves on to its next job while the renders are drawn,
+        # encoded and published on the encoder pool (see run_job)
+        return encoder_pool.submit(finish, success, staged_outputs, render)
+    return finish(success, staged_outputs, render)
+
+
+def output_targets(
+    output_dirs, name_without_ext, render_on_black, render_on_image, encoding=None
+):
+    """Output paths ({kind: path}) of one image with Python rendering.
+
+    Renders get the extension of encoding, and thumbnails when it asks for them.
+    """
+    targets = {
+        "json": os.path.join(output_dirs["json"], f"{name_without_ext}_keypoints.json")
+    }
+    extension = encoding_extension(encoding)
+    for kind, requested, subdir in [
+        ("rendered_on_black", render_on_black, "black_bg"),
+        ("rendered_on_image", render_on_image, "on_image"),
+    ]:
+        if requested:
+            targets[kind] = os.path.join(
+                output_dirs[kind], f"{name_without_ext}_rendered{extension}"
+            )
+            if encoding and encoding["thumbnail_size"]:
+                targets[THUMBNAIL_KINDS[kind]] = os.path.join(
+                    output_dirs[THUMBNAIL_KINDS[kind]],
+                    f"{name_without_ext}_{subdir}_thumb{extension}",
+                )
+    return targets
+
+
+def job_output_dirs(output_dir, encoding=None):
+    """Output directories of a job by kind, created if needed."""
+    output_dirs = {
+        "rendered_on_black": os.path.join(output_dir, "black_bg"),
+        "rendered_on_image": os.path.join(output_dir, "on_image"),
+        "json": os.path.join(output_dir, "json"),
+    }
+    if encoding and encoding["thumbnail_size"]:
+        for kind in THUMBNAIL_KINDS.values():
+            output_dirs[kind] = os.path.join(output_dir, "thumbnails")
+    for directory in output_dirs.values():
+        os.makedirs(directory, exist_ok=True)
+    return output_dirs
+
+
+def write_render(image, path, encoding=None, thumbnail_path=None):
+    """write_image(), timed for /metrics."""
+    started = time.time()
+    write_image(image, path, encoding, thumbnail_path)
+    encode_duration.observe(
+        time.time() - started, format=(encoding or {}).get("output_format", "png")
+    )
+
+
+def write_renders(
+    image_path,
+    people,
+    targets,
+    encoding=None,
+    render_threshold=0.05,
+    face_render_threshold=0.4,
+    hand_render_threshold=0.2,
+    keypoint_scale=0,
+):
+    """Render people over the image at image_path and write the renders (and
+    their thumbnails) requested in targets ({kind: path}) with encoding.
+
+    Returns the written {kind: path}.
+    """
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    skeleton = render_skeleton(
+        image,
+        people,
+        render_threshold,
+        face_render_threshold,
+        hand_render_threshold,
+        keypoint_scale,
+    )
+
+    renders = {}
+    if "rendered_on_black" in targets:
+        renders["rendered_on_black"] = skeleton
+    if "rendered_on_image" in targets:
+        renders["rendered_on_image"] = composite(image, skeleton)
+    written = {}
+    for kind, render in renders.items():
+        thumbnail_path = targets.get(THUMBNAIL_KINDS[kind])
+        write_render(render, targets[kind], encoding, thumbnail_path)
+        written[kind] = targets[kind]
+        if thumbnail_path:
+            written[THUMBNAIL_KINDS[kind]] = thumbnail_path
+    return written
+
+
+def publish_keypoints_binary(
+    outputs,
+    output_dir,
+    name,
+    images,
+    model,
+    detect_face,
+    detect_hands,
+    keypoint_scale,
+):
+    """Pack the keypoints of images ([(image path, people), ...]) into one binary file.
+
+    The index and data paths are added to outputs["binary"].
+    """
+    binary_dir = os.path.join(output_dir, "binary")
+    os.makedirs(binary_dir, exist_ok=True)
+    data_path, index_path = write_keypoints_binary(
+        os.path.join(binary_dir, name),
+        images,
+        model,
+        detect_face,
+        detect_hands,
+        keypoint_scale,
+    )
+    outputs["binary"] = [index_path, data_path]
+
+
+def run_job_pipeline(
+    workspace,
+    model,
+    detect_face,
+    detect_hands,
+    detect_feet,
+    render_on_black,
+    render_on_image,
+    render_threshold,
+    face_render_threshold,
+    hand_render_threshold,
+    keypoint_scale,
+    job=None,
+    network=None,
+    encoding=None,
+):
+    """Run inference for the image staged in workspace.
+
+    Without renders requested only the keypoint JSON is written. network
+    holds the job's network_settings(), encoding how the renders are
+    written. Returns (success, outputs, render) with outputs pointing into
+    the workspace; render, if not None, draws and writes the renders still
+    to do and returns the final (success, outputs).
+    """
+    image_path = workspace["image"]
+    name_without_ext = os.path.splitext(os.path.basename(image_path))[0]
+    json_path = os.path.join(workspace["json"], f"{name_without_ext}_keypoints.json")
+
+    outputs = {
+        "rendered_on_black": [],
+        "rendered_on_image": [],
+        "json": [],
+    }
+
+    # Rendered outputs requested (and their thumbnails)
+    render_targets = output_targets(
+        workspace_dirs(workspace),
+        name_without_ext,
+        render_on_black,
+        render_on_image,
+        encoding,
+    )
+    del render_targets["json"]
+
+    # keypoint_scale 1/2 are relative to net sizes only OpenPose knows, so the
+    # keypoints cannot be mapped back to pixels: let OpenPose render those itself
+    if keypoint_scale not in (0, 3, 4) and render_targets:
+        success, outputs = process_image_with_openpose_render(
+            image_path,
+            model,
+            workspace["json"],
+            render_targets,
+            detect_face,
+            detect_hands,
+            detect_feet,
+            render_threshold,
+            face_render_threshold,
+            hand_render_threshold,
+            keypoint_scale,
+            outputs,
+            job,
+            network,
+            encoding,
+        )
+        return success, outputs, None
+
+    # 1. One inference pass that only writes the keypoint JSON
+    # (the warm worker only scales keypoints to 3/4 itself)
+    success = None
+    if (
+        keypoint_scale in (0, 3, 4)
+        and job is not None
+        and job.worker is not None
+        and WarmWorker.available
+    ):
+        config = warm_worker_config(
+            model, detect_face, detect_hands, detect_feet, network
+        )
+        task = {
+            "image_path": image_path,
+            "json_path": json_path,
+            "keypoint_scale": keypoint_scale,
+        }
+        success = process_with_warm_worker(config, task, job)
+
+    if success is None:
+        cmd = build_openpose_command(
+            workspace["input"],
+            model,
+            workspace["json"],
+            detect_face,
+            detect_hands,
+            detect_feet,
+            keypoint_scale,
+            network=network,
+        )
+        update_status("Running OpenPose...", 25, job=job)
+        success = run_openpose(
+            cmd, model, job, on_poll=first_frame_poller(json_path, job)
+        )
+
+    if not success:
+        return False, outputs, None
+
+    if not os.path.exists(json_path):
+        update_status(
+            f"OpenPose did not write keypoints for {image_path}", 100, False, job=job
         )
+        return False, outputs, None
+    mark_stage(job, "first_frame")
+    outputs["json"].append(json_path)
+    if not render_targets:
+        # Keypoints only
+        return True, outputs, None
 
-    # Execute OpenPose for each rendering option
-    for option in process_options:
-        # Prepare the OpenPose command
-        cmd = [
-            "./build/examples/openpose/openpose.bin",
-            "--image_dir",
+    # 2. Draw both renders from the same keypoints
+    def render():
+        try:
+            update_status("Rendering pose keypoints...", 80, job=job)
+            rendered = write_renders(
+                image_path,
+                read_people(json_path),
+                render_targets,
+                encoding,
+                render_threshold,
+                face_render_threshold,
+                hand_render_threshold,
+                keypoint_scale,
+            )
+            mark_stage(job, "render")
+        except Exception as e:
+            print(f"EXCEPTION WHILE RENDERING: {str(e)}", flush=True)
+            update_status(f"Exception during rendering: {str(e)}", 100, False, job=job)
+            return False, outputs
+
+        for key, path in rendered.items():
+            outputs.setdefault(key, []).append(path)
+        return True, outputs
+
+    return True, outputs, render
+
+
+def process_image_with_openpose_render(
+    image_path,
+    model,
+    json_dir,
+    render_targets,
+    detect_face,
+    detect_hands,
+    detect_feet,
+    render_threshold,
+    face_render_threshold,
+    hand_render_threshold,
+    keypoint_scale,
+    outputs,
+    job=None,
+    network=None,
+    encoding=None,
+):
+    """Let openpose.bin render each requested background (one run per background).
+
+    OpenPose writes PNG; renders asked for in another format, or with a
+    thumbnail, are re-encoded with encoding.
+    """
+    image_dir = os.path.dirname(image_path)
+    name_without_ext = os.path.splitext(os.path.basename(image_path))[0]
+    json_path = os.path.join(json_dir, f"{name_without_ext}_keypoints.json")
+
+    for key in ["rendered_on_black", "rendered_on_image"]:
+        if key not in render_targets:
+            continue
+        rendered_path = render_targets[key]
+        disable_blending = key == "rendered_on_black"
+        cmd = build_openpose_command(
             image_dir,
-            "--model_pose",
             model,
-            "--write_images",
-            option["output_dir"],
-            "--write_json",
             json_dir,
-            "--display",
-            "0",
-            "--render_threshold",
-            str(render_threshold),
-            "--render_pose",
-            "1",
-            "--part_to_show",
-            "0",
+            detect_face,
+            detect_hands,
+            detect_feet,
+            keypoint_scale,
+            write_images=os.path.dirname(rendered_path),
+            disable_blending=disable_blending,
+            render_threshold=render_threshold,
+            face_render_threshold=face_render_threshold,
+            hand_render_threshold=hand_render_threshold,
+            network=network,
+        )
+        name = "black_bg" if disable_blending else "on_image"
+        update_status(f"Running OpenPose for {name} rendering...", 25, job=job)
+        if not run_openpose(cmd, model, job):
+            return False, outputs
+
+        # OpenPose names its render after the image, as PNG (--write_images_format)
+        png_path = os.path.join(
+            os.path.dirname(rendered_path), f"{name_without_ext}_rendered.png"
+        )
+        thumbnail_path = render_targets.get(THUMBNAIL_KINDS[key])
+        if os.path.exists(png_path):
+            if png_path != rendered_path or thumbnail_path:
+                render = cv2.imread(png_path)
+                if render is None:
+                    raise ValueError(f"Could not read OpenPose render: {png_path}")
+                write_render(render, rendered_path, encoding, thumbnail_path)
+                if png_path != rendered_path:
+                    os.remove(png_path)
+                if thumbnail_path:
+                    outputs.setdefault(THUMBNAIL_KINDS[key], []).append(thumbnail_path)
+            outputs[key].append(rendered_path)
+        # Check for JSON output
+        if os.path.exists(json_path) and json_path not in outputs["json"]:
+            outputs["json"].append(json_path)
+
+    return True, outputs
+
+
+def process_batch(
+    image_paths,
+    output_dir,
+    model="BODY_25",
+    detect_face=False,
+    detect_hands=False,
+    detect_feet=False,
+    write_json=True,
+    render_on_black=True,
+    render_on_image=True,
+    render_threshold=0.05,
+    face_render_threshold=0.4,
+    hand_render_threshold=0.2,
+    feet_render_threshold=0.03,
+    keypoint_scale=0,
+    net_resolution=None,
+    scale_number=None,
+    scale_gap=None,
+    use_cache=True,
+    keypoint_format="json",
+    gate_face_hands=False,
+    encoding=None,
+    job_id=None,
+    job=None,
+):
+    """Process many images with one OpenPose run (or one warm worker session).
+
+    All images are staged into a single workspace, so the network is loaded
+    once for the whole batch. Images are rendered and written on the encoder
+    pool while OpenPose goes on with the next ones. Each image's result
+    (outputs, timing, error) is appended to job.results as soon as it is
+    written, and a summary with throughput and failures is stored in
+    job.summary at the end.
+
+    With face or hand detection and gate_face_hands, a body-only pass runs
+    first and the face/hand pass only over the images where it found a body;
+    the other images keep their body-only keypoints.
+    """
+    if job_id is None:
+        job_id = uuid.uuid4().hex[:12]
+
+    total = len(image_paths)
+    results = job.results if job is not None else []
+    outputs = {
+        "rendered_on_black": [],
+        "rendered_on_image": [],
+        "json": [],
+    }
+
+    update_status(f"Starting batch of {total} images", 0, True, image_paths[0], job=job)
+
+    # Create output subdirectories
+    output_dirs = job_output_dirs(output_dir, encoding)
+
+    if detect_feet and model != "BODY_25":
+        update_status(
+            "Error: Feet detection only available with BODY_25 model",
+            100,
+            False,
+            job=job,
+        )
+        return False, outputs
+
+    if keypoint_scale not in (0, 3, 4):
+        update_status(
+            "Error: keypoint_scale 1 and 2 are not supported for batches",
+            100,
+            False,
+            job=job,
+        )
+        return False, outputs
+
+    cache_options = dict(
+        model=model,
+        detect_face=detect_face,
+        detect_hands=detect_hands,
+        detect_feet=detect_feet,
+        render_on_black=render_on_black,
+        render_on_image=render_on_image,
+        render_threshold=render_threshold,
+        face_render_threshold=face_render_threshold,
+        hand_render_threshold=hand_render_threshold,
+        feet_render_threshold=feet_render_threshold,
+        keypoint_scale=keypoint_scale,
+        net_resolution=net_resolution,
+        scale_number=scale_number,
+        scale_gap=scale_gap,
+        **(encoding or {}),
+    )
+    network = network_settings(net_resolution, scale_number, scale_gap)
+    # Keypoints are published as JSON unless only the packed binary is wanted
+    publish_json = write_json and keypoint_format != "binary"
+    gated = gate_face_hands and (detect_face or detect_hands)
+    gate_summary = None
+    if (
+        gated
+        and MODEL_MEMORY_MB <= 0
+        and job is not None
+        and job.worker is not None
+        and WarmWorker.available
+    ):
+        # A warm worker keeps one configuration: switching between the
+        # body-only and face/hand ones twice per batch costs more than the
+        # gate saves, so everything runs in one combined pass
+        gated = False
+        gate_summary = {"gated": False}
+    if gated:
+        cache_options["face_hand_gate"] = FACE_HAND_GATE_THRESHOLD
+
+    # Feet keypoints are rendered with their own (usually lower) threshold
+    if detect_feet:
+        render_threshold = min(render_threshold, feet_render_threshold)
+    render_options = {
+        "render_on_black": render_on_black,
+        "render_on_image": render_on_image,
+        "render_threshold": render_threshold,
+        "face_render_threshold": face_render_threshold,
+        "hand_render_threshold": hand_render_threshold,
+        "keypoint_scale": keypoint_scale,
+        "encoding": encoding,
+    }
+
+    started = time.time()
+    try:
+        workspace = create_job_workspace(image_paths, job_id)
+    except OSError as e:
+        update_status(f"Could not stage images: {str(e)}", 100, False, job=job)
+        return False, outputs
+
+    cache_keys = {}
+    detected = {}  # staged image -> people, of every image processed
+    writes = []  # finish_image() work queued on the encoder pool
+
+    def finish_image(staged_image, elapsed, error=None):
+        writes.append(
+            encoder_pool.submit(write_batch_image, staged_image, elapsed, error)
+        )
+
+    def write_batch_image(staged_image, elapsed, error):
+        result, people = finish_batch_image(
+            workspace,
+            staged_image,
+            output_dirs,
+            elapsed,
+            error,
+            cache_keys.get(staged_image),
+            job,
+            publish_json,
+            **render_options,
+        )
+        record_result(staged_image, result, people)
+
+    def record_result(staged_image, result, people=None):
+        with status_lock:
+            results.append(result)
+            if people is not None:
+                result["num_people"] = len(people)
+                detected[staged_image] = people
+            done = len(results)
+            if job is not None:
+                job.record_event("image", result=result, images_done=done)
+            for key, paths in result["outputs"].items():
+                outputs.setdefault(key, []).extend(paths)
+        update_status(
+            f"Processed {done}/{total}: {result['image_path']}",
+            int(99 * done / total),
+            job=job,
+        )
+
+    def json_path_for(staged_image, json_dir=None):
+        name_without_ext = os.path.splitext(os.path.basename(staged_image))[0]
+        return os.path.join(
+            json_dir or workspace["json"], f"{name_without_ext}_keypoints.json"
+        )
+
+    def run_pass(images, face, hands, json_dir, on_done):
+        """Run OpenPose over images, calling on_done(staged_image, elapsed, error)
+        as each one is finished (or given up). Returns False if OpenPose failed.
+        """
+        success = True
+        # 1. Warm worker: one image at a time on the already-loaded network
+        if job is not None and job.worker is not None and WarmWorker.available:
+            config = warm_worker_config(model, face, hands, detect_feet, network)
+            while images and not job.stop_requested:
+                staged_image = images[0]
+                image_started = time.time()
+                task = {
+                    "image_path": staged_image,
+                    "json_path": json_path_for(staged_image, json_dir),
+                    "keypoint_scale": keypoint_scale,
+                }
+                try:
+                    job.worker.models.run(config, task, job)
+                    error = None
+                except (OSError, ValueError, RuntimeError) as e:
+                    if job.stop_requested:
+                        break
+                    if not WarmWorker.available:
+                        # pyopenpose unusable, run the rest through openpose.bin
+                        break
+                    error = str(e)
+                images.pop(0)
+                on_done(staged_image, time.time() - image_started, error)
+
+        # 2. openpose.bin: one run over the staged input directory
+        if images and not (job is not None and job.stop_requested):
+            last_finished = [time.time()]
+
+            def collect_finished():
+                for staged_image in list(images):
+                    if keypoints_ready(json_path_for(staged_image, json_dir)):
+                        mark_stage(job, "first_frame")
+                        now = time.time()
+                        images.remove(staged_image)
+                        on_done(staged_image, now - last_finished[0])
+                        last_finished[0] = now
+
+            image_dir = workspace["input"]
+            if len(images) < len(workspace["images"]):
+                # Only the images still to do (not the cached or done ones)
+                image_dir = stage_subset(
+                    workspace, images, f"input_{os.path.basename(json_dir)}"
+                )
+            cmd = build_openpose_command(
+                image_dir,
+                model,
+                json_dir,
+                face,
+                hands,
+                detect_feet,
+                keypoint_scale,
+                network=network,
+            )
+            update_status(f"Running OpenPose on {len(images)} images...", 5, job=job)
+            success = run_openpose(cmd, model, job, on_poll=collect_finished)
+            collect_finished()
+
+        # Whatever is left was never processed
+        error = "OpenPose did not write keypoints" if success else "OpenPose failed"
+        for staged_image in list(images):
+            images.remove(staged_image)
+            on_done(staged_image, 0.0, error)
+        return success
+
+    face_hand_images = []  # images with a body, for the face/hand pass
+    body_times = {}
+
+    def after_body_pass(staged_image, elapsed, error=None):
+        body_json = json_path_for(staged_image, workspace["body_json"])
+        if error is None:
+            try:
+                people = read_people(body_json)
+            except (OSError, ValueError):
+                people = []
+            if any(
+                has_valid_keypoints(
+                    person.get("pose_keypoints_2d"), FACE_HAND_GATE_THRESHOLD
+                )
+                for person in people
+            ):
+                face_hand_images.append(staged_image)
+                body_times[staged_image] = elapsed
+                return
+            try:
+                # Nobody to find a face or hands on: the body keypoints are final
+                os.replace(body_json, json_path_for(staged_image))
+            except OSError:
+                pass
+        finish_image(staged_image, elapsed, error)
+
+    def after_face_hand_pass(staged_image, elapsed, error=None):
+        finish_image(staged_image, body_times.get(staged_image, 0.0) + elapsed, error)
+
+    success = True
+    pending = list(workspace["images"])
+    try:
+        # 0. Images already processed with the same options come from the cache
+        if use_cache and result_cache.enabled:
+            for staged_image in list(pending):
+                key = cache_key(hash_file(staged_image), cache_options)
+                name_without_ext = os.path.splitext(os.path.basename(staged_image))[0]
+                targets = output_targets(
+                    output_dirs,
+                    name_without_ext,
+                    render_on_black,
+                    render_on_image,
+                    encoding,
+                )
+                if not publish_json:
+                    # Still needed for the batch statistics
+                    targets["json"] = json_path_for(staged_image)
+                if not result_cache.lookup(key, targets):
+                    cache_keys[staged_image] = key
+                    continue
+                pending.remove(staged_image)
+                mark_stage(job, "write")
+                published = (
+                    dict(targets)
+                    if publish_json
+                    else {
+                        kind: path for kind, path in targets.items() if kind != "json"
+                    }
+                )
+                record_result(
+                    staged_image,
+                    {
+                        "image_path": workspace["images"][staged_image],
+                        "success": True,
+                        "cached": True,
+                        "time": 0.0,
+                        "outputs": {
+                            kind: [published[kind]] if kind in published else []
+                            for kind in set(outputs) | set(published)
+                        },
+                    },
+                    read_people(targets["json"]),
+                )
+
+        if not gated:
+            if gate_summary is not None:
+                gate_summary.update(
+                    images=len(pending), face_hand_pass=len(pending), skipped=0
+                )
+            success = run_pass(
+                pending, detect_face, detect_hands, workspace["json"], finish_image
+            )
+        elif pending:
+            # 1. Body only over every image, 2. face/hands where there is a body
+            workspace["body_json"] = os.path.join(workspace["root"], "body_json")
+            os.makedirs(workspace["body_json"])
+            body_images = len(pending)
+            success = run_pass(
+                pending, False, False, workspace["body_json"], after_body_pass
+            )
+            if face_hand_images:
+                update_status(
+                    f"Detecting faces/hands on {len(face_hand_images)} of "
+                    f"{body_images} images",
+                    job=job,
+                )
+            face_hand_pass = len(face_hand_images)
+            success = (
+                run_pass(
+                    face_hand_images,
+                    detect_face,
+                    detect_hands,
+                    workspace["json"],
+                    after_face_hand_pass,
+                )
+                and success
+            )
+            gate_summary = {
+                "gated": True,
+                "images": body_images,
+                "face_hand_pass": face_hand_pass,
+                "skipped": body_images - face_hand_pass,
+            }
+    finally:
+        # The images still being written need the workspace
+        futures.wait(writes)
+        remove_job_workspace(workspace)
+
+    # All keypoints of the batch in one binary file, in request order so that
+    # offsets[i] is image i (no people for the images that failed)
+    if keypoint_format != "json" and detected:
+        packed = [
+            (image_path, detected.get(staged_image, []))
+            for staged_image, image_path in workspace["images"].items()
         ]
+        try:
+            publish_keypoints_binary(
+                outputs,
+                output_dir,
+                f"batch_{job_id}",
+                packed,
+                model,
+                detect_face,
+                detect_hands,
+                keypoint_scale,
+            )
+            mark_stage(job, "write")
+        except (OSError, ValueError) as e:
+            update_status(f"Could not write binary keypoints: {str(e)}", job=job)
+            success = False
+
+    elapsed = time.time() - started
+    with status_lock:
+        succeeded = sum(1 for result in results if result["success"])
+        summary = {
+            "images": total,
+            "succeeded": succeeded,
+            "failed": total - succeeded,
+            "total_time": elapsed,
+            "images_per_sec": succeeded / elapsed if elapsed > 0 else 0.0,
+        }
+    # Multi-person statistics over every image of the batch, in one pass
+    summary["keypoints"] = batch_stats(
+        [detected[image] for image in workspace["images"] if image in detected]
+    )
+    if gate_summary is not None:
+        summary["face_hand_gate"] = gate_summary
+    if job is not None:
+        with status_lock:
+            job.summary = summary
+
+    if success and not (job is not None and job.stop_requested):
+        update_status(
+            f"Batch completed: {succeeded}/{total} images "
+            f"({summary['images_per_sec']:.2f} images/sec)",
+            100,
+            False,
+            job=job,
+        )
+    else:
+        success = False
+        update_status(
+            f"Batch failed after {succeeded}/{total} images", 100, False, job=job
+        )
+    return success, outputs
+
+
+def video_frames(video_path, frame_first=0, frame_last=-1, frame_step=1):
+    """Return (frames to process, fps) of a video.
+
+    The frame count comes from the container and may be an estimate (0 when
+    it is not known). Raises ValueError if the video cannot be opened.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    try:
+        count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    finally:
+        capture.release()
+    if count <= 0:
+        return 0, fps
+    last = count - 1 if frame_last < 0 else min(frame_last, count - 1)
+    return len(range(frame_first, last + 1, frame_step)), fps
+
+
+def process_video(
+    output_dir,
+    video_path=None,
+    image_paths=None,
+    name=None,
+    fps=None,
+    frame_first=0,
+    frame_last=-1,
+    frame_step=1,
+    number_people_max=-1,
+    sampling=None,
+    model="BODY_25",
+    detect_face=False,
+    detect_hands=False,
+    detect_feet=False,
+    keypoint_scale=0,
+    net_resolution=None,
+    scale_number=None,
+    scale_gap=None,
+    job_id=None,
+    job=None,
+):
+    """Process a video, or a sequence of frame images, in one OpenPose session.
+
+    The warm worker reads the frames itself (openpose.bin gets --video, or
+    the selected frames staged as an image directory). Each frame's
+    keypoints are appended to an NDJSON file, one {"frame", "time",
+    "people"} line per frame, as soon as they are out, so /jobs/<id>/frames
+    can stream them while the job runs. The file is published to
+    output_dir/json/<name>_keypoints.ndjson at the end, also when the job
+    failed part way. Progress is the number of frames done.
+
+    sampling ({"max_stride", "motion_threshold"}) turns on adaptive frame
+    sampling on the warm worker: only keyframes are inferred and the frames
+    between them interpolated, unless the motion between them is too high.
+    openpose.bin always infers every frame.
+    """
+    if job_id is None:
+        job_id = uuid.uuid4().hex[:12]
+    if name is None:
+        source = video_path or os.path.dirname(image_paths[0])
+        name = os.path.splitext(os.path.basename(source))[0] or job_id
+
+    outputs = {"ndjson": []}
+    json_dir = os.path.join(output_dir, "json")
+    os.makedirs(json_dir, exist_ok=True)
+
+    if video_path:
+        try:
+            total, video_fps = video_frames(
+                video_path, frame_first, frame_last, frame_step
+            )
+        except ValueError as e:
+            update_status(f"Error: {str(e)}", 100, False, job=job)
+            return False, outputs
+        fps = fps or video_fps
+        selected = None
+    else:
+        last = len(image_paths) - 1 if frame_last < 0 else frame_last
+        selected = list(
+            range(frame_first, min(last, len(image_paths) - 1) + 1, frame_step)
+        )
+        total = len(selected)
+
+    update_status(
+        f"Starting video of {total or 'unknown number of'} frames",
+        0,
+        True,
+        video_path or image_paths[0],
+        job=job,
+    )
+
+    network = network_settings(net_resolution, scale_number, scale_gap)
+    if number_people_max > 0:
+        network["number_people_max"] = number_people_max
 
-        # Model-specific adjustments
-        if model == "COCO":
-            # COCO model uses a specific prototxt file
-            cmd.extend(["--prototxt_path", "pose/coco/pose_deploy_linevec.prototxt"])
-        elif model == "MPI":
-            # MPI model uses its own prototxt file
-            cmd.extend(["--prototxt_path", "pose/mpi/pose_deploy_linevec.prototxt"])
-        elif model == "BODY_25":
-            # Default BODY_25 model
-            # (no additional flags needed as this is the default)
-            pass
+    started = time.time()
+    try:
+        workspace = create_job_workspace([], job_id)
+        if selected is not None:
+            # Frame sequences are staged under their frame index, which
+            # openpose.bin then puts in its JSON file names (like for videos)
+            for index in selected:
+                extension = os.path.splitext(image_paths[index])[1]
+                stage_image(
+                    image_paths[index],
+                    os.path.join(workspace["input"], f"{index:012d}{extension}"),
+                )
+    except OSError as e:
+        update_status(f"Could not stage frames: {str(e)}", 100, False, job=job)
+        return False, outputs
+    frames_path = os.path.join(workspace["root"], f"{name}_keypoints.ndjson")
+    open(frames_path, "w").close()
+    frames = {"done": 0, "interpolated": 0, "with_people": 0, "max_people": 0}
+    if job is not None:
+        with status_lock:
+            job.frames_total = total or None
+            job.frames_path = frames_path
+
+    def frame_done(frame, num_people, inferred=True):
+        with status_lock:
+            frames["done"] += 1
+            frames["interpolated"] += 0 if inferred else 1
+            frames["with_people"] += 1 if num_people else 0
+            frames["max_people"] = max(frames["max_people"], num_people)
+            done = frames["done"]
+            if job is not None:
+                job.frames_done = done
+                job.record_event(
+                    "frame",
+                    frame=frame,
+                    inferred=inferred,
+                    num_people=num_people,
+                    frames_done=done,
+                )
+        update_status(
+            f"Processed frame {frame} ({done}/{total or '?'})",
+            int(99 * done / total) if total else None,
+            job=job,
+        )
+
+    success = None
+    try:
+        # 1. Warm worker: the frames are read and processed in one session
+        if job is not None and job.worker is not None and WarmWorker.available:
+            config = warm_worker_config(
+                model, detect_face, detect_hands, detect_feet, network
+            )
+            task = {
+                "frame_first": frame_first,
+                "frame_last": frame_last,
+                "frame_step": frame_step,
+                "fps": fps,
+                "keypoint_scale": keypoint_scale,
+                "ndjson_path": frames_path,
+                "sampling": sampling,
+            }
+            if video_path:
+                task["video_path"] = video_path
+            else:
+                task["image_paths"] = image_paths
+            try:
+                update_status("Running OpenPose on warm worker...", job=job)
+                job.worker.models.run_video(
+                    config,
+                    task,
+                    job,
+                    on_frame=lambda r: frame_done(
+                        r["frame"], r["num_people"], r["inferred"]
+                    ),
+                )
+                success = True
+            except (OSError, ValueError, RuntimeError) as e:
+                print(f"Warm worker failed: {str(e)}", flush=True)
+                if WarmWorker.available or frames["done"] or job.stop_requested:
+                    update_status(
+                        f"OpenPose worker failed: {str(e)}", 100, False, job=job
+                    )
+                    success = False
+
+        # 2. openpose.bin: one run over the video (or the staged frames)
+        if success is None:
+            if sampling:
+                update_status(
+                    "Adaptive sampling needs the warm worker, inferring every frame",
+                    job=job,
+                )
+            pending = {}  # frame index -> keypoint JSON, written but not yet read
+            frame_pattern = re.compile(r"(\d{12})_keypoints\.json$")
+
+            def collect_frames():
+                for file_name in os.listdir(workspace["json"]):
+                    match = frame_pattern.search(file_name)
+                    if match:
+                        pending.setdefault(
+                            int(match.group(1)),
+                            os.path.join(workspace["json"], file_name),
+                        )
+                # OpenPose writes the frames in order: take them while complete
+                with open(frames_path, "a") as out:
+                    for frame in sorted(pending):
+                        json_path = pending[frame]
+                        if not keypoints_ready(json_path):
+                            break
+                        people = read_people(json_path)
+                        out.write(
+                            json.dumps(
+                                {
+                                    "frame": frame,
+                                    "time": frame / fps if fps else None,
+                                    "inferred": True,
+                                    "people": people,
+                                }
+                            )
+                            + "\n"
+                        )
+                        out.flush()
+                        os.remove(json_path)
+                        del pending[frame]
+                        mark_stage(job, "first_frame")
+                        frame_done(frame, len(people))
+
+            cmd = build_openpose_command(
+                workspace["input"],
+                model,
+                workspace["json"],
+                detect_face,
+                detect_hands,
+                detect_feet,
+                keypoint_scale,
+                network=network,
+                video_path=video_path,
+                frame_range=(
+                    (frame_first, frame_last, frame_step) if video_path else None
+                ),
+            )
+            success = run_openpose(
+                cmd, model, job, on_poll=collect_frames, progress_markers=()
+            )
+            collect_frames()
+
+        final_path = os.path.join(json_dir, f"{name}_keypoints.ndjson")
+        try:
+            publish_output(frames_path, final_path)
+            outputs["ndjson"].append(final_path)
+            mark_stage(job, "write")
+            if job is not None:
+                with job_events:
+                    job.frames_path = final_path
+                    job_events.notify_all()
+        except OSError as e:
+            update_status(f"Could not write keypoints: {str(e)}", job=job)
+            success = False
+    finally:
+        remove_job_workspace(workspace)
+
+    elapsed = time.time() - started
+    summary = {
+        "frames": total or frames["done"],
+        "frames_done": frames["done"],
+        "frames_inferred": frames["done"] - frames["interpolated"],
+        "frames_interpolated": frames["interpolated"],
+        "frames_with_people": frames["with_people"],
+        "max_people": frames["max_people"],
+        "fps": fps or None,
+        "total_time": elapsed,
+        "frames_per_sec": frames["done"] / elapsed if elapsed > 0 else 0.0,
+    }
+    if job is not None:
+        with status_lock:
+            job.summary = summary
+
+    if success and not (job is not None and job.stop_requested):
+        update_status(
+            f"Video completed: {frames['done']} frames "
+            f"({summary['frames_per_sec']:.2f} frames/sec)",
+            100,
+            False,
+            job=job,
+        )
+    else:
+        success = False
+        update_status(
+            f"Video failed after {frames['done']} frames", 100, False, job=job
+        )
+    return success, outputs
+
+
+def infer_image(
+    image,
+    image_data,
+    model="BODY_25",
+    detect_face=False,
+    detect_hands=False,
+    detect_feet=False,
+    write_json=True,
+    render_on_black=False,
+    render_on_image=False,
+    render_threshold=0.05,
+    face_render_threshold=0.4,
+    hand_render_threshold=0.2,
+    feet_render_threshold=0.03,
+    keypoint_scale=0,
+    net_resolution=None,
+    scale_number=None,
+    scale_gap=None,
+    use_cache=True,
+    keypoint_format="json",
+    encoding=None,
+    output_dir=None,
+    name=None,
+    job_id=None,
+    job=None,
+):
+    """Run inference on an uploaded image and keep the result in memory.
+
+    image is the decoded upload, image_data its original encoded bytes.
+
+    On the warm worker the image never touches the disk; openpose.bin needs it
+    staged in a job workspace. Keypoints and the renders (and thumbnails),
+    encoded with encoding, are stored in job.response; files are only
+    written when output_dir is given. Like process_image(), a job with
+    renders to draw gets a Future of (success, outputs) back.
+    """
+    if job_id is None:
+        job_id = uuid.uuid4().hex[:12]
+    name = name or job_id
+    started = time.time()
+    outputs = {
+        "rendered_on_black": [],
+        "rendered_on_image": [],
+        "json": [],
+    }
+
+    update_status(f"Starting inference for upload: {name}", 0, True, name, job=job)
+
+    # Same upload with the same options before: answer from the cache
+    kinds = ["json"]
+    if render_on_black:
+        kinds.append("rendered_on_black")
+    if render_on_image:
+        kinds.append("rendered_on_image")
+    if encoding and encoding["thumbnail_size"]:
+        kinds.extend([THUMBNAIL_KINDS[kind] for kind in kinds[1:]])
+    key = cached = None
+    if use_cache and result_cache.enabled:
+        key = cache_key(
+            hash_bytes(image_data),
+            dict(
+                model=model,
+                detect_face=detect_face,
+                detect_hands=detect_hands,
+                detect_feet=detect_feet,
+                render_on_black=render_on_black,
+                render_on_image=render_on_image,
+                render_threshold=render_threshold,
+                face_render_threshold=face_render_threshold,
+                hand_render_threshold=hand_render_threshold,
+                feet_render_threshold=feet_render_threshold,
+                keypoint_scale=keypoint_scale,
+                net_resolution=net_resolution,
+                scale_number=scale_number,
+                scale_gap=scale_gap,
+                **(encoding or {}),
+            ),
+        )
+        cached = result_cache.load(key, kinds)
+
+    def finish(response, inference_time):
+        """Draw and encode the renders response lacks, cache them and write
+        the files asked for."""
+        people = response["people"]
+        if not response.get("cached"):
+            # 2. Renders, encoded in memory
+            if render_on_black or render_on_image:
+                update_status("Rendering pose keypoints...", 80, job=job)
+                threshold = render_threshold
+                if detect_feet:
+                    threshold = min(threshold, feet_render_threshold)
+                skeleton = render_skeleton(
+                    image,
+                    people,
+                    threshold,
+                    face_render_threshold,
+                    hand_render_threshold,
+                    keypoint_scale,
+                )
+                renders = {}
+                if render_on_black:
+                    renders["rendered_on_black"] = skeleton
+                if render_on_image:
+                    renders["rendered_on_image"] = composite(image, skeleton)
+                if encoding and encoding["thumbnail_size"]:
+                    for kind, render in list(renders.items()):
+                        renders[THUMBNAIL_KINDS[kind]] = make_thumbnail(
+                            render, encoding["thumbnail_size"]
+                        )
+                for kind, render in renders.items():
+                    response[kind] = np.frombuffer(
+                        encode_image(render, encoding), dtype=np.uint8
+                    )
+                mark_stage(job, "render")
+
+            if key is not None:
+                data = {kind: response[kind].tobytes() for kind in kinds[1:]}
+                data["json"] = json.dumps({"version": 1.3, "people": people}).encode(
+                    "utf-8"
+                )
+                result_cache.store(key, data=data)
+        response["image_size"] = [image.shape[1], image.shape[0]]
+
+        # 3. Files, only when asked for
+        if output_dir:
+            files = []
+            if write_json and keypoint_format != "binary":
+                document = {"version": 1.3, "people": people}
+                files.append(
+                    (
+                        "json",
+                        os.path.join(output_dir, "json", f"{name}_keypoints.json"),
+                        json.dumps(document).encode("utf-8"),
+                    )
+                )
+            targets = output_targets(
+                job_output_dirs(output_dir, encoding),
+                name,
+                render_on_black,
+                render_on_image,
+                encoding,
+            )
+            for kind, output_path in targets.items():
+                if kind in response:
+                    files.append((kind, output_path, response[kind].tobytes()))
+            for kind, output_path, data in files:
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                write_file(output_path, data)
+                outputs.setdefault(kind, []).append(output_path)
+
+            if keypoint_format != "json":
+                binary_dir = os.path.join(output_dir, "binary")
+                os.makedirs(binary_dir, exist_ok=True)
+                data_path, index_path = write_keypoints_binary(
+                    os.path.join(binary_dir, name),
+                    [(name, people)],
+                    model,
+                    detect_face,
+                    detect_hands,
+                    keypoint_scale,
+                )
+                outputs["binary"] = [index_path, data_path]
+            mark_stage(job, "write")
+
+        response["timing"] = {
+            "inference": inference_time,
+            "total": time.time() - started,
+        }
+        # The response is stored with the final status, so no one sees the
+        # job complete without it
+        update_status(
+            "Inference completed successfully",
+            100,
+            False,
+            job=job,
+            job_fields={"response": response},
+        )
+        return True, outputs
 
+    if cached is not None:
+        response = json.loads(cached.pop("json"))
+        for kind, data in cached.items():
+            response[kind] = np.frombuffer(data, dtype=np.uint8)
+        response["cached"] = True
+        return finish(response, 0.0)
+
+    # 1. Inference
+    people = None
+    network = network_settings(net_resolution, scale_number, scale_gap)
+    if job is not None and job.worker is not None and WarmWorker.available:
+        config = warm_worker_config(
+            model, detect_face, detect_hands, detect_feet, network
+        )
+        task = {
+            "image_data": base64.b64encode(image_data).decode("ascii"),
+            "keypoint_scale": keypoint_scale,
+        }
+        try:
+            update_status("Running OpenPose on warm worker...", 25, job=job)
+            people = job.worker.models.run(config, task, job)["people"]
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Warm worker failed: {str(e)}", flush=True)
+            if WarmWorker.available or job.stop_requested:
+                update_status(f"OpenPose worker failed: {str(e)}", 100, False, job=job)
+                return False, outputs
+
+    if people is None:
+        people = infer_with_openpose_bin(
+            image,
+            model,
+            detect_face,
+            detect_hands,
+            detect_feet,
+            keypoint_scale,
+            job,
+            network,
+        )
+        if people is None:
+            return False, outputs
+    response = {"version": 1.3, "people": people}
+    inference_time = time.time() - started
+
+    if job is not None and (render_on_black or render_on_image):
+        # The worker moves on to its next job while the renders are drawn
+        # and encoded on the encoder pool (see run_job)
+        return encoder_pool.submit(finish, response, inference_time)
+    return finish(response, inference_time)
+
+
+def infer_with_openpose_bin(
+    image,
+    model,
+    detect_face,
+    detect_hands,
+    detect_feet,
+    keypoint_scale,
+    job=None,
+    network=None,
+):
+    """Run openpose.bin on a decoded image staged in a temporary workspace.
+
+    Returns the detected people, or None on failure.
+    """
+    os.makedirs(JOB_WORKSPACE_ROOT, exist_ok=True)
+    root = tempfile.mkdtemp(prefix="infer_", dir=JOB_WORKSPACE_ROOT)
+    workspace = {"root": root}
+    try:
+        for subdir in ["input", "json"]:
+            workspace[subdir] = os.path.join(root, subdir)
+            os.makedirs(workspace[subdir])
+        cv2.imwrite(os.path.join(workspace["input"], "upload.png"), image)
+
+        cmd = build_openpose_command(
+            workspace["input"],
+            model,
+            workspace["json"],
+            detect_face,
+            detect_hands,
+            detect_feet,
+            keypoint_scale,
+            network=network,
+        )
+        json_path = os.path.join(workspace["json"], "upload_keypoints.json")
+        update_status("Running OpenPose...", 25, job=job)
+        if not run_openpose(
+            cmd, model, job, on_poll=first_frame_poller(json_path, job)
+        ):
+            return None
+
+        if not keypoints_ready(json_path):
+            update_status("OpenPose did not write keypoints", 100, False, job=job)
+            return None
+        mark_stage(job, "first_frame")
+        with open(json_path, "r") as f:
+            return json.load(f).get("people", [])
+    finally:
+        remove_job_workspace(workspace)
+
+
+def first_frame_poller(json_path, job):
+    """on_poll callback for run_openpose() timestamping the first keypoints."""
+
+    def poll():
+        if job is not None and "first_frame" not in job.stage_times:
+            if keypoints_ready(json_path):
+                mark_stage(job, "first_frame")
+
+    return poll
+
+
+def keypoints_ready(json_path):
+    """True once OpenPose has completely written a keypoint JSON file."""
+    try:
+        with open(json_path, "r") as f:
+            json.load(f)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def finish_batch_image(
+    workspace,
+    staged_image,
+    output_dirs,
+    elapsed,
+    error=None,
+    key=None,
+    job=None,
+    publish_json=True,
+    render_on_black=True,
+    render_on_image=True,
+    render_threshold=0.05,
+    face_render_threshold=0.4,
+    hand_render_threshold=0.2,
+    keypoint_scale=0,
+    encoding=None,
+):
+    """Render and publish one image of a batch.
+
+    Returns its result entry and the detected people (None if it failed). The
+    result is added to the result cache under key, if given; its keypoint JSON
+    is only published with publish_json.
+    """
+    name_without_ext = os.path.splitext(os.path.basename(staged_image))[0]
+    result = {
+        "image_path": workspace["images"][staged_image],
+        "success": False,
+        "time": elapsed,
+        "outputs": {
+            "rendered_on_black": [],
+            "rendered_on_image": [],
+            "json": [],
+        },
+    }
+    if error is not None:
+        result["error"] = error
+        return result, None
+
+    staged_outputs = output_targets(
+        workspace_dirs(workspace),
+        name_without_ext,
+        render_on_black,
+        render_on_image,
+        encoding,
+    )
+    people = None
+    try:
+        people = read_people(staged_outputs["json"])
+        if render_on_black or render_on_image:
+            write_renders(
+                staged_image,
+                people,
+                staged_outputs,
+                encoding,
+                render_threshold,
+                face_render_threshold,
+                hand_render_threshold,
+                keypoint_scale,
+            )
+            mark_stage(job, "render")
+
+        if key is not None:
+            result_cache.store(key, files=staged_outputs)
+
+        for kind, path in staged_outputs.items():
+            if kind == "json" and not publish_json:
+                continue
+            output_path = os.path.join(output_dirs[kind], os.path.basename(path))
+            result["outputs"].setdefault(kind, []).append(
+                publish_output(path, output_path)
+            )
+        mark_stage(job, "write")
+        result["success"] = True
+    except Exception as e:
+        result["error"] = str(e)
+        people = None
+    return result, people
+
+
+def build_openpose_command(
+    image_dir,
+    model,
+    json_dir,
+    detect_face,
+    detect_hands,
+    detect_feet,
+    keypoint_scale,
+    write_images=None,
+    disable_blending=False,
+    render_threshold=0.05,
+    face_render_threshold=0.4,
+    hand_render_threshold=0.2,
+    network=None,
+    video_path=None,
+    frame_range=None,
+):
+    """Build the openpose.bin command line.
+
+    Without write_images OpenPose only writes keypoint JSON (--render_pose 0).
+    network holds the job's network_settings(). With video_path OpenPose
+    reads that video instead of image_dir, and frame_range is an optional
+    (first, last, step) of the frames to process.
+    """
+    if video_path:
+        source = ["--video", video_path]
+    else:
+        source = ["--image_dir", image_dir]
+    cmd = [
+        OPENPOSE_BIN,
+        *source,
+        "--model_folder",
+        MODEL_FOLDER,
+        "--model_pose",
+        model,
+        "--write_json",
+        json_dir,
+        "--display",
+        "0",
+    ]
+
+    # Model-specific adjustments
+    # (COCO and MPI use their own prototxt files, BODY_25 is the default)
+    if model in MODEL_PROTOTXT:
+        cmd.extend(["--prototxt_path", MODEL_PROTOTXT[model]])
+
+    if write_images:
+        cmd.extend(
+            [
+                "--write_images",
+                write_images,
+                "--write_images_format",
+                "png",
+                "--render_threshold",
+                str(render_threshold),
+                "--render_pose",
+                "1",
+                "--part_to_show",
+                "0",
+            ]
+        )
         # Add black background if specified
-        if option["disable_blending"]:
+        if disable_blending:
             cmd.append("--disable_blending")
+    else:
+        # Keypoints only, rendering happens in Python
+        cmd.extend(["--render_pose", "0"])
 
-        # Add facial keypoint detection if requested
-        if detect_face:
-            cmd.append("--face")
+    # Add facial keypoint detection if requested
+    if detect_face:
+        cmd.append("--face")
+        if write_images:
             cmd.extend(["--face_render_threshold", str(face_render_threshold)])
 
-        # Add hand keypoint detection if requested
-        if detect_hands:
-            cmd.append("--hand")
+    # Add hand keypoint detection if requested
+    if detect_hands:
+        cmd.append("--hand")
+        if write_images:
             cmd.extend(["--hand_render_threshold", str(hand_render_threshold)])
 
-        # Add feet-specific parameters if requested
-        # ** NOTE: Only available for model BODY_25
-        if detect_feet and model == "BODY_25":
-            cmd.append("--maximize_positives")  # Helps with harder-to-detect keypoints
+    # Add feet-specific parameters if requested
+    # ** NOTE: Only available for model BODY_25
+    if detect_feet and model == "BODY_25":
+        cmd.append("--maximize_positives")  # Helps with harder-to-detect keypoints
+
+    # Network input size and scales (speed vs accuracy)
+    for name, value in (network or {}).items():
+        cmd.extend([f"--{name}", str(value)])
+
+    if frame_range is not None:
+        first, last, step = frame_range
+        cmd.extend(["--frame_first", str(first), "--frame_step", str(step)])
+        if last >= 0:
+            cmd.extend(["--frame_last", str(last)])
+
+    # Set keypoint scale
+    cmd.extend(["--keypoint_scale", str(keypoint_scale)])
+    return cmd
+
+
+def run_openpose(
+    cmd, model, job=None, on_poll=None, progress_markers=OPENPOSE_PROGRESS_MARKERS
+):
+    """Run openpose.bin to completion while monitoring its output.
+
+    on_poll, if given, is called periodically while OpenPose is running.
+    progress_markers set the progress from OpenPose's log lines.
+    Returns True on success. On failure the status is updated and False returned.
+    """
+    worker = job.worker if job is not None else None
+    log = job.log if job is not None else LogBuffer(JOB_LOG_LINES)
+    first_line = log.total
+
+    try:
+        if worker is not None:
+            cmd = worker.command(cmd)
+        update_status(f"Command: {' '.join(cmd)}", 30, job=job)
+
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            bufsize=1,  # Line buffered
+            **(worker.popen_kwargs() if worker is not None else {}),
+        )
+
+        if worker is not None:
+            worker.process_handle = process
+        mark_stage(job, "spawn")
+        print(f"Setting process_handle to {process}", flush=True)
+
+        # Start monitoring in separate threads to avoid blocking
+        stdout_thread = threading.Thread(
+            target=monitor_output,
+            args=(process.stdout, "stdout", log, progress_markers, job),
+        )
+        stderr_thread = threading.Thread(
+            target=monitor_output, args=(process.stderr, "stderr", log, (), job)
+        )
+
+        stdout_thread.daemon = True
+        stderr_thread.daemon = True
+        stdout_thread.start()
+        stderr_thread.start()
+
+        # Wait for process to finish
+        if on_poll is None:
+            process.wait()
+        else:
+            # Let the caller pick up finished outputs while OpenPose runs
+            while process.poll() is None:
+                on_poll()
+                time.sleep(BATCH_POLL_INTERVAL)
+        mark_stage(job, "exit")
+        stdout_thread.join(timeout=60)
+        stderr_thread.join(timeout=60)
+
+        if process.returncode != 0:
+            # The monitor threads drained stderr into the log
+            stderr_output = (
+                log.text(ERROR_LOG_LINES, "stderr", first_line) or "No error output"
+            )
             update_status(
-                f"Feet detection enabled with threshold: {feet_render_threshold}", None
+                f"OpenPose process failed (code {process.returncode}): {stderr_output}",
+                100,
+                False,
+                job=job,
             )
-            # Optionally, adjust the render threshold for this run if it helps feet detection
-            cmd[cmd.index("--render_threshold") + 1] = str(
-                min(render_threshold, feet_render_threshold)
+            print(f"ERROR WITH MODEL {model}: {stderr_output}", flush=True)
+            return False
+
+    except Exception as e:
+        print(f"EXCEPTION WITH MODEL {model}: {str(e)}", flush=True)
+        update_status(f"Exception during processing: {str(e)}", 100, False, job=job)
+        return False
+
+    return True
+
+
+def run_job(job, worker):
+    """Run one queued job on worker and record its result.
+
+    A job whose target returns a Future (its outputs are still being rendered
+    and encoded on the encoder pool, see process_image) frees the worker right
+    away and finishes once the Future is done.
+    """
+    with status_lock:
+        job.state = "running"
+        job.started_at = time.time()
+        job.worker = worker
+        worker.current_job = job
+        job.record_event("state", worker_id=worker.worker_id)
+
+    target = {
+        "batch": process_batch,
+        "video": process_video,
+        "infer": infer_image,
+    }.get(job.kind, process_image)
+    try:
+        if job.stop_requested:
+            # Cancelled while it was being handed to this worker
+            result = False, None
+        else:
+            result = target(job_id=job.job_id, job=job, **job.options)
+    except Exception as e:
+        print(f"EXCEPTION IN JOB {job.job_id}: {str(e)}", flush=True)
+        update_status(f"Exception during processing: {str(e)}", 100, False, job=job)
+        result = False, None
+
+    if not isinstance(result, futures.Future):
+        finish_job(job, *result, worker=worker)
+        return
+
+    def finish_encoded(task):
+        try:
+            success, outputs = task.result()
+        except Exception as e:
+            print(f"EXCEPTION IN JOB {job.job_id}: {str(e)}", flush=True)
+            update_status(f"Exception during encoding: {str(e)}", 100, False, job=job)
+            success, outputs = False, None
+        finish_job(job, success, outputs)
+
+    with status_lock:
+        release_worker(job, worker)
+    update_status(
+        f"Job {job.job_id} handed to the encoder pool", None, False, worker=worker
+    )
+    result.add_done_callback(finish_encoded)
+
+
+def release_worker(job, worker):
+    """Free worker of job (call with status_lock held)."""
+    worker.current_job = None
+    worker.last_job = job
+    worker.process_handle = None
+    worker.jobs_completed += 1
+    worker.busy_seconds += time.time() - job.started_at
+
+
+def finish_job(job, success, outputs, worker=None):
+    """Record the result of job, and free the worker still running it."""
+    if job.timed_out:
+        update_status(f"Job timed out after {job.timeout:g}s", 100, False, job=job)
+    elif job.stop_requested:
+        update_status("Processing stopped", 100, False, job=job)
+
+    # Summarise the keypoints once, /status and /jobs only serve the result
+    stats = None
+    if success:
+        try:
+            stats = job_keypoint_stats(job, outputs)
+        except Exception as e:
+            stats = {"error": str(e)}
+
+    with status_lock:
+        job.success = success
+        job.outputs = outputs
+        job.finished_at = time.time()
+        if job.timed_out:
+            job.state = "timed_out"
+        elif job.stop_requested:
+            job.state = "stopped"
+        else:
+            job.state = "done" if success else "failed"
+        job.keypoint_stats = stats
+        job.record_event("done", job=job.to_dict())
+        if worker is not None:
+            release_worker(job, worker)
+    job.finished.set()
+    job_queue.record_duration(job.finished_at - job.started_at)
+    record_job_metrics(job, outputs)
+
+
+def record_job_metrics(job, outputs):
+    """Add a finished job to the /metrics histograms and counters."""
+    with status_lock:
+        durations = job.stage_durations()
+    jobs_finished.inc(kind=job.kind, state=job.state)
+    job_queue_wait.observe(job.started_at - job.created_at, kind=job.kind)
+    job_duration.observe(job.finished_at - job.started_at, kind=job.kind)
+    for stage, seconds in durations.items():
+        stage_duration.observe(seconds, kind=job.kind, stage=stage)
+    for kind, paths in (outputs or {}).items():
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        if size:
+            output_bytes.inc(size, kind=kind)
+
+
+def job_snapshot(job, results_since=0):
+    """Job state for API responses, including its queue position while queued."""
+    position = job_queue.position(job) if job.state == "queued" else None
+    with status_lock:
+        snapshot = job.to_dict(results_since)
+    if position is not None:
+        snapshot["queue_position"] = position
+    return snapshot
+
+
+def parse_processing_options(data, default_output_dir="/images/output"):
+    """Read and validate the processing options shared by the processing endpoints.
+
+    Returns (options, warnings), options being keyword arguments for
+    process_image() / process_batch() / infer_image() without the image(s).
+    Raises ValueError with a message for the client if an option is invalid.
+    """
+    # Required parameters
+    output_dir = data.get("output_dir", default_output_dir)
+
+    # Optional visualization parameters
+    model = data.get("model", "BODY_25")
+
+    detect_face = data.get("detect_face", False)
+    detect_hands = data.get("detect_hands", False)
+    detect_feet = data.get("detect_feet", False)
+
+    # Build a warnings array for any potential issues
+    warnings = []
+    # Add model-specific validation warnings
+    if model != "BODY_25" and (detect_face or detect_hands):
+        warning_msg = f"Face and hand detection with {model} model may be unstable. For best results, use BODY_25 model."
+        warnings.append(warning_msg)
+        print(f"WARNING: {warning_msg}", flush=True)
+
+    # Still reject feet detection with non-BODY_25 models (since this is a technical limitation)
+    if detect_feet and model != "BODY_25":
+        raise ValueError("Feet detection is only available with BODY_25 model")
+
+    render_on_black = data.get("render_on_black", True)
+    render_on_image = data.get("render_on_image", True)
+    write_json = data.get("write_json", True)
+
+    # Rendering thresholds
+    render_threshold = float(data.get("render_threshold", 0.05))
+    face_render_threshold = float(data.get("face_render_threshold", 0.4))
+    hand_render_threshold = float(data.get("hand_render_threshold", 0.2))
+    feet_render_threshold = float(data.get("feet_render_threshold", 0.03))
+    keypoint_scale = int(data.get("keypoint_scale", 0))
+
+    # Identical earlier requests are answered from the result cache
+    use_cache = data.get("use_cache", True)
+
+    # Format and quality of the rendered images, and their thumbnails
+    encoding = parse_encoding(data)
+    if encoding["thumbnail_size"] and not (render_on_black or render_on_image):
+        warnings.append("thumbnail_size is ignored without rendered outputs")
+
+    # Keypoints as JSON, packed float32 ("binary") or both
+    keypoint_format = data.get("keypoint_format", "json")
+    if keypoint_format not in KEYPOINT_FORMATS:
+        raise ValueError(
+            f"Invalid keypoint_format: {keypoint_format}. "
+            f"Must be one of: {', '.join(KEYPOINT_FORMATS)}"
+        )
+
+    # Validate model selection
+    if model not in ["BODY_25", "COCO", "MPI"]:
+        raise ValueError(f"Invalid model: {model}. Must be one of: BODY_25, COCO, MPI")
+
+    # Check if model files exist
+    model_dir = os.path.join(MODEL_FOLDER, "pose", model.lower())
+    if not os.path.exists(model_dir):
+        raise ValueError(f"Model directory not found: {model_dir}")
+
+    # For COCO specifically, we need to use the correct prototxt file
+    if model == "COCO":
+        if not os.path.exists(f"{model_dir}/pose_deploy_linevec.prototxt"):
+            raise ValueError(f"Required prototxt file for {model} not found")
+
+    # Network settings trade accuracy for speed: either explicit, or the most
+    # accurate calibrated ones expected to fit latency_budget_ms
+    net_resolution = data.get("net_resolution")
+    if net_resolution is not None:
+        net_resolution = str(net_resolution).strip()
+        parse_net_resolution(net_resolution)
+    scale_number = data.get("scale_number")
+    if scale_number is not None:
+        scale_number = int(scale_number)
+        if not 1 <= scale_number <= MAX_SCALE_NUMBER:
+            raise ValueError(
+                f"Invalid scale_number: {scale_number}. "
+                f"Must be between 1 and {MAX_SCALE_NUMBER}"
             )
-        elif detect_feet and model != "BODY_25":
-            update_status(
-                "Error: Feet detection only available with BODY_25 model", 100, False
+    scale_gap = data.get("scale_gap")
+    if scale_gap is not None:
+        scale_gap = float(scale_gap)
+        if not 0 < scale_gap < 1:
+            raise ValueError(f"Invalid scale_gap: {scale_gap}. Must be between 0 and 1")
+
+    latency_budget_ms = data.get("latency_budget_ms")
+    if latency_budget_ms is not None:
+        latency_budget_ms = float(latency_budget_ms)
+        if latency_budget_ms <= 0:
+            raise ValueError("latency_budget_ms must be positive")
+        if net_resolution is not None or scale_number is not None:
+            warnings.append(
+                "latency_budget_ms is ignored when net_resolution or scale_number "
+                "is given"
             )
-            return False, outputs
+        else:
+            entry, fits = calibration.choose(
+                model, detect_face, detect_hands, latency_budget_ms
+            )
+            if entry is None:
+                warnings.append(
+                    f"No latency calibration for {model}, "
+                    "using the default network settings"
+                )
+            else:
+                net_resolution = entry["net_resolution"]
+                scale_number = entry["scale_number"]
+                if not fits:
+                    warnings.append(
+                        f"No calibrated setting fits {latency_budget_ms:.0f} ms, "
+                        f"using the fastest one (about {entry['ms']:.0f} ms)"
+                    )
+
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+
+    options = {
+        "output_dir": output_dir,
+        "model": model,
+        "detect_face": detect_face,
+        "detect_hands": detect_hands,
+        "detect_feet": detect_feet,
+        "write_json": write_json,
+        "render_on_black": render_on_black,
+        "render_on_image": render_on_image,
+        "render_threshold": render_threshold,
+        "face_render_threshold": face_render_threshold,
+        "hand_render_threshold": hand_render_threshold,
+        "feet_render_threshold": feet_render_threshold,
+        "keypoint_scale": keypoint_scale,
+        "net_resolution": net_resolution,
+        "scale_number": scale_number,
+        "scale_gap": scale_gap,
+        "use_cache": use_cache,
+        "keypoint_format": keypoint_format,
+        "encoding": encoding,
+    }
+    return options, warnings
+
+
+def job_timeout(data, default=JOB_TIMEOUT):
+    """The "timeout" of a request in seconds, None for no limit (0).
+
+    Raises ValueError with a message for the client if it is invalid.
+    """
+    try:
+        timeout = float(data.get("timeout", default))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid timeout: {data.get('timeout')}")
+    if timeout < 0:
+        raise ValueError("timeout must be 0 (no limit) or a number of seconds")
+    return timeout or None
+
+
+def check_outputs_requested(options):
+    """Raise ValueError if the options would not write any output file."""
+    if not (
+        options["write_json"]
+        or options["render_on_black"]
+        or options["render_on_image"]
+        or options["keypoint_format"] != "json"
+    ):
+        raise ValueError(
+            "Nothing to output: enable write_json, render_on_black or "
+            "render_on_image, or use keypoint_format binary"
+        )
+
+
+def form_options(values):
+    """Convert /infer form fields or query arguments to processing options.
+
+    Form values are strings, so flags are parsed ("true", "1", "yes", "on").
+    """
+    data = dict(values.items())
+    for key in [
+        "detect_face",
+        "detect_hands",
+        "detect_feet",
+        "write_json",
+        "render_on_black",
+        "render_on_image",
+        "use_cache",
+    ]:
+        if key in data:
+            data[key] = data[key].strip().lower() in ("1", "true", "yes", "on")
+    return data
 
-        # Set keypoint scale
-        cmd.extend(["--keypoint_scale", str(keypoint_scale)])
-
-        # Run the OpenPose command
-        # try:
-        #     update_status(f"Running OpenPose for {option['name']} rendering...", 25)
-        #     update_status(f"Command: {' '.join(cmd)}", 30)
-
-        #     # process = subprocess.Popen(
-        #     #     cmd,
-        #     #     stdout=subprocess.PIPE,
-        #     #     stderr=subprocess.PIPE,
-        #     #     universal_newlines=True,
-        #     # )
-        #     process = subprocess.Popen(
-        #         cmd,
-        #         stdout=subprocess.PIPE,
-        #         stderr=subprocess.PIPE,
-        #         universal_newlines=True,
-        #         bufsize=1
-        #     )
-
-        #     # Monitor the process output
-        #     for line in process.stdout:
-        #         update_status(line.strip(), None)
-
-        #     # Wait for the process to complete
-        #     process.wait()
 
-        try:
-            update_status(f"Running OpenPose for {option['name']} rendering...", 25)
-            update_status(f"Command: {' '.join(cmd)}", 30)
-
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True,
-                bufsize=1,  # Line buffered
-            )
-
-            process_handle = process
-            print(f"Setting process_handle to {process_handle}", flush=True)
-
-            # Start monitoring in separate threads to avoid blocking
-            stdout_thread = threading.Thread(
-                target=monitor_output,
-                args=(
-                    process.stdout,
-                    {"Starting": 35, "Keypoints": 50, "Finished": 75},
-                ),
-            )
-            stderr_thread = threading.Thread(
-                target=monitor_output, args=(process.stderr, {})
-            )
+def submit_job(job):
+    """Queue a job and start the pool. Returns a 429 response if the queue is full."""
+    if not job_queue.submit(job):
+        jobs_rejected.inc()
+        queue_depth = job_queue.depth()
+        retry_after = max(1, int(queue_depth * (job_queue.average_duration or 1)))
+        response = jsonify(
+            {
+                "success": False,
+                "message": "Job queue is full, retry later",
+                "queue_depth": queue_depth,
+                "max_queue_size": MAX_QUEUE_SIZE,
+            }
+        )
+        response.headers["Retry-After"] = str(retry_after)
+        return response, 429
+    worker_pool.start()
+    return None
 
-            stdout_thread.daemon = True
-            stderr_thread.daemon = True
-            stdout_thread.start()
-            stderr_thread.start()
 
-            # Wait for process to finish
-            process.wait()
-            stdout_thread.join(timeout=60)
-            stderr_thread.join(timeout=60)
-
-            if process.returncode == 0:
-                # Check for rendered image output
-                for ext in [".jpg", ".png"]:
-                    rendered_path = os.path.join(
-                        option["output_dir"], f"{name_without_ext}_rendered{ext}"
-                    )
-                    if os.path.exists(rendered_path):
-                        if option["disable_blending"]:
-                            outputs["rendered_on_black"].append(rendered_path)
-                        else:
-                            outputs["rendered_on_image"].append(rendered_path)
-                # Check for JSON output
-                json_path = os.path.join(json_dir, f"{name_without_ext}_keypoints.json")
-                if os.path.exists(json_path) and json_path not in outputs["json"]:
-                    outputs["json"].append(json_path)
-            elif process.returncode != 0:
-                stderr_output = (
-                    process.stderr.read() if process.stderr else "No error output"
-                )
-                update_status(
-                    f"OpenPose process failed (code {process.returncode}): {stderr_output}",
-                    100,
-                    False,
-                )
-                print(f"ERROR WITH MODEL {model}: {stderr_output}", flush=True)
-                return False, outputs
-            else:
-                stderr = process.stderr.read()
-                update_status(f"Error during processing: {stderr}", 100, False)
-                return False, outputs
+def queued_response(job, message, options, warnings):
+    """Response for a freshly queued job."""
+    response = {
+        "success": True,
+        "message": message,
+        "job_id": job.job_id,
+        "job": job_snapshot(job),
+        "queue_depth": job_queue.depth(),
+        "status": worker_pool.status(),
+        "options": {
+            key: value for key, value in options.items() if key != "output_dir"
+        },
+    }
 
-        except Exception as e:
-            print(f"EXCEPTION WITH MODEL {model}: {str(e)}", flush=True)
-            update_status(f"Exception during processing: {str(e)}", 100, False)
-            return False, outputs
+    if warnings:
+        response["warnings"] = warnings
 
-    update_status("Processing completed successfully", 100, False)
-    return True, outputs
+    return jsonify(response)
 
 
-@app.route("/process", methods=["POST"])
-def process_request():
-    """API endpoint to process an image with multiple visualization options."""
-    # Check if already processing
-    with status_lock:
-        if processing_status["is_processing"]:
-            return jsonify(
+@app.before_request
+def limit_request_body():
+    """Answer oversized request bodies with 413 before any endpoint reads them."""
+    if (
+        request.content_length is not None
+        and request.content_length > app.config["MAX_CONTENT_LENGTH"]
+    ):
+        return (
+            jsonify(
                 {
                     "success": False,
-                    "message": "Already processing an image",
-                    "status": processing_status,
+                    "message": f"Request body larger than {MAX_UPLOAD_MB} MB",
                 }
-            )
+            ),
+            413,
+        )
+
 
+@app.route("/process", methods=["POST"])
+def process_request():
+    """API endpoint to queue an image for processing with multiple visualization options."""
     try:
         # Get the image path from the request
         data = request.json
         if not data or "image_path" not in data:
             return jsonify({"success": False, "message": "Image path not provided"})
 
-        # Required parameters
         image_path = data["image_path"]
-        output_dir = data.get("output_dir", "/images/output")
+        options, warnings = parse_processing_options(data)
+        check_outputs_requested(options)
+
+        # Validate the paths
+        if not os.path.exists(image_path):
+            return jsonify(
+                {"success": False, "message": f"Image not found: {image_path}"}
+            )
+
+        # Queue the image, the worker pool picks it up
+        # (higher priority jobs are run first)
+        job = Job(
+            dict(options, image_path=image_path),
+            int(data.get("priority", 0)),
+            timeout=job_timeout(data),
+        )
+        rejected = submit_job(job)
+        if rejected:
+            return rejected
+
+        return queued_response(job, "Image queued for processing", options, warnings)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)})
+    except Exception as e:
+        update_status(f"API error: {str(e)}", None, False)
+        return jsonify({"success": False, "message": str(e)})
+
 
-        # Optional visualization parameters
-        model = data.get("model", "BODY_25")
+@app.route("/process_batch", methods=["POST"])
+def process_batch_request():
+    """API endpoint to queue many images as one batch job.
 
-        detect_face = data.get("detect_face", False)
-        detect_hands = data.get("detect_hands", False)
-        detect_feet = data.get("detect_feet", False)
+    Takes either "image_paths" (a list) or "image_dir" plus an optional glob
+    "pattern" (default "*"), and the same options as /process.
+    """
+    try:
+        data = request.json
+        if not data or ("image_paths" not in data and "image_dir" not in data):
+            return jsonify(
+                {"success": False, "message": "image_paths or image_dir not provided"}
+            )
 
-        # Build a warnings array for any potential issues
-        warnings = []
-        # Add model-specific validation warnings
-        if model != "BODY_25" and (detect_face or detect_hands):
-            warning_msg = f"Face and hand detection with {model} model may be unstable. For best results, use BODY_25 model."
-            warnings.append(warning_msg)
-            print(f"WARNING: {warning_msg}", flush=True)
+        if "image_paths" in data:
+            image_paths = list(data["image_paths"])
+        else:
+            pattern = os.path.join(data["image_dir"], data.get("pattern", "*"))
+            image_paths = sorted(
+                path
+                for path in glob.glob(pattern)
+                if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path)
+            )
 
-        # Still reject feet detection with non-BODY_25 models (since this is a technical limitation)
-        if detect_feet and model != "BODY_25":
+        if not image_paths:
+            return jsonify({"success": False, "message": "No images to process"})
+        if len(image_paths) > MAX_BATCH_SIZE:
             return jsonify(
                 {
                     "success": False,
-                    "message": "Feet detection is only available with BODY_25 model",
+                    "message": f"Too many images ({len(image_paths)}), the limit is {MAX_BATCH_SIZE}",
                 }
             )
 
-        render_on_black = data.get("render_on_black", True)
-        render_on_image = data.get("render_on_image", True)
-        write_json = data.get("write_json", True)
-
-        # Rendering thresholds
-        render_threshold = float(data.get("render_threshold", 0.05))
-        face_render_threshold = float(data.get("face_render_threshold", 0.4))
-        hand_render_threshold = float(data.get("hand_render_threshold", 0.2))
-        feet_render_threshold = float(data.get("feet_render_threshold", 0.03))
-        keypoint_scale = int(data.get("keypoint_scale", 0))
-
-        # Validate model selection
-        if model not in ["BODY_25", "COCO", "MPI"]:
+        # Validate the paths
+        missing = [path for path in image_paths if not os.path.isfile(path)]
+        if missing:
             return jsonify(
                 {
                     "success": False,
-                    "message": f"Invalid model: {model}. Must be one of: BODY_25, COCO, MPI",
+                    "message": f"{len(missing)} image(s) not found: {missing[:5]}",
                 }
             )
 
-        # Check if model files exist
-        model_dir = f"/openpose/models/pose/{model.lower()}"
-        if not os.path.exists(model_dir):
+        options, warnings = parse_processing_options(data)
+        check_outputs_requested(options)
+        if options["keypoint_scale"] not in (0, 3, 4):
+            raise ValueError("keypoint_scale 1 and 2 are not supported for batches")
+        # Faces and hands only looked for on images with a body, if asked
+        options["gate_face_hands"] = bool(data.get("gate_face_hands", False))
+
+        job = Job(
+            dict(options, image_paths=image_paths),
+            int(data.get("priority", 0)),
+            kind="batch",
+            timeout=job_timeout(data),
+        )
+        rejected = submit_job(job)
+        if rejected:
+            return rejected
+
+        return queued_response(
+            job, f"Batch of {len(image_paths)} images queued", options, warnings
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)})
+    except Exception as e:
+        update_status(f"API error: {str(e)}", None, False)
+        return jsonify({"success": False, "message": str(e)})
+
+
+@app.route("/process_video", methods=["POST"])
+def process_video_request():
+    """API endpoint to queue a video, or a sequence of frame images, as one job.
+
+    Takes "video_path", or "image_paths" / "image_dir" plus a glob "pattern"
+    (frames in file name order), the frame range ("frame_first",
+    "frame_last", "frame_step"), "number_people_max", adaptive sampling
+    ("adaptive", "keyframe_stride", "motion_threshold") and the keypoint
+    options of /process. Keypoints are streamed per frame at /jobs/<id>/frames.
+    """
+    try:
+        data = request.json
+        if not data or not (
+            "video_path" in data or "image_paths" in data or "image_dir" in data
+        ):
             return jsonify(
-                {"success": False, "message": f"Model directory not found: {model_dir}"}
+                {
+                    "success": False,
+                    "message": "video_path, image_paths or image_dir not provided",
+                }
             )
 
-        # For COCO specifically, we need to use the correct prototxt file
-        if model == "COCO":
-            if not os.path.exists(f"{model_dir}/pose_deploy_linevec.prototxt"):
+        video_path = data.get("video_path")
+        image_paths = None
+        if video_path:
+            if not os.path.isfile(video_path):
+                return jsonify(
+                    {"success": False, "message": f"Video not found: {video_path}"}
+                )
+        elif "image_paths" in data:
+            image_paths = list(data["image_paths"])
+        else:
+            pattern = os.path.join(data["image_dir"], data.get("pattern", "*"))
+            image_paths = sorted(
+                path
+                for path in glob.glob(pattern)
+                if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path)
+            )
+        if image_paths is not None:
+            if not image_paths:
+                return jsonify({"success": False, "message": "No frames to process"})
+            missing = [path for path in image_paths if not os.path.isfile(path)]
+            if missing:
                 return jsonify(
                     {
                         "success": False,
-                        "message": f"Required prototxt file for {model} not found",
+                        "message": f"{len(missing)} frame(s) not found: {missing[:5]}",
                     }
                 )
 
-        # Validate the paths
-        if not os.path.exists(image_path):
-            return jsonify(
-                {"success": False, "message": f"Image not found: {image_path}"}
+        frame_first = int(data.get("frame_first", 0))
+        frame_last = int(data.get("frame_last", -1))
+        frame_step = int(data.get("frame_step", 1))
+        number_people_max = int(data.get("number_people_max", -1))
+        if frame_first < 0:
+            raise ValueError("frame_first must be 0 or more")
+        if frame_last != -1 and frame_last < frame_first:
+            raise ValueError("frame_last must be -1 (the last frame) or >= frame_first")
+        if frame_step < 1:
+            raise ValueError("frame_step must be 1 or more")
+        if number_people_max != -1 and number_people_max < 1:
+            raise ValueError("number_people_max must be -1 (no limit) or 1 or more")
+        sampling = None
+        if data.get("adaptive", False):
+            sampling = {
+                "max_stride": int(data.get("keyframe_stride", DEFAULT_KEYFRAME_STRIDE)),
+                "motion_threshold": float(
+                    data.get("motion_threshold", DEFAULT_MOTION_THRESHOLD)
+                ),
+            }
+            if not 2 <= sampling["max_stride"] <= MAX_KEYFRAME_STRIDE:
+                raise ValueError(
+                    f"keyframe_stride must be between 2 and {MAX_KEYFRAME_STRIDE}"
+                )
+            if sampling["motion_threshold"] <= 0:
+                raise ValueError("motion_threshold must be positive")
+        if video_path:
+            frames_total, _ = video_frames(
+                video_path, frame_first, frame_last, frame_step
+            )
+        else:
+            frames_total = len(range(frame_first, len(image_paths), frame_step))
+            if frame_last != -1:
+                frames_total = len(
+                    range(
+                        frame_first, min(frame_last + 1, len(image_paths)), frame_step
+                    )
+                )
+            if not frames_total:
+                raise ValueError("No frames in the requested range")
+
+        options, warnings = parse_processing_options(data)
+        if options["keypoint_scale"] not in (0, 3, 4):
+            raise ValueError("keypoint_scale 1 and 2 are not supported for videos")
+        if data.get("render_on_black") or data.get("render_on_image"):
+            warnings.append("Video jobs only write keypoints, rendering is ignored")
+        if options["keypoint_format"] != "json":
+            warnings.append("Video keypoints are always written as NDJSON")
+        if sampling and not WarmWorker.available:
+            warnings.append(
+                "Adaptive sampling needs the warm worker, every frame is inferred"
             )
+        video_options = {
+            key: options[key]
+            for key in [
+                "output_dir",
+                "model",
+                "detect_face",
+                "detect_hands",
+                "detect_feet",
+                "keypoint_scale",
+                "net_resolution",
+                "scale_number",
+                "scale_gap",
+            ]
+        }
+        video_options.update(
+            video_path=video_path,
+            image_paths=image_paths,
+            name=data.get("name"),
+            fps=float(data["fps"]) if data.get("fps") else None,
+            frame_first=frame_first,
+            frame_last=frame_last,
+            frame_step=frame_step,
+            number_people_max=number_people_max,
+            sampling=sampling,
+        )
 
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir, exist_ok=True)
+        job = Job(
+            video_options,
+            int(data.get("priority", 0)),
+            kind="video",
+            timeout=job_timeout(data),
+        )
+        rejected = submit_job(job)
+        if rejected:
+            return rejected
 
-        # Check for model+feet compatibility BEFORE starting the thread
-        if detect_feet and model != "BODY_25":
-            return jsonify(
-                {
-                    "success": False,
-                    "message": "Feet detection is only available with BODY_25 model",
-                }
+        return queued_response(
+            job,
+            f"Video of {frames_total or 'an unknown number of'} frames queued",
+            video_options,
+            warnings,
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)})
+    except Exception as e:
+        update_status(f"API error: {str(e)}", None, False)
+        return jsonify({"success": False, "message": str(e)})
+
+
+@app.route("/infer", methods=["POST"])
+def infer_request():
+    """API endpoint that runs inference on an uploaded image and waits for the result.
+
+    The image is sent as the multipart field "image" or as the raw request
+    body, with options as form fields or query arguments. Nothing is written
+    to disk unless output_dir is given.
+    """
+    try:
+        upload = request.files.get("image")
+        if upload is not None:
+            image_data = upload.read()
+            default_name = upload.filename
+        else:
+            image_data = request.get_data()
+            default_name = None
+        if not image_data:
+            return (
+                jsonify({"success": False, "message": "Image data not provided"}),
+                400,
             )
 
-        # Process the image in a separate thread
-        threading.Thread(
-            target=process_image,
-            args=(
-                image_path,
-                output_dir,
-                model,
-                detect_face,
-                detect_hands,
-                detect_feet,
-                write_json,
-                render_on_black,
-                render_on_image,
-                render_threshold,
-                face_render_threshold,
-                hand_render_threshold,
-                feet_render_threshold,
-                keypoint_scale,
-            ),
-        ).start()
+        # Decode in memory, the upload is never written to disk as is
+        image = cv2.imdecode(
+            np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR
+        )
+        if image is None:
+            return (
+                jsonify({"success": False, "message": "Could not decode the image"}),
+                400,
+            )
 
-        response = {
-            "success": True,
-            "message": "Image processing started",
-            "status": processing_status,
-            "options": {
-                "model": model,
-                "detect_face": detect_face,
-                "detect_hands": detect_hands,
-                "detect_feet": detect_feet,
-                "render_on_black": render_on_black,
-                "render_on_image": render_on_image,
-                "write_json": write_json,
-                "render_threshold": render_threshold,
-                "face_render_threshold": face_render_threshold,
-                "hand_render_threshold": hand_render_threshold,
-                "feet_render_threshold": feet_render_threshold,
-                "keypoint_scale": keypoint_scale,
-            },
-        }
+        data = form_options(request.values)
+        data.setdefault("render_on_black", False)
+        data.setdefault("render_on_image", False)
+        options, warnings = parse_processing_options(data, default_output_dir=None)
+        if options["keypoint_scale"] not in (0, 3, 4):
+            raise ValueError("keypoint_scale 1 and 2 are not supported by /infer")
+        name = data.get("name") or default_name
+        if name:
+            name = os.path.splitext(os.path.basename(name))[0]
+
+        job = Job(
+            dict(options, image=image, image_data=image_data, name=name),
+            int(data.get("priority", 0)),
+            kind="infer",
+            timeout=job_timeout(data, INFER_TIMEOUT),
+        )
+        rejected = submit_job(job)
+        if rejected:
+            return rejected
+
+        if not job.finished.wait(INFER_TIMEOUT):
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": f"No result within {INFER_TIMEOUT:.0f}s, "
+                        "check /jobs/<job_id>",
+                        "job_id": job.job_id,
+                    }
+                ),
+                504,
+            )
+
+        with status_lock:
+            result = job.response
+            job.response = None  # the caller has it, free the memory
+            job.options["image"] = job.options["image_data"] = None
+            message = job.status_message
+            outputs = job.outputs
+        if not job.success or result is None:
+            return (
+                jsonify({"success": False, "message": message, "job_id": job.job_id}),
+                500,
+            )
 
+        response = {"success": True, "job_id": job.job_id}
+        response.update(result)
+        for key in [
+            "rendered_on_black",
+            "rendered_on_image",
+            *THUMBNAIL_KINDS.values(),
+        ]:
+            if key in response:
+                response[key] = base64.b64encode(response[key].tobytes()).decode(
+                    "ascii"
+                )
+                response["render_format"] = options["encoding"]["output_format"]
+        if options["output_dir"]:
+            response["outputs"] = outputs
         if warnings:
             response["warnings"] = warnings
-
         return jsonify(response)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         update_status(f"API error: {str(e)}", None, False)
-        return jsonify({"success": False, "message": str(e)})
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """API endpoint to get the state and outputs of one job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Unknown job: {job_id}"}), 404
+    # Batch clients can fetch only the results they have not seen yet
+    results_since = int(request.args.get("results_since", 0))
+    return jsonify(job_snapshot(job, results_since))
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def stream_job_events(job_id):
+    """Stream a job's progress, status messages and final result as they happen.
+
+    Server-Sent Events by default; NDJSON (one event per line) with
+    ?format=ndjson or "Accept: application/x-ndjson". The stream ends with the
+    "done" event. SSE clients resume with Last-Event-ID, NDJSON clients
+    with ?since=<event id>.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Unknown job: {job_id}"}), 404
+
+    ndjson = (
+        request.args.get("format") == "ndjson"
+        or request.accept_mimetypes.best == "application/x-ndjson"
+    )
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id is not None:
+        first_id = int(last_event_id) + 1
+    else:
+        first_id = int(request.args.get("since", 0))
+
+    def generate():
+        event_id = first_id
+        # Tell the client where the job stands before waiting for new events
+        yield format_event(
+            {"id": None, "type": "snapshot", "job": job_snapshot(job)}, ndjson
+        )
+        while True:
+            with job_events:
+                events = job.events_since(event_id)
+                if not events and not job.is_finished():
+                    job_events.wait(EVENT_KEEPALIVE)
+                    events = job.events_since(event_id)
+                finished = job.is_finished()
+            if not events and finished:
+                return
+            if not events:
+                yield "\n" if ndjson else ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield format_event(event, ndjson)
+                event_id = event["id"] + 1
+                if event["type"] == "done":
+                    return
+
+    mimetype = "application/x-ndjson" if ndjson else "text/event-stream"
+    response = Response(generate(), mimetype=mimetype)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # don't buffer behind nginx
+    return response
+
+
+@app.route("/jobs/<job_id>/frames", methods=["GET"])
+def stream_job_frames(job_id):
+    """Stream the per-frame keypoints of a video job as NDJSON.
+
+    Frames are sent as they come out of OpenPose, and the stream ends once
+    the job is finished. ?since=N skips the first N frames.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Unknown job: {job_id}"}), 404
+    if job.kind != "video":
+        return jsonify({"success": False, "message": "Not a video job"}), 400
+    skip = int(request.args.get("since", 0))
+
+    def generate():
+        frames_file = None
+        partial = ""
+        skipped = 0
+
+        def wait_for_job(path):
+            """Wait for an event of the job (or, with no file open yet, a new
+            path than path). False if nothing happened within EVENT_KEEPALIVE."""
+            with job_events:
+                if job.is_finished():
+                    return True
+                if frames_file is None and job.frames_path != path:
+                    return True
+                return job_events.wait(EVENT_KEEPALIVE)
+
+        try:
+            while True:
+                with job_events:
+                    path = job.frames_path
+                    finished = job.is_finished()
+                if frames_file is None and path is not None:
+                    try:
+                        frames_file = open(path, "r")
+                    except OSError:
+                        if finished:
+                            return  # removed, nothing more to send
+                        # Published (moved) just now, the job has the new path
+                        if not wait_for_job(path):
+                            yield "\n"
+                        continue
+                lines = []
+                if frames_file is not None:
+                    for line in frames_file:
+                        line = partial + line
+                        partial = ""
+                        if not line.endswith("\n"):
+                            partial = line  # still being written
+                            break
+                        if skipped < skip:
+                            skipped += 1
+                            continue
+                        lines.append(line)
+                if lines:
+                    yield "".join(lines)
+                    continue
+                if finished:
+                    return
+                if not wait_for_job(path):
+                    yield "\n"
+        finally:
+            if frames_file is not None:
+                frames_file.close()
+
+    response = Response(generate(), mimetype="application/x-ndjson")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/jobs/<job_id>/log", methods=["GET"])
+def get_job_log(job_id):
+    """API endpoint with the output OpenPose wrote while running a job.
+
+    ?lines=N returns only the last N lines, ?stream=stdout or stderr only
+    the lines of that stream, ?since=N the lines numbered N or later, and
+    ?format=text the lines as plain text.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Unknown job: {job_id}"}), 404
+    stream = request.args.get("stream")
+    if stream not in (None, "stdout", "stderr"):
+        return (
+            jsonify({"success": False, "message": "stream must be stdout or stderr"}),
+            400,
+        )
+    try:
+        count = request.args.get("lines")
+        count = int(count) if count is not None else None
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        return (
+            jsonify({"success": False, "message": "lines and since must be numbers"}),
+            400,
+        )
+
+    lines = job.log.tail(count, stream, since)
+    if request.args.get("format") == "text":
+        text = "".join(entry["line"] + "\n" for entry in lines)
+        return Response(text, mimetype="text/plain")
+    with status_lock:
+        state = job.state
+        message = job.status_message
+    return jsonify(
+        {
+            "success": True,
+            "job_id": job.job_id,
+            "state": state,
+            "status_message": message,
+            "total_lines": job.log.total,
+            "dropped_lines": job.log.dropped(),
+            "lines": lines,
+        }
+    )
+
+
+def format_event(event, ndjson):
+    """One event in SSE or NDJSON framing."""
+    data = json.dumps(event)
+    if ndjson:
+        return data + "\n"
+    lines = []
+    if event.get("id") is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
 
 
 # [BASIC]
@@ -485,246 +4355,359 @@ def process_request():
 
 @app.route("/status", methods=["GET"])
 def get_status():
-    """API endpoint to get the current processing status and comprehensive output files."""
+    """API endpoint to get the current processing status.
+
+    Served from memory: outputs and keypoint_stats are computed once when a
+    job finishes, and liveness comes from the workers' process handles.
+    """
     # Optional check to verify if process is still running
     check_process = request.args.get("check_process", "false").lower() == "true"
-    feet_render_threshold = 0.03  # Define here for feet detection checks
 
-    with status_lock:
-        status_copy = dict(processing_status)
+    status_copy = worker_pool.status()
+    status_copy["queue_depth"] = job_queue.depth()
+    status_copy["cache"] = result_cache.stats()
+    status_copy["models"] = worker_pool.residency()
 
     # If requested and processing is ongoing, check if process is still alive
     if check_process and status_copy.get("is_processing", False):
-        try:
-            # Check if any OpenPose processes are running
-            result = subprocess.run(
-                ["pgrep", "-f", "openpose.bin"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            if result.returncode != 0:
-                # No OpenPose processes found, but status says still processing
-                # This means the process might have crashed
-                with status_lock:
-                    processing_status["is_processing"] = False
-                    processing_status["status_message"] = (
+        with status_lock:
+            for worker in worker_pool.workers:
+                if not worker.status["is_processing"]:
+                    continue
+                handle = worker.process_handle
+                # A process that exited with an error, or a worker thread that
+                # died, will never update the status again
+                crashed = not worker.thread.is_alive() or (
+                    handle is not None and handle.poll() not in (None, 0)
+                )
+                if crashed:
+                    worker.status["is_processing"] = False
+                    worker.status["status_message"] = (
                         "Process may have crashed or completed without updating status"
                     )
-                    processing_status["progress"] = 100
-                status_copy = dict(processing_status)
-        except Exception as e:
-            status_copy["status_error"] = str(e)
-
-    # Always check for outputs, whether processing is complete or not
-    if status_copy.get("current_image"):
-        image_path = status_copy["current_image"]
-        base_output_dir = "/images/output"  # Base output directory
-
-        image_basename = os.path.basename(image_path)
-        name_without_ext = os.path.splitext(image_basename)[0]
+                    worker.status["progress"] = 100
+        status_copy = worker_pool.status()
+        status_copy["queue_depth"] = job_queue.depth()
+        status_copy["cache"] = result_cache.stats()
+        status_copy["models"] = worker_pool.residency()
 
-        # Define output directories
-        output_dirs = {
-            "black_bg": os.path.join(base_output_dir, "black_bg"),
-            "on_image": os.path.join(base_output_dir, "on_image"),
-            "json": os.path.join(base_output_dir, "json"),
-        }
-
-        # Initialize outputs collection
-        outputs = {
-            "rendered_on_black": [],
-            "rendered_on_image": [],
-            "json": [],
-        }
-
-        # Check for rendered images on black background
-        for ext in [".jpg", ".png"]:
-            img_path = os.path.join(
-                output_dirs["black_bg"], f"{name_without_ext}_rendered{ext}"
-            )
-            if os.path.exists(img_path):
-                outputs["rendered_on_black"].append(img_path)
+    # Outputs and keypoint_stats of the current (or last finished) job
+    job = job_queue.get(
+        status_copy.get("current_job_id") or status_copy.get("last_job_id")
+    )
+    if job is not None:
+        with status_lock:
+            outputs = job.outputs
+            stats = job.keypoint_stats
+        if outputs and any(len(v) > 0 for v in outputs.values()):
+            status_copy["outputs"] = outputs
+        if stats is not None:
+            status_copy["keypoint_stats"] = stats
 
-        # Check for rendered images on original image
-        for ext in [".jpg", ".png"]:
-            img_path = os.path.join(
-                output_dirs["on_image"], f"{name_without_ext}_rendered{ext}"
+    # Add additional status information
+    if status_copy.get("is_processing", False):
+        if status_copy.get("progress", 0) < 75:
+            status_copy["estimated_completion"] = "Processing image, no outputs yet..."
+        else:
+            status_copy["estimated_completion"] = (
+                "Inference complete, rendering outputs..."
             )
-            if os.path.exists(img_path):
-                outputs["rendered_on_image"].append(img_path)
 
-        # Check for JSON keypoints
-        json_path = os.path.join(
-            output_dirs["json"], f"{name_without_ext}_keypoints.json"
-        )
-        if os.path.exists(json_path):
-            outputs["json"].append(json_path)
+    return jsonify(status_copy)
 
-        # Add outputs to status - even if they're partial
-        if any(len(v) > 0 for v in outputs.values()):
-            status_copy["outputs"] = outputs
 
-        # Add processing information if JSON is available
-        if len(outputs["json"]) > 0:
-            try:
-                with open(outputs["json"][0], "r") as f:
-                    keypoints_data = json.load(f)
-
-                # Extract basic info
-                num_people = len(keypoints_data.get("people", []))
-
-                # Add keypoint statistics to status
-                keypoint_stats = {
-                    "num_people_detected": num_people,
-                    "has_face_keypoints": False,
-                    "has_hand_keypoints": False,
-                    "has_feet_keypoints": False,
-                    "model_used": "unknown",
-                }
+@app.route("/ready", methods=["GET"])
+def get_ready():
+    """Readiness: 200 once every preload model is warm, 503 until then.
 
-                # Check if any people were detected and extract more detailed info
-                if num_people > 0:
-                    person = keypoints_data["people"][0]
-                    keypoint_stats["has_face_keypoints"] = "face_keypoints_2d" in person
-                    keypoint_stats["has_hand_keypoints"] = (
-                        has_valid_keypoints(person.get("hand_left_keypoints_2d", [])) or
-                        has_valid_keypoints(person.get("hand_right_keypoints_2d", []))
-                    )
+    Also starts the workers (and so the preloading) if the server did not,
+    e.g. when the app is served by an external WSGI server.
+    """
+    worker_pool.start()
+    readiness = worker_pool.readiness()
+    readiness["warmup_image"] = WARMUP_IMAGE
+    return jsonify(readiness), 200 if readiness["ready"] else 503
 
-                    if "pose_keypoints_2d" in person:
-                        body_keypoints = np.array(person["pose_keypoints_2d"]).reshape(
-                            -1, 3
-                        )
-                        # Check if any foot keypoints (19-24) have confidence > threshold
-                        if len(body_keypoints) >= 25:  # BODY_25 model
-                            foot_indices = [19, 20, 21, 22, 23, 24]
-                            keypoint_stats["has_feet_keypoints"] = any(
-                                body_keypoints[idx, 2] > feet_render_threshold
-                                for idx in foot_indices
-                                if idx < len(body_keypoints)
-                            )
 
-                    # Determine model based on number of body keypoints
-                    body_keypoints = np.array(
-                        person.get("pose_keypoints_2d", [])
-                    ).reshape(-1, 3)
-                    num_keypoints = len(body_keypoints)
-
-                    if num_keypoints == 25:
-                        keypoint_stats["model_used"] = "BODY_25"
-                    elif num_keypoints == 18:
-                        keypoint_stats["model_used"] = "COCO"
-                    elif num_keypoints == 15:
-                        keypoint_stats["model_used"] = "MPI"
-
-                    # Add model-specific keypoint information
-                    if keypoint_stats["model_used"] == "BODY_25":
-                        # Body_25 specific processing
-                        # (feet detection already handled above)
-                        pass
-                    elif keypoint_stats["model_used"] == "COCO":
-                        # COCO specific keypoint mappings/processing
-                        keypoint_stats["coco_specific_info"] = (
-                            "COCO model has 18 keypoints"
-                        )
-                    elif keypoint_stats["model_used"] == "MPI":
-                        # MPI specific keypoint mappings/processing
-                        keypoint_stats["mpi_specific_info"] = (
-                            "MPI model has 15 keypoints"
-                        )
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Prometheus metrics: job, queue and stage timings, worker usage and outputs."""
+    now = time.time()
+    uptime = max(now - worker_pool.created_at, 1e-9)
+    busy = 0
+    with status_lock:
+        for worker in worker_pool.workers:
+            seconds = worker.busy_seconds
+            if worker.current_job is not None:
+                seconds += now - worker.current_job.started_at
+                busy += 1
+            worker_busy_seconds.set_total(seconds, worker=worker.worker_id)
+            worker_busy_ratio.set(seconds / uptime, worker=worker.worker_id)
+    workers_busy.set(busy)
+    queue_depth_gauge.set(job_queue.depth())
 
-                status_copy["keypoint_stats"] = keypoint_stats
+    cache = result_cache.stats()
+    cache_lookups.set_total(cache["hits"], result="hit")
+    cache_lookups.set_total(cache["misses"], result="miss")
+    cache_bytes.set(cache["bytes"])
+    resident_model_bytes.set(worker_pool.residency()["resident_mb"] * 1024 * 1024)
 
-            except Exception as e:
-                status_copy["keypoint_stats_error"] = str(e)
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
-    # Add additional status information
-    if status_copy.get("is_processing", False):
-        status_copy["estimated_completion"] = "Checking for output files..."
-        if "outputs" in status_copy:
-            if status_copy["outputs"]["json"]:
-                status_copy["estimated_completion"] = (
-                    "JSON output complete, finalizing processing..."
-                )
-            elif (
-                status_copy["outputs"]["rendered_on_black"]
-                or status_copy["outputs"]["rendered_on_image"]
-            ):
-                status_copy["estimated_completion"] = (
-                    "Renderings complete, generating JSON output..."
-                )
-            else:
-                status_copy["estimated_completion"] = (
-                    "Processing image, no outputs yet..."
-                )
 
-    return jsonify(status_copy)
+@app.route("/calibration", methods=["GET"])
+def get_calibration():
+    """Measured inference times per model and network settings (ms)."""
+    return jsonify(calibration.to_dict())
 
 
 @app.route("/stop", methods=["POST"])
 def stop_processing():
-    """API endpoint to stop the current image processing."""
-    global process_handle
+    """API endpoint to stop running jobs.
 
-    print(
-        f"STOP requested. Current process_handle: {process_handle}, is_processing: {processing_status['is_processing']}",
-        flush=True,
-    )
+    Stops every running job, or only the one given by "job_id" / "worker_id"
+    in the request body.
+    """
+    data = request.get_json(silent=True) or {}
+    job_id = data.get("job_id")
+    worker_id = data.get("worker_id")
+    if worker_id is not None:
+        try:
+            worker_id = int(worker_id)
+        except (TypeError, ValueError):
+            return (
+                jsonify({"success": False, "message": "worker_id must be a number"}),
+                400,
+            )
 
     # First check if we're processing anything
     with status_lock:
-        is_processing = processing_status["is_processing"]
-        if not is_processing:
-            return jsonify(
-                {"success": False, "message": "No active processing to stop"}
+        targets = [
+            worker
+            for worker in worker_pool.workers
+            if worker.status["is_processing"]
+            and (worker_id is None or worker.worker_id == worker_id)
+            and (
+                job_id is None
+                or (worker.current_job and worker.current_job.job_id == job_id)
             )
+        ]
+        for worker in targets:
+            if worker.current_job is not None:
+                worker.current_job.stop_requested = True
+
+    print(
+        f"STOP requested. Workers to stop: {[worker.worker_id for worker in targets]}",
+        flush=True,
+    )
 
-    # Get local reference to the process handle outside the lock
-    local_process = process_handle
+    if not targets:
+        return jsonify({"success": False, "message": "No active processing to stop"})
+
+    # Get local references to the process handles outside the lock
+    processes = {}
+    jobs = {worker: worker.current_job for worker in targets}
+    for worker in targets:
+        if worker.process_handle is None:
+            update_status("No process found to stop", 100, False, worker=worker)
+        else:
+            processes[worker] = worker.process_handle
 
     # If we have no process to stop
-    if local_process is None:
-        update_status("No process found to stop", 100, False)
+    if not processes:
         return jsonify(
             {"success": False, "message": "Process information missing, cannot stop"}
         )
 
-    # Try to terminate the process
+    # Try to terminate the processes
     try:
-        update_status("Stopping process...", None, None)
-
-        # Terminate and wait briefly outside the lock
-        local_process.terminate()
-        time.sleep(1)
-
-        # Force kill if still running
-        if local_process.poll() is None:
-            local_process.kill()
-
-        # Reset the process handle
-        process_handle = None
-
-        # Update the status
-        update_status("Processing stopped by user", 100, False)
+        terminate_processes(processes, jobs)
 
         return jsonify(
             {
                 "success": True,
                 "message": "Processing stopped",
-                "status": processing_status,
+                "stopped_workers": [worker.worker_id for worker in processes],
+                "status": worker_pool.status(),
             }
         )
 
     except Exception as e:
-        # Make sure we release the process even on error
-        process_handle = None
-        update_status(f"Error while stopping: {str(e)}", 100, False)
+        # Make sure we release the processes even on error
+        for worker in processes:
+            worker.process_handle = None
+            update_status(f"Error while stopping: {str(e)}", 100, False, worker=worker)
 
         return jsonify(
             {"success": False, "message": f"Error stopping process: {str(e)}"}
         )
 
 
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    """API endpoint to cancel a job by ID.
+
+    A queued job is taken off the queue and never runs. A running job is
+    stopped like /stop does, without waiting for its process to exit.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": f"Unknown job: {job_id}"}), 404
+
+    if job_queue.cancel(job):
+        with status_lock:
+            job.stop_requested = True
+            job.state = "stopped"
+            job.success = False
+            job.finished_at = time.time()
+            job.update("Cancelled before it started", 100)
+            job.record_event("done", job=job.to_dict())
+        job.finished.set()
+        jobs_finished.inc(kind=job.kind, state=job.state)
+        return jsonify(
+            {"success": True, "message": "Job cancelled", "job": job_snapshot(job)}
+        )
+
+    with status_lock:
+        if job.is_finished():
+            finished = True
+        else:
+            finished = False
+            job.stop_requested = True
+            worker = job.worker
+            if worker is not None and worker.current_job is not job:
+                # Moved on while the job's outputs are encoded (see run_job)
+                worker = None
+    if finished:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "message": f"Job already finished ({job.state})",
+                    "job": job_snapshot(job),
+                }
+            ),
+            409,
+        )
+
+    # Between the queue and its worker the job stops itself, see run_job()
+    if worker is not None:
+        stop_workers([worker], "Job cancelled")
+    return (
+        jsonify({"success": True, "message": "Stopping job", "job": job_snapshot(job)}),
+        202,
+    )
+
+
+def stop_workers(workers, message):
+    """Terminate the processes of workers whose jobs are to stop, without
+    waiting for them (see reap_stopped_processes)."""
+    processes = {}
+    jobs = {}
+    for worker in workers:
+        with status_lock:
+            jobs[worker] = worker.current_job
+        if worker.process_handle is not None:
+            processes[worker] = worker.process_handle
+    terminate_processes(processes, jobs, message)
+
+
+def terminate_processes(processes, jobs, message="Processing stopped by user"):
+    """Ask processes ({worker: process}) to exit and have the ones still
+    running after the grace period killed, off the calling thread."""
+    for worker, local_process in processes.items():
+        update_status("Stopping process...", None, None, worker=worker)
+        local_process.terminate()
+
+    threading.Thread(
+        target=reap_stopped_processes, args=(processes, jobs, message), daemon=True
+    ).start()
+
+
+def reap_stopped_processes(processes, jobs, message="Processing stopped by user"):
+    """Kill stopped processes ({worker: process}) that outlive the grace period.
+
+    Once their jobs ({worker: job}) have wound down, the workers report the
+    stop with message.
+    """
+    deadline = time.time() + STOP_GRACE_PERIOD
+    for worker, local_process in processes.items():
+        try:
+            local_process.wait(timeout=max(deadline - time.time(), 0))
+        except subprocess.TimeoutExpired:
+            local_process.kill()
+            local_process.wait()
+        if worker.process_handle is local_process:
+            worker.process_handle = None
+
+    for worker in processes:
+        job = jobs.get(worker)
+        if job is not None:
+            job.finished.wait(STOP_GRACE_PERIOD)
+        # Unless the worker has moved on to another job already
+        with status_lock:
+            idle = worker.current_job is None
+        if idle:
+            update_status(message, 100, False, worker=worker)
+
+
+def serve():
+    """Serve the API with HTTP_SERVER.
+
+    gunicorn runs a single gthread worker: the job queue, worker pool and
+    result cache index are in-process state, so requests are spread over
+    threads rather than processes. Request bodies are limited to
+    MAX_UPLOAD_MB by Flask under either server. The workers start, and
+    preload their models, in the process that serves requests.
+    """
+    server = HTTP_SERVER
+    if server == "auto":
+        server = "gunicorn" if importlib.util.find_spec("gunicorn") else "flask"
+    if server == "flask":
+        print("Serving with the Flask development server", flush=True)
+        worker_pool.start()
+        app.run(host="0.0.0.0", port=API_PORT, threaded=True)
+        return
+    if server != "gunicorn":
+        raise SystemExit(
+            f"Invalid OPENPOSE_SERVER: {server}. Must be gunicorn, flask or auto"
+        )
+
+    from gunicorn.app.base import BaseApplication
+
+    class GunicornServer(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"0.0.0.0:{API_PORT}",
+                "workers": 1,
+                "worker_class": "gthread",
+                "threads": HTTP_THREADS,
+                "keepalive": HTTP_KEEPALIVE,
+                # Long requests (/infer, event streams) run in threads and do
+                # not stall the worker's heartbeat, a hung worker does
+                "timeout": int(INFER_TIMEOUT) + 60,
+                # Queued jobs are not drained on shutdown either, so in-flight
+                # requests (and idle keep-alive connections, which gunicorn
+                # also waits for) only get a short grace period, well within
+                # docker stop's
+                "graceful_timeout": 5,
+            }
+            for name, value in settings.items():
+                self.cfg.set(name, value)
+
+        def load(self):
+            # Runs in the gunicorn worker process: start preloading there
+            worker_pool.start()
+            return app
+
+    print(
+        f"Serving with gunicorn ({HTTP_THREADS} threads, "
+        f"{HTTP_KEEPALIVE}s keep-alive)",
+        flush=True,
+    )
+    GunicornServer().run()
+
+
 if __name__ == "__main__":
     print("Starting OpenPose API Server...", flush=True)
-    app.run(host="0.0.0.0", port=2500)
+    serve()
@@ -0,0 +1,249 @@
+"""Content-addressed cache of OpenPose results.
+
+Results (keypoint JSON and renders) are stored on disk under a key made from
+the hash of the image bytes and the normalized processing options, so
+resubmitting the same image with the same options skips OpenPose entirely.
+Entries are evicted least recently used first once the cache holds more than
+max_entries entries or max_bytes bytes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Options that change what a result looks like, with their normalizers
+KEY_OPTIONS = {
+    "model": str,
+    "detect_face": bool,
+    "detect_hands": bool,
+    "detect_feet": bool,
+    "render_on_black": bool,
+    "render_on_image": bool,
+    "render_threshold": float,
+    "face_render_threshold": float,
+    "hand_render_threshold": float,
+    "feet_render_threshold": float,
+    "keypoint_scale": int,
+    "net_resolution": str,
+    "scale_number": int,
+    "scale_gap": float,
+    "face_hand_gate": float,
+    "output_format": str,
+    "output_quality": int,
+    "png_compression": int,
+    "thumbnail_size": int,
+}
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_bytes(data):
+    """SHA-256 of in-memory image bytes (same digest as hash_file)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_options(options):
+    """The subset of options that affects a result, in canonical form."""
+    normalized = {
+        key: convert(options[key])
+        for key, convert in KEY_OPTIONS.items()
+        if options.get(key) is not None
+    }
+    if not normalized.get("detect_feet"):
+        # Only used when feet are detected
+        normalized.pop("feet_render_threshold", None)
+    if not normalized.get("detect_face"):
+        normalized.pop("face_render_threshold", None)
+    if not normalized.get("detect_hands"):
+        normalized.pop("hand_render_threshold", None)
+    if not normalized.get("detect_face") and not normalized.get("detect_hands"):
+        normalized.pop("face_hand_gate", None)
+    # Encoding settings only matter for the renders, and only their own format's
+    if not normalized.get("render_on_black") and not normalized.get("render_on_image"):
+        for key in [
+            "output_format",
+            "output_quality",
+            "png_compression",
+            "thumbnail_size",
+        ]:
+            normalized.pop(key, None)
+    elif normalized.get("output_format", "png") == "png":
+        normalized.pop("output_quality", None)
+    else:
+        normalized.pop("png_compression", None)
+    if not normalized.get("thumbnail_size"):
+        normalized.pop("thumbnail_size", None)
+    return normalized
+
+
+def cache_key(image_hash, options):
+    """Key of the result of processing an image (by hash) with options."""
+    canonical = json.dumps(normalize_options(options), sort_keys=True)
+    return hashlib.sha256(f"{image_hash}:{canonical}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """LRU cache of result files, bounded by entry count and total size."""
+
+    def __init__(self, root, max_bytes, max_entries):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> size in bytes, oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+            self.load_index()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def load_index(self):
+        """Rebuild the LRU order from the entries left on disk (by mtime)."""
+        found = []
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                size = sum(
+                    os.path.getsize(os.path.join(entry_dir, name))
+                    for name in os.listdir(entry_dir)
+                )
+                found.append((os.path.getmtime(entry_dir), key, size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        with self.lock:
+            self.evict()
+
+    def lookup(self, key, targets):
+        """Copy a cached result to targets ({kind: path}).
+
+        Returns True on a hit, i.e. if every requested kind was cached.
+        """
+        if not self.enabled:
+            return False
+        with self.lock:
+            entry_dir = self.entry_dir(key)
+            if key not in self.entries or not all(
+                os.path.exists(os.path.join(entry_dir, kind)) for kind in targets
+            ):
+                self.misses += 1
+                return False
+            for kind, path in targets.items():
+                partial_path = f"{path}.partial"
+                shutil.copyfile(os.path.join(entry_dir, kind), partial_path)
+                os.replace(partial_path, path)
+            self.touch(key)
+            self.hits += 1
+            return True
+
+    def load(self, key, kinds):
+        """Return {kind: bytes} of a cached result, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry_dir = self.entry_dir(key)
+            if key not in self.entries or not all(
+                os.path.exists(os.path.join(entry_dir, kind)) for kind in kinds
+            ):
+                self.misses += 1
+                return None
+            data = {}
+            for kind in kinds:
+                with open(os.path.join(entry_dir, kind), "rb") as f:
+                    data[kind] = f.read()
+            self.touch(key)
+            self.hits += 1
+            return data
+
+    def store(self, key, files=None, data=None):
+        """Add a result from files ({kind: path}) and/or data ({kind: bytes})."""
+        if not self.enabled:
+            return
+        staging = tempfile.mkdtemp(prefix="entry_", dir=self.root)
+        try:
+            for kind, path in (files or {}).items():
+                try:
+                    os.link(path, os.path.join(staging, kind))
+                except OSError:
+                    shutil.copyfile(path, os.path.join(staging, kind))
+            for kind, content in (data or {}).items():
+                with open(os.path.join(staging, kind), "wb") as f:
+                    f.write(content)
+            size = sum(
+                os.path.getsize(os.path.join(staging, name))
+                for name in os.listdir(staging)
+            )
+            if size > self.max_bytes:
+                return
+
+            with self.lock:
+                entry_dir = self.entry_dir(key)
+                if key in self.entries:
+                    self.remove(key)
+                os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+                os.replace(staging, entry_dir)
+                self.entries[key] = size
+                self.total_bytes += size
+                self.evict()
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def touch(self, key):
+        """Mark an entry as most recently used (call with lock held)."""
+        self.entries.move_to_end(key)
+        try:
+            os.utime(self.entry_dir(key))
+        except OSError:
+            pass
+
+    def remove(self, key):
+        """Delete an entry (call with lock held)."""
+        self.total_bytes -= self.entries.pop(key)
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+
+    def evict(self):
+        """Drop least recently used entries until within budget (call with lock held)."""
+        while self.entries and (
+            len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes
+        ):
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counters and size of the cache."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,325 @@
+"""Latency calibration: inference time per model and network settings.
+
+CPU inference time grows with --net_resolution and --scale_number. The
+calibration table records, for this host, how long one inference takes with
+each model and setting (and with face/hand detection, when measured). The
+server uses it to turn a request's latency_budget_ms into the most accurate
+settings that fit, and keeps it current with the inference times its warm
+workers report.
+
+Build the table by timing the warm worker on a representative image:
+
+    python openpose_calibration.py --image /images/test.jpg
+    python openpose_calibration.py --image /images/test.jpg --models BODY_25 \\
+        --resolutions -1x160 -1x256 -1x368 --scales 1 2 --face --hand
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# OpenPose's own defaults
+DEFAULT_NET_RESOLUTION = "-1x368"
+DEFAULT_SCALE_NUMBER = 1
+DEFAULT_SCALE_GAP = 0.25
+
+DEFAULT_RESOLUTIONS = ["-1x128", "-1x192", "-1x256", "-1x320", "-1x368", "-1x480"]
+DEFAULT_SCALES = [1, 2]
+
+# Weight of a new measurement in the running estimate
+SMOOTHING = 0.2
+# Seconds between saves of online updates
+SAVE_INTERVAL = 60
+
+NET_RESOLUTION_PATTERN = re.compile(r"^(-1|\d+)x(-1|\d+)$")
+
+# Models whose prototxt is not the OpenPose default
+MODEL_PROTOTXT = {
+    "COCO": "pose/coco/pose_deploy_linevec.prototxt",
+    "MPI": "pose/mpi/pose_deploy_linevec.prototxt",
+}
+
+
+def parse_net_resolution(value):
+    """Validate an OpenPose net resolution ("-1x368", "656x368").
+
+    Returns (width, height), -1 meaning "from the image aspect ratio".
+    Raises ValueError if it is not a valid resolution.
+    """
+    match = NET_RESOLUTION_PATTERN.match(str(value).strip())
+    if not match:
+        raise ValueError(
+            f"Invalid net_resolution: {value}. Must be WIDTHxHEIGHT, e.g. -1x368"
+        )
+    width, height = (int(v) for v in match.groups())
+    if width == -1 and height == -1:
+        raise ValueError("Invalid net_resolution: only one side can be -1")
+    for side in (width, height):
+        if side != -1 and (side <= 0 or side % 16):
+            raise ValueError(
+                f"Invalid net_resolution: {value}. Sides must be multiples of 16"
+            )
+    return width, height
+
+
+def net_pixels(net_resolution):
+    """Approximate input size in pixels (-1 sides taken from a 4:3 image)."""
+    width, height = parse_net_resolution(net_resolution)
+    if width == -1:
+        width = height * 4 // 3
+    if height == -1:
+        height = width * 3 // 4
+    return width * height
+
+
+def entry_key(model, face, hands, net_resolution, scale_number):
+    return (
+        f"{model}:{'face' if face else '-'}:{'hand' if hands else '-'}:"
+        f"{net_resolution}:{int(scale_number)}"
+    )
+
+
+class CalibrationTable:
+    """Measured inference times (ms), saved as JSON at path."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.saved_at = time.time()
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    for entry in json.load(f).get("entries", []):
+                        key = entry_key(
+                            entry["model"],
+                            entry["face"],
+                            entry["hands"],
+                            entry["net_resolution"],
+                            entry["scale_number"],
+                        )
+                        self.entries[key] = entry
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring calibration {path}: {str(e)}", flush=True)
+
+    def record(
+        self, model, face, hands, net_resolution, scale_number, ms, replace=False
+    ):
+        """Add a measured inference time to the running estimate.
+
+        With replace the measurement replaces the estimate instead.
+        """
+        key = entry_key(model, face, hands, net_resolution, scale_number)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or replace:
+                self.entries[key] = {
+                    "model": model,
+                    "face": bool(face),
+                    "hands": bool(hands),
+                    "net_resolution": net_resolution,
+                    "scale_number": int(scale_number),
+                    "ms": ms,
+                    "samples": 1,
+                }
+            else:
+                entry["ms"] = (1 - SMOOTHING) * entry["ms"] + SMOOTHING * ms
+                entry["samples"] += 1
+            self.dirty = True
+            if time.time() - self.saved_at > SAVE_INTERVAL:
+                self.save_locked()
+
+    def candidates(self, model, face, hands):
+        """Entries measured for a model, with the closest face/hand options.
+
+        Entries measured with exactly these face/hand options are used when
+        there are any, otherwise the body-only ones (which underestimate).
+        """
+        with self.lock:
+            entries = [e for e in self.entries.values() if e["model"] == model]
+        exact = [
+            e for e in entries if e["face"] == bool(face) and e["hands"] == bool(hands)
+        ]
+        return exact or [e for e in entries if not e["face"] and not e["hands"]]
+
+    def choose(self, model, face, hands, budget_ms):
+        """Most accurate calibrated settings expected to fit budget_ms.
+
+        Returns (entry, fits); entry is the fastest setting when nothing fits,
+        or None when the model has not been calibrated.
+        """
+        entries = self.candidates(model, face, hands)
+        if not entries:
+            return None, False
+        fitting = [e for e in entries if e["ms"] <= budget_ms]
+        if not fitting:
+            return min(entries, key=lambda e: e["ms"]), False
+        best = max(
+            fitting,
+            key=lambda e: (net_pixels(e["net_resolution"]), e["scale_number"]),
+        )
+        return best, True
+
+    def to_dict(self):
+        with self.lock:
+            entries = sorted(
+                self.entries.values(),
+                key=lambda e: (
+                    e["model"],
+                    e["face"],
+                    e["hands"],
+                    net_pixels(e["net_resolution"]),
+                    e["scale_number"],
+                ),
+            )
+            return {"entries": [dict(e) for e in entries]}
+
+    def save(self):
+        with self.lock:
+            self.save_locked()
+
+    def save_locked(self):
+        """Write the table atomically (call with lock held)."""
+        self.saved_at = time.time()
+        if not self.path or not self.dirty:
+            return
+        entries = list(self.entries.values())
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(f"{self.path}.partial", "w") as f:
+                json.dump({"entries": entries}, f, indent=2)
+            os.replace(f"{self.path}.partial", self.path)
+            self.dirty = False
+        except OSError as e:
+            print(f"Could not save calibration to {self.path}: {str(e)}", flush=True)
+
+
+def worker_params(model_folder, model, face, hands, net_resolution, scale_number):
+    """pyopenpose params for one calibration run (as the server's warm workers)."""
+    params = {
+        "model_folder": model_folder,
+        "model_pose": model,
+        "face": bool(face),
+        "hand": bool(hands),
+        "display": 0,
+        "render_pose": 0,
+        "net_resolution": net_resolution,
+        "scale_number": int(scale_number),
+        "scale_gap": DEFAULT_SCALE_GAP,
+    }
+    if model in MODEL_PROTOTXT:
+        params["prototxt_path"] = MODEL_PROTOTXT[model]
+    return params
+
+
+def calibrate(args):
+    """Time the warm worker with every combination of settings."""
+    table = CalibrationTable(args.output)
+    worker = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "openpose_worker.py"
+            ),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        bufsize=1,
+    )
+
+    def request(message):
+        worker.stdin.write(json.dumps(message) + "\n")
+        worker.stdin.flush()
+        response = json.loads(worker.stdout.readline() or "{}")
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "OpenPose worker exited"))
+        return response
+
+    try:
+        for model in args.models:
+            for net_resolution in args.resolutions:
+                for scale_number in args.scales:
+                    request(
+                        {
+                            "cmd": "configure",
+                            "params": worker_params(
+                                args.model_folder,
+                                model,
+                                args.face,
+                                args.hand,
+                                net_resolution,
+                                scale_number,
+                            ),
+                        }
+                    )
+                    task = {"cmd": "process", "image_path": args.image}
+                    request(task)  # warm-up
+                    times = sorted(
+                        request(task)["inference_time"] * 1000 for _ in range(args.runs)
+                    )
+                    ms = times[len(times) // 2]
+                    table.record(
+                        model,
+                        args.face,
+                        args.hand,
+                        net_resolution,
+                        scale_number,
+                        ms,
+                        replace=True,
+                    )
+                    print(
+                        f"{model:8} face={int(args.face)} hand={int(args.hand)} "
+                        f"{net_resolution:>8} x{scale_number}: {ms:8.1f} ms",
+                        flush=True,
+                    )
+    finally:
+        try:
+            request({"cmd": "quit"})
+        except (OSError, ValueError, RuntimeError):
+            worker.kill()
+        worker.wait()
+        table.save()
+    print(f"Calibration saved to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure OpenPose inference times per model and network settings."
+    )
+    parser.add_argument("--image", required=True, help="representative image")
+    parser.add_argument(
+        "--output",
+        default=os.environ.get(
+            "OPENPOSE_CALIBRATION_FILE",
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "calibration.json"
+            ),
+        ),
+        help="calibration table to update",
+    )
+    parser.add_argument(
+        "--model-folder",
+        default=os.environ.get("OPENPOSE_MODEL_FOLDER", "/openpose/models/"),
+    )
+    parser.add_argument("--models", nargs="+", default=["BODY_25"])
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS)
+    parser.add_argument("--scales", nargs="+", type=int, default=DEFAULT_SCALES)
+    parser.add_argument("--face", action="store_true", help="with face detection")
+    parser.add_argument("--hand", action="store_true", help="with hand detection")
+    parser.add_argument("--runs", type=int, default=3, help="timed runs per setting")
+    args = parser.parse_args()
+    for net_resolution in args.resolutions:
+        parse_net_resolution(net_resolution)
+    calibrate(args)
+
+
+if __name__ == "__main__":
+    main()
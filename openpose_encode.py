@@ -0,0 +1,152 @@
+"""Encoding of rendered images: format, quality, thumbnails, and a pool to do it.
+
+Renders are written as PNG (lossless, the default), JPEG or WebP, with the
+quality (JPEG, WebP) or compression level (PNG) of the request, and with an
+optional thumbnail scaled down to a longest side of thumbnail_size pixels.
+The EncoderPool runs the encoding and writing on its own threads (OpenCV
+releases the GIL while encoding), so the OpenPose workers can move on.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+# Output formats and their file extensions
+OUTPUT_FORMATS = {"png": ".png", "jpg": ".jpg", "webp": ".webp"}
+DEFAULT_QUALITY = 90
+# OpenCV's default, fastest zlib level
+DEFAULT_PNG_COMPRESSION = 1
+MAX_THUMBNAIL_SIZE = 4096
+
+# Rendered output kinds and the output kinds of their thumbnails
+THUMBNAIL_KINDS = {
+    "rendered_on_black": "thumbnail_on_black",
+    "rendered_on_image": "thumbnail_on_image",
+}
+
+
+def parse_encoding(data):
+    """Encoding settings of a request (output_format, output_quality,
+    png_compression, thumbnail_size), with their defaults.
+
+    Raises ValueError with a message for the client if one is invalid.
+    """
+    output_format = str(data.get("output_format", "png")).lower()
+    if output_format == "jpeg":
+        output_format = "jpg"
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Invalid output_format: {output_format}. "
+            f"Must be one of: {', '.join(OUTPUT_FORMATS)}"
+        )
+    quality = int(data.get("output_quality", DEFAULT_QUALITY))
+    if not 1 <= quality <= 100:
+        raise ValueError("output_quality must be between 1 and 100")
+    png_compression = int(data.get("png_compression", DEFAULT_PNG_COMPRESSION))
+    if not 0 <= png_compression <= 9:
+        raise ValueError("png_compression must be between 0 and 9")
+    thumbnail_size = int(data.get("thumbnail_size") or 0)
+    if not 0 <= thumbnail_size <= MAX_THUMBNAIL_SIZE:
+        raise ValueError(
+            f"thumbnail_size must be between 0 (none) and {MAX_THUMBNAIL_SIZE}"
+        )
+    return {
+        "output_format": output_format,
+        "output_quality": quality,
+        "png_compression": png_compression,
+        "thumbnail_size": thumbnail_size,
+    }
+
+
+def encoding_extension(encoding):
+    """File extension of the images written with encoding (None: PNG)."""
+    return OUTPUT_FORMATS[(encoding or {}).get("output_format", "png")]
+
+
+def encode_image(image, encoding=None):
+    """Encode an image array with encoding (None: PNG). Returns the bytes."""
+    encoding = encoding or {}
+    output_format = encoding.get("output_format", "png")
+    if output_format == "jpg":
+        params = [
+            cv2.IMWRITE_JPEG_QUALITY,
+            encoding.get("output_quality", DEFAULT_QUALITY),
+        ]
+    elif output_format == "webp":
+        params = [
+            cv2.IMWRITE_WEBP_QUALITY,
+            encoding.get("output_quality", DEFAULT_QUALITY),
+        ]
+    else:
+        params = [
+            cv2.IMWRITE_PNG_COMPRESSION,
+            encoding.get("png_compression", DEFAULT_PNG_COMPRESSION),
+        ]
+    ok, data = cv2.imencode(OUTPUT_FORMATS[output_format], image, params)
+    if not ok:
+        raise ValueError(f"Could not encode the image as {output_format}")
+    return data.tobytes()
+
+
+def make_thumbnail(image, size):
+    """image scaled down to a longest side of size pixels (never up)."""
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1:
+        return image
+    return cv2.resize(
+        image,
+        (max(1, round(width * scale)), max(1, round(height * scale))),
+        interpolation=cv2.INTER_AREA,
+    )
+
+
+def write_file(path, data):
+    """Write data to path atomically (readers never see a partial file)."""
+    partial_path = f"{path}.partial"
+    with open(partial_path, "wb") as f:
+        f.write(data)
+    os.replace(partial_path, path)
+
+
+def write_image(image, path, encoding=None, thumbnail_path=None):
+    """Encode image to path, and its thumbnail to thumbnail_path if given."""
+    write_file(path, encode_image(image, encoding))
+    if thumbnail_path:
+        thumbnail = make_thumbnail(image, encoding["thumbnail_size"])
+        write_file(thumbnail_path, encode_image(thumbnail, encoding))
+
+
+class EncoderPool:
+    """Threads that encode and write images, or run other output work.
+
+    At most queue_size tasks are queued or running at a time: submit() blocks
+    until one of them is done, so the workers can't pile up workspaces faster
+    than they are written.
+    """
+
+    def __init__(self, threads, queue_size):
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="encoder"
+        )
+        self.slots = threading.BoundedSemaphore(max(threads, queue_size))
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool, once it has room for it.
+        Returns its Future. Never call this from a task on the pool."""
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def wait_for_room(self):
+        """Block until the pool can take another task."""
+        self.slots.acquire()
+        self.slots.release()
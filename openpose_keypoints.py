@@ -0,0 +1,139 @@
+"""Compact binary keypoint output.
+
+Keypoints of one image or of a whole batch are packed into a single float32
+array of shape (people, parts, 3) and saved as a .npy file, so consumers can
+np.load(path, mmap_mode="r") it without any JSON decoding. The .npy format
+has no room for metadata, so a small index next to it records the model, the
+part ranges of each section and, per image, the offset of its first person:
+
+    people of image i = array[offsets[i]:offsets[i + 1]]
+"""
+
+import json
+import os
+
+import numpy as np
+
+from openpose_render import POSE_NUM_PARTS, people_array
+
+FORMAT = "openpose-keypoints-f32"
+FORMAT_VERSION = 1
+
+# Sections in the order they are packed: (name, JSON key, number of parts)
+FACE_SECTION = ("face", "face_keypoints_2d", 70)
+HAND_SECTIONS = [
+    ("hand_left", "hand_left_keypoints_2d", 21),
+    ("hand_right", "hand_right_keypoints_2d", 21),
+]
+
+KEYPOINT_FORMATS = ["json", "binary", "both"]
+
+
+def sections_for(model, detect_face, detect_hands):
+    """The sections packed for a model and detection options."""
+    sections = [("pose", "pose_keypoints_2d", POSE_NUM_PARTS[model])]
+    if detect_face:
+        sections.append(FACE_SECTION)
+    if detect_hands:
+        sections.extend(HAND_SECTIONS)
+    return sections
+
+
+def pack_people(people, sections):
+    """Pack the people of one image into a (people, parts, 3) float32 array."""
+    return np.concatenate(
+        [people_array(people, key, parts) for _, key, parts in sections], axis=1
+    )
+
+
+def binary_paths(path_prefix):
+    """(data, index) paths of the binary output at path_prefix."""
+    return f"{path_prefix}_keypoints.npy", f"{path_prefix}_keypoints.index.json"
+
+
+def write_keypoints_binary(
+    path_prefix, images, model, detect_face, detect_hands, keypoint_scale=0
+):
+    """Write the keypoints of images ([(image name, people), ...]) as one file.
+
+    Returns the (data, index) paths.
+    """
+    sections = sections_for(model, detect_face, detect_hands)
+    num_parts = sum(parts for _, _, parts in sections)
+    arrays = [pack_people(people, sections) for _, people in images]
+    offsets = np.cumsum([0] + [len(array) for array in arrays]).tolist()
+    data = (
+        np.concatenate(arrays)
+        if arrays
+        else np.zeros((0, num_parts, 3), dtype=np.float32)
+    )
+
+    ranges = {}
+    start = 0
+    for name, _, parts in sections:
+        ranges[name] = [start, start + parts]
+        start += parts
+
+    data_path, index_path = binary_paths(path_prefix)
+    index = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "data": os.path.basename(data_path),
+        "dtype": "float32",
+        "shape": list(data.shape),
+        "model": model,
+        "keypoint_scale": keypoint_scale,
+        "sections": ranges,
+        "images": [name for name, _ in images],
+        "offsets": offsets,
+    }
+
+    # Written next to their final names and renamed, so readers never see
+    # a partial file
+    with open(f"{data_path}.partial", "wb") as f:
+        np.save(f, data.astype(np.float32, copy=False))
+    os.replace(f"{data_path}.partial", data_path)
+    with open(f"{index_path}.partial", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{index_path}.partial", index_path)
+    return data_path, index_path
+
+
+def load_keypoints_binary(index_path, mmap=True):
+    """Return (index, array) of a binary output; the array is memory-mapped."""
+    with open(index_path, "r") as f:
+        index = json.load(f)
+    if index.get("format") != FORMAT:
+        raise ValueError(f"Not a binary keypoint index: {index_path}")
+    data_path = os.path.join(os.path.dirname(index_path), index["data"])
+    array = np.load(data_path, mmap_mode="r" if mmap else None)
+    return index, array
+
+
+def image_keypoints(index, array, image=0):
+    """(people, parts, 3) keypoints of one image (by position) of a binary output."""
+    offsets = index["offsets"]
+    return array[offsets[image] : offsets[image + 1]]
+
+
+def section(index, keypoints, name):
+    """One section (e.g. "pose", "hand_left") of packed keypoints, or None."""
+    if name not in index["sections"]:
+        return None
+    start, end = index["sections"][name]
+    return keypoints[:, start:end]
+
+
+def people_from_binary(index, array, image=0):
+    """The people of one image in the OpenPose JSON layout."""
+    keypoints = image_keypoints(index, array, image)
+    keys = {"pose": "pose_keypoints_2d", "face": "face_keypoints_2d"}
+    keys.update({name: key for name, key, _ in HAND_SECTIONS})
+    people = []
+    for person in range(len(keypoints)):
+        entry = {"person_id": [-1]}
+        for name, key in keys.items():
+            values = section(index, keypoints[person : person + 1], name)
+            entry[key] = [] if values is None else values.reshape(-1).tolist()
+        people.append(entry)
+    return people
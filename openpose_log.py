@@ -0,0 +1,57 @@
+"""Bounded capture of the output of OpenPose processes.
+
+Every job keeps the last lines openpose.bin or its warm worker wrote to
+stdout and stderr in a LogBuffer, which /jobs/<job_id>/log serves. Appending
+only takes the buffer's own lock, so a chatty process does not contend with
+the readers of the server status.
+"""
+
+import threading
+import time
+from collections import deque
+
+# Longer lines are cut, so that a single line cannot take the buffer's memory
+MAX_LINE_LENGTH = 2000
+
+
+class LogBuffer:
+    """Ring buffer of the last maxlen lines, with their number, stream and time.
+
+    Lines are numbered from 0 in the order they were appended, including the
+    ones dropped since.
+    """
+
+    def __init__(self, maxlen):
+        self.lines = deque(maxlen=maxlen)
+        self.total = 0  # lines ever appended
+        self.lock = threading.Lock()
+
+    def append(self, stream, line):
+        line = line.rstrip("\r\n")
+        if len(line) > MAX_LINE_LENGTH:
+            line = line[:MAX_LINE_LENGTH] + "..."
+        with self.lock:
+            self.lines.append(
+                {"n": self.total, "time": time.time(), "stream": stream, "line": line}
+            )
+            self.total += 1
+
+    def tail(self, count=None, stream=None, since=0):
+        """The kept lines numbered since or later, only those of stream if
+        given, and only the last count of them if given."""
+        with self.lock:
+            lines = [entry for entry in self.lines if entry["n"] >= since]
+        if stream is not None:
+            lines = [entry for entry in lines if entry["stream"] == stream]
+        if count is not None:
+            lines = lines[len(lines) - count :] if count > 0 else []
+        return lines
+
+    def text(self, count=None, stream=None, since=0):
+        """tail() as text, one line each."""
+        return "\n".join(entry["line"] for entry in self.tail(count, stream, since))
+
+    def dropped(self):
+        """Lines that no longer fit in the buffer."""
+        with self.lock:
+            return self.total - len(self.lines)
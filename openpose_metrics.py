@@ -0,0 +1,193 @@
+"""Minimal Prometheus metrics (counters, gauges and histograms).
+
+Metrics are registered on a MetricsRegistry and rendered in the Prometheus
+text exposition format by MetricsRegistry.render(), which /metrics serves.
+Every metric has a fixed list of label names; each combination of label
+values gets its own series the first time it is used.
+"""
+
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a cached result to a long batch
+DEFAULT_BUCKETS = (
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+)
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return (
+        "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+    )
+
+
+class Metric:
+    """A named metric with a fixed set of label names."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.series = {}  # label values -> value (or histogram state)
+        self.lock = threading.Lock()
+        if not self.label_names and self.kind != "histogram":
+            self.series[()] = 0
+
+    def label_values(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"{self.name} takes the labels {', '.join(self.label_names) or 'none'}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def samples(self):
+        with self.lock:
+            return [
+                f"{self.name}{format_labels(self.label_names, values)} "
+                f"{format_value(value)}"
+                for values, value in sorted(self.series.items())
+            ]
+
+
+class Counter(Metric):
+    """A monotonically increasing total."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        values = self.label_values(labels)
+        with self.lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def set_total(self, total, **labels):
+        """Mirror a total that is counted elsewhere (e.g. cache hits)."""
+        values = self.label_values(labels)
+        with self.lock:
+            self.series[values] = total
+
+
+class Gauge(Metric):
+    """A value that goes up and down."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        values = self.label_values(labels)
+        with self.lock:
+            self.series[values] = value
+
+
+class Histogram(Metric):
+    """Observations counted in cumulative buckets, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        values = self.label_values(labels)
+        with self.lock:
+            state = self.series.get(values)
+            if state is None:
+                state = self.series[values] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for values, state in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    cumulative += count
+                    labels = format_labels(
+                        self.label_names, values, ("le", format_value(bound))
+                    )
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.label_names, values, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {state['count']}")
+                labels = format_labels(self.label_names, values)
+                lines.append(f"{self.name}_sum{labels} {format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of one process, in registration order."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
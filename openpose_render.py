@@ -0,0 +1,230 @@
+"""Draw OpenPose skeletons from keypoint JSON.
+
+Mirrors OpenPose's CPU renderer (limb pairs, colours and thickness rules) so a
+single inference pass can be rendered on a black background and on the source
+image without running OpenPose again.
+"""
+
+import cv2
+import numpy as np
+
+
+# Limb pairs and per-keypoint colours (RGB) from OpenPose's poseParameters.
+POSE_PAIRS = {
+    "BODY_25": [
+        (1, 8), (1, 2), (1, 5), (2, 3), (3, 4), (5, 6), (6, 7), (8, 9),
+        (9, 10), (10, 11), (8, 12), (12, 13), (13, 14), (1, 0), (0, 15),
+        (15, 17), (0, 16), (16, 18), (14, 19), (19, 20), (14, 21), (11, 22),
+        (22, 23), (11, 24),
+    ],
+    "COCO": [
+        (1, 2), (1, 5), (2, 3), (3, 4), (5, 6), (6, 7), (1, 8), (8, 9),
+        (9, 10), (1, 11), (11, 12), (12, 13), (1, 0), (0, 14), (14, 16),
+        (0, 15), (15, 17),
+    ],
+    "MPI": [
+        (0, 1), (1, 2), (2, 3), (3, 4), (1, 5), (5, 6), (6, 7), (1, 14),
+        (14, 8), (8, 9), (9, 10), (14, 11), (11, 12), (12, 13),
+    ],
+}
+
+POSE_COLORS = {
+    "BODY_25": [
+        (255, 0, 85), (255, 0, 0), (255, 85, 0), (255, 170, 0), (255, 255, 0),
+        (170, 255, 0), (85, 255, 0), (0, 255, 0), (255, 0, 0), (0, 255, 85),
+        (0, 255, 170), (0, 255, 255), (0, 170, 255), (0, 85, 255), (0, 0, 255),
+        (255, 0, 170), (170, 0, 255), (255, 0, 255), (85, 0, 255), (0, 0, 255),
+        (0, 0, 255), (0, 0, 255), (0, 255, 255), (0, 255, 255), (0, 255, 255),
+    ],
+    "COCO": [
+        (255, 0, 85), (255, 0, 0), (255, 85, 0), (255, 170, 0), (255, 255, 0),
+        (170, 255, 0), (85, 255, 0), (0, 255, 0), (0, 255, 85), (0, 255, 170),
+        (0, 255, 255), (0, 170, 255), (0, 85, 255), (0, 0, 255), (255, 0, 170),
+        (170, 0, 255), (255, 0, 255), (85, 0, 255),
+    ],
+    "MPI": [
+        (255, 0, 85), (255, 0, 0), (255, 85, 0), (255, 170, 0), (255, 255, 0),
+        (170, 255, 0), (85, 255, 0), (43, 255, 0), (0, 255, 0), (0, 255, 85),
+        (0, 255, 170), (0, 255, 255), (0, 170, 255), (0, 85, 255), (0, 0, 255),
+    ],
+}
+
+# Number of body keypoints per model, used to recognise a model from its output
+POSE_NUM_PARTS = {"BODY_25": 25, "COCO": 18, "MPI": 15}
+
+FACE_PAIRS = (
+    [(i, i + 1) for i in range(16)]  # jaw line
+    + [(i, i + 1) for i in range(17, 21)]  # right eyebrow
+    + [(i, i + 1) for i in range(22, 26)]  # left eyebrow
+    + [(i, i + 1) for i in range(27, 30)]  # nose bridge
+    + [(i, i + 1) for i in range(31, 35)]  # nose base
+    + [(i, i + 1) for i in range(36, 41)] + [(41, 36)]  # right eye
+    + [(i, i + 1) for i in range(42, 47)] + [(47, 42)]  # left eye
+    + [(i, i + 1) for i in range(48, 59)] + [(59, 48)]  # outer lips
+    + [(i, i + 1) for i in range(60, 67)] + [(67, 60)]  # inner lips
+)
+FACE_COLORS = [(255, 255, 255)] * 70
+
+HAND_PAIRS = [
+    (0, 1), (1, 2), (2, 3), (3, 4),
+    (0, 5), (5, 6), (6, 7), (7, 8),
+    (0, 9), (9, 10), (10, 11), (11, 12),
+    (0, 13), (13, 14), (14, 15), (15, 16),
+    (0, 17), (17, 18), (18, 19), (19, 20),
+]
+HAND_COLORS = [
+    (100, 100, 100),
+    (100, 0, 0), (150, 0, 0), (200, 0, 0), (255, 0, 0),
+    (100, 100, 0), (150, 150, 0), (200, 200, 0), (255, 255, 0),
+    (0, 100, 50), (0, 150, 75), (0, 200, 100), (0, 255, 125),
+    (0, 50, 100), (0, 75, 150), (0, 100, 200), (0, 125, 255),
+    (100, 0, 100), (150, 0, 150), (200, 0, 200), (255, 0, 255),
+]
+
+# OpenPose thickness rules (relative to the image area)
+THICKNESS_CIRCLE_RATIO = 1.0 / 75.0
+THICKNESS_LINE_RATIO_WRT_CIRCLE = 0.75
+
+
+def model_from_num_parts(num_parts):
+    """Return the pose model that produces num_parts body keypoints, or None."""
+    for model, parts in POSE_NUM_PARTS.items():
+        if parts == num_parts:
+            return model
+    return None
+
+
+def people_array(people, key, num_parts):
+    """Stack one keypoint field of every person into a (people, parts, 3) array."""
+    array = np.zeros((len(people), num_parts, 3), dtype=np.float32)
+    for i, person in enumerate(people):
+        values = person.get(key) or []
+        if len(values) == num_parts * 3:
+            array[i] = np.asarray(values, dtype=np.float32).reshape(num_parts, 3)
+    return array
+
+
+def unscale_keypoints(keypoints, keypoint_scale, width, height):
+    """Convert --keypoint_scale 3/4 coordinates back to pixels (in place)."""
+    if keypoint_scale == 3:
+        keypoints[..., 0] *= width - 1
+        keypoints[..., 1] *= height - 1
+    elif keypoint_scale == 4:
+        keypoints[..., 0] = (keypoints[..., 0] + 1) / 2 * (width - 1)
+        keypoints[..., 1] = (keypoints[..., 1] + 1) / 2 * (height - 1)
+    return keypoints
+
+
+def draw_keypoints(canvas, keypoints, pairs, colors, threshold):
+    """Draw (people, parts, 3) keypoints onto a BGR canvas like OpenPose's CPU renderer."""
+    if keypoints.size == 0:
+        return
+    height, width = canvas.shape[:2]
+    area = width * height
+    # OpenPose colours are RGB, the canvas is BGR
+    colors_bgr = [(b, g, r) for r, g, b in colors]
+
+    for person in keypoints:
+        valid = person[:, 2] > threshold
+        if not np.any(valid):
+            continue
+
+        # Scale thickness with the person's size relative to the image
+        points = person[valid, :2]
+        extent = points.max(axis=0) - points.min(axis=0)
+        ratio_areas = min(1.0, max(extent[0] / width, extent[1] / height))
+        thickness_ratio = max(
+            int(round(np.sqrt(area) * THICKNESS_CIRCLE_RATIO * ratio_areas)), 2
+        )
+        thickness_circle = max(1, thickness_ratio if ratio_areas > 0.05 else -1)
+        thickness_line = max(
+            1, int(round(thickness_ratio * THICKNESS_LINE_RATIO_WRT_CIRCLE))
+        )
+        radius = thickness_ratio // 2
+
+        coords = np.rint(person[:, :2]).astype(np.int32)
+        for a, b in pairs:
+            if valid[a] and valid[b]:
+                cv2.line(
+                    canvas,
+                    tuple(int(v) for v in coords[a]),
+                    tuple(int(v) for v in coords[b]),
+                    colors_bgr[b % len(colors_bgr)],
+                    thickness_line,
+                )
+        for part in np.flatnonzero(valid):
+            cv2.circle(
+                canvas,
+                tuple(int(v) for v in coords[part]),
+                radius,
+                colors_bgr[part % len(colors_bgr)],
+                thickness_circle,
+            )
+
+
+def draw_people(
+    canvas,
+    people,
+    render_threshold=0.05,
+    face_render_threshold=0.4,
+    hand_render_threshold=0.2,
+    keypoint_scale=0,
+):
+    """Draw body, face and hand keypoints of all people onto canvas."""
+    height, width = canvas.shape[:2]
+
+    num_parts = 0
+    for person in people:
+        num_parts = len(person.get("pose_keypoints_2d") or []) // 3
+        if num_parts:
+            break
+    model = model_from_num_parts(num_parts)
+    if model is None:
+        return
+
+    layers = [
+        (
+            "pose_keypoints_2d",
+            num_parts,
+            POSE_PAIRS[model],
+            POSE_COLORS[model],
+            render_threshold,
+        ),
+        ("face_keypoints_2d", 70, FACE_PAIRS, FACE_COLORS, face_render_threshold),
+        ("hand_left_keypoints_2d", 21, HAND_PAIRS, HAND_COLORS, hand_render_threshold),
+        ("hand_right_keypoints_2d", 21, HAND_PAIRS, HAND_COLORS, hand_render_threshold),
+    ]
+    for key, parts, pairs, colors, threshold in layers:
+        keypoints = people_array(people, key, parts)
+        unscale_keypoints(keypoints, keypoint_scale, width, height)
+        draw_keypoints(canvas, keypoints, pairs, colors, threshold)
+
+
+def render_skeleton(
+    image,
+    people,
+    render_threshold=0.05,
+    face_render_threshold=0.4,
+    hand_render_threshold=0.2,
+    keypoint_scale=0,
+):
+    """Draw the skeletons of people on a black canvas the size of image."""
+    skeleton = np.zeros_like(image)
+    draw_people(
+        skeleton,
+        people,
+        render_threshold,
+        face_render_threshold,
+        hand_render_threshold,
+        keypoint_scale,
+    )
+    return skeleton
+
+
+def composite(image, skeleton):
+    """Return a copy of image with the drawn skeleton on top."""
+    composited = image.copy()
+    mask = np.any(skeleton != 0, axis=2)
+    composited[mask] = skeleton[mask]
+    return composited
+
@@ -0,0 +1,116 @@
+"""Keypoint motion and interpolation between the keyframes of a sequence.
+
+Adaptive frame sampling runs inference on keyframes only and fills the frames
+in between by interpolating the keypoints of the two keyframes around them.
+People are matched between keyframes by the centroid of their body
+keypoints, and the motion between keyframes is the largest mean keypoint
+displacement of a matched person, computed over all people at once on the
+stacked (people, parts, 3) arrays.
+"""
+
+import numpy as np
+
+from openpose_analytics import SECTION_KEYS, stack_people
+
+
+def coordinate_scale(keypoint_scale, width, height):
+    """Length of the frame diagonal in keypoint coordinates (see --keypoint_scale)."""
+    if keypoint_scale == 3:
+        return float(np.hypot(1, 1))
+    if keypoint_scale == 4:
+        return float(np.hypot(2, 2))
+    return float(np.hypot(width, height))
+
+
+def centroids(pose):
+    """(people, 2) centroids of the detected body keypoints (NaN without any)."""
+    valid = pose[..., 2] > 0
+    counts = valid.sum(axis=1)[:, None]
+    sums = np.where(valid[..., None], pose[..., :2], 0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def match_people(first, second):
+    """Pair up the people of two keyframes ((people, parts, 3) pose arrays).
+
+    Returns a list of (index in first, index in second), closest centroids
+    first, or None when the number of people changed.
+    """
+    if len(first) != len(second):
+        return None
+    if not len(first):
+        return []
+    distances = np.linalg.norm(
+        centroids(first)[:, None] - centroids(second)[None], axis=2
+    )
+    distances = np.nan_to_num(distances, nan=np.inf)
+    pairs = []
+    used_first, used_second = set(), set()
+    for flat in np.argsort(distances, axis=None, kind="stable"):
+        i, j = divmod(int(flat), len(second))
+        if i in used_first or j in used_second:
+            continue
+        pairs.append((i, j))
+        used_first.add(i)
+        used_second.add(j)
+        if len(pairs) == len(first):
+            break
+    return pairs
+
+
+def keyframe_motion(first, second, scale):
+    """Motion between two keyframes' people (OpenPose JSON layout).
+
+    Returns (motion, pairs): the largest mean displacement of a matched
+    person's body keypoints (detected in both keyframes), as a fraction of
+    scale, and the matched pairs. Motion is infinite when the number of
+    people changed or a person has no keypoint detected in both.
+    """
+    pairs = match_people(stack_people(first)["pose"], stack_people(second)["pose"])
+    if pairs is None:
+        return float("inf"), None
+    if not pairs:
+        return 0.0, pairs
+    rows, columns = (list(indices) for indices in zip(*pairs))
+    a = stack_people(first)["pose"][rows]
+    b = stack_people(second)["pose"][columns]
+    valid = (a[..., 2] > 0) & (b[..., 2] > 0)
+    distance = np.linalg.norm(a[..., :2] - b[..., :2], axis=2)
+    counts = valid.sum(axis=1)
+    if not counts.all():
+        return float("inf"), pairs
+    mean = np.where(valid, distance, 0).sum(axis=1) / counts
+    return float(mean.max() / scale), pairs
+
+
+def interpolate_people(first, second, pairs, alpha):
+    """People at fraction alpha of the way from keyframe first to second.
+
+    Coordinates are interpolated linearly for the keypoints detected in both
+    keyframes, with the lower of the two confidences; the others are left
+    undetected (zero), like OpenPose writes them.
+    """
+    if not pairs:
+        return []
+    rows, columns = (list(indices) for indices in zip(*pairs))
+    first_sections = stack_people(first)
+    second_sections = stack_people(second)
+    people = [dict(first[i]) for i in rows]
+    for name, key in SECTION_KEYS.items():
+        if name not in first_sections or name not in second_sections:
+            for person in people:
+                person[key] = []
+            continue
+        a = first_sections[name][rows]
+        b = second_sections[name][columns]
+        if a.shape != b.shape:
+            for person in people:
+                person[key] = []
+            continue
+        keypoints = (1 - alpha) * a + alpha * b
+        keypoints[..., 2] = np.minimum(a[..., 2], b[..., 2])
+        keypoints[(a[..., 2] <= 0) | (b[..., 2] <= 0)] = 0
+        for person, values in zip(people, keypoints):
+            person[key] = [float(v) for v in values.reshape(-1)]
+    return people
@@ -0,0 +1,381 @@
+"""Long-lived OpenPose worker process.
+
+Started by openpose_api_server.py. Loads the OpenPose network once through
+pyopenpose and then serves jobs read from stdin, one JSON object per line,
+answering each with one JSON object per line on the protocol pipe.
+
+Commands:
+    {"cmd": "configure", "params": {...}}   (re)load the network with params
+    {"cmd": "process", ...}                  run inference on one image
+    {"cmd": "process_video", ...}            run inference on the frames of a
+                                             video or image sequence (or only its
+                                             keyframes), answering once per
+                                             frame and once when done
+    {"cmd": "quit"}                          exit cleanly
+
+A worker that cannot import pyopenpose answers every command with
+{"ok": false, "unavailable": true, "error": ...}.
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+import traceback
+
+# OpenPose (C++) logs to stdout. Keep the original stdout for the protocol
+# and send everything else written to fd 1 to stderr, so log lines never
+# corrupt a response.
+PROTOCOL_OUT = os.fdopen(os.dup(1), "w", buffering=1)
+os.dup2(2, 1)
+sys.stdout = sys.stderr
+
+OPENPOSE_PYTHON_PATH = os.environ.get("OPENPOSE_PYTHON_PATH", "/openpose/build/python")
+sys.path.append(OPENPOSE_PYTHON_PATH)
+
+# Without pyopenpose (or its dependencies) every command is answered with
+# "unavailable", which makes the server use openpose.bin instead
+try:
+    import cv2  # noqa: E402
+    import numpy as np  # noqa: E402
+    from openpose import pyopenpose as op  # noqa: E402
+
+    from openpose_sequence import (  # noqa: E402
+        coordinate_scale,
+        interpolate_people,
+        keyframe_motion,
+    )
+
+    IMPORT_ERROR = None
+except ImportError as e:
+    IMPORT_ERROR = f"pyopenpose not available: {e}"
+
+
+wrapper = None
+current_params = None
+
+
+def reply(message):
+    """Write one response line to the server."""
+    PROTOCOL_OUT.write(json.dumps(message) + "\n")
+    PROTOCOL_OUT.flush()
+
+
+def configure(params):
+    """Start (or restart) the OpenPose wrapper with the given params."""
+    global wrapper, current_params
+
+    if wrapper is not None:
+        wrapper.stop()
+        wrapper = None
+
+    started = time.time()
+    new_wrapper = op.WrapperPython()
+    new_wrapper.configure(params)
+    new_wrapper.start()
+
+    wrapper = new_wrapper
+    current_params = params
+    return time.time() - started
+
+
+def emplace_and_pop(datum):
+    """Run one datum through the wrapper (handles old and new pyopenpose APIs)."""
+    if hasattr(op, "VectorDatum"):
+        return wrapper.emplaceAndPop(op.VectorDatum([datum]))
+    return wrapper.emplaceAndPop([datum])
+
+
+def keypoints_list(array, person):
+    """Return one person's keypoints as the flat list OpenPose writes to JSON."""
+    if array is None:
+        return []
+    array = np.asarray(array)
+    if array.ndim != 3 or person >= array.shape[0]:
+        return []
+    return [float(v) for v in array[person].reshape(-1)]
+
+
+def scale_keypoints(array, keypoint_scale, width, height):
+    """Apply OpenPose's --keypoint_scale 3/4 normalisation to pixel keypoints."""
+    if array is None or keypoint_scale == 0:
+        return array
+    array = np.array(array, dtype=np.float32)
+    if array.ndim != 3:
+        return array
+    scale_x = 1.0 / max(width - 1, 1)
+    scale_y = 1.0 / max(height - 1, 1)
+    if keypoint_scale == 3:
+        array[..., 0] *= scale_x
+        array[..., 1] *= scale_y
+    elif keypoint_scale == 4:
+        array[..., 0] = array[..., 0] * 2 * scale_x - 1
+        array[..., 1] = array[..., 1] * 2 * scale_y - 1
+    return array
+
+
+def keypoints_document(datum, keypoint_scale, width, height):
+    """Keypoints in the same layout as openpose.bin --write_json."""
+    pose = scale_keypoints(datum.poseKeypoints, keypoint_scale, width, height)
+    face = scale_keypoints(datum.faceKeypoints, keypoint_scale, width, height)
+    hands = datum.handKeypoints if datum.handKeypoints is not None else [None, None]
+    hand_left = scale_keypoints(hands[0], keypoint_scale, width, height)
+    hand_right = scale_keypoints(hands[1], keypoint_scale, width, height)
+
+    num_people = 0
+    if pose is not None and np.asarray(pose).ndim == 3:
+        num_people = np.asarray(pose).shape[0]
+
+    people = []
+    for person in range(num_people):
+        people.append(
+            {
+                "person_id": [-1],
+                "pose_keypoints_2d": keypoints_list(pose, person),
+                "face_keypoints_2d": keypoints_list(face, person),
+                "hand_left_keypoints_2d": keypoints_list(hand_left, person),
+                "hand_right_keypoints_2d": keypoints_list(hand_right, person),
+                "pose_keypoints_3d": [],
+                "face_keypoints_3d": [],
+                "hand_left_keypoints_3d": [],
+                "hand_right_keypoints_3d": [],
+            }
+        )
+
+    return {"version": 1.3, "people": people}
+
+
+def read_image(job):
+    """Load the job's image from image_path, or decode it from base64 image_data."""
+    if job.get("image_data"):
+        data = np.frombuffer(base64.b64decode(job["image_data"]), dtype=np.uint8)
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image data")
+        return image
+    image = cv2.imread(job["image_path"])
+    if image is None:
+        raise ValueError(f"Could not read image: {job['image_path']}")
+    return image
+
+
+def process(job):
+    """Run inference on one image.
+
+    The keypoints are written to json_path, or returned as "people" in the
+    response when the job has no json_path.
+    """
+    started = time.time()
+    image = read_image(job)
+    height, width = image.shape[:2]
+
+    datum = op.Datum()
+    datum.cvInputData = image
+    emplace_and_pop(datum)
+    inference_time = time.time() - started
+
+    document = keypoints_document(datum, job.get("keypoint_scale", 0), width, height)
+
+    result = {
+        "num_people": len(document["people"]),
+        "inference_time": inference_time,
+    }
+    if job.get("json_path"):
+        with open(job["json_path"], "w") as f:
+            json.dump(document, f)
+        result["outputs"] = {"json": job["json_path"]}
+    else:
+        result["people"] = document["people"]
+    result["elapsed"] = time.time() - started
+    return result
+
+
+def video_frames(job):
+    """Yield (frame index, image) for the frames of a video job.
+
+    Frames come from video_path, or from the image_paths of a frame
+    sequence, from frame_first to frame_last (-1: the last one) every
+    frame_step frames.
+    """
+    first = job.get("frame_first", 0)
+    last = job.get("frame_last", -1)
+    step = job.get("frame_step", 1)
+    if job.get("video_path"):
+        capture = cv2.VideoCapture(job["video_path"])
+        if not capture.isOpened():
+            raise ValueError(f"Could not open video: {job['video_path']}")
+        try:
+            index = 0
+            while last < 0 or index <= last:
+                if index < first or (index - first) % step:
+                    # Skipped frames are not decoded
+                    if not capture.grab():
+                        break
+                else:
+                    ok, image = capture.read()
+                    if not ok:
+                        break
+                    yield index, image
+                index += 1
+        finally:
+            capture.release()
+        return
+
+    image_paths = job["image_paths"]
+    if last < 0 or last >= len(image_paths):
+        last = len(image_paths) - 1
+    for index in range(first, last + 1, step):
+        image = cv2.imread(image_paths[index])
+        if image is None:
+            raise ValueError(f"Could not read image: {image_paths[index]}")
+        yield index, image
+
+
+def infer(image, keypoint_scale):
+    """Run inference on one image. Returns (people, inference time, scale)."""
+    started = time.time()
+    height, width = image.shape[:2]
+    datum = op.Datum()
+    datum.cvInputData = image
+    emplace_and_pop(datum)
+    inference_time = time.time() - started
+    document = keypoints_document(datum, keypoint_scale, width, height)
+    scale = coordinate_scale(keypoint_scale, width, height)
+    return document["people"], inference_time, scale
+
+
+def process_video(job):
+    """Run inference on the frames of a video job, in one session.
+
+    Each frame's keypoints are appended to ndjson_path as one line
+    ({"frame", "time", "inferred", "people"}) and reported with a "frame"
+    reply as soon as it is done. With "sampling" only keyframes are
+    inferred (see sample_adaptively). Returns the final "done" reply.
+    """
+    fps = job.get("fps") or 0
+    keypoint_scale = job.get("keypoint_scale", 0)
+    frames = [0]
+
+    with open(job["ndjson_path"], "a") as out:
+
+        def emit(index, people, inferred, inference_time=None):
+            frame = {
+                "frame": index,
+                "time": index / fps if fps else None,
+                "inferred": inferred,
+                "people": people,
+            }
+            out.write(json.dumps(frame) + "\n")
+            out.flush()
+            frames[0] += 1
+            reply(
+                {
+                    "ok": True,
+                    "event": "frame",
+                    "frame": index,
+                    "inferred": inferred,
+                    "num_people": len(people),
+                    "inference_time": inference_time,
+                }
+            )
+
+        if job.get("sampling"):
+            sample_adaptively(job, keypoint_scale, emit)
+        else:
+            for index, image in video_frames(job):
+                people, inference_time, _ = infer(image, keypoint_scale)
+                emit(index, people, True, inference_time)
+    return {"ok": True, "event": "done", "frames": frames[0]}
+
+
+def sample_adaptively(job, keypoint_scale, emit):
+    """Infer keyframes at an adaptive stride and interpolate the frames between.
+
+    The next keyframe is taken up to max_stride frames after the last one.
+    When the motion between the two keyframes is above motion_threshold (or
+    the people changed), every frame between them is inferred and the
+    stride halves; otherwise they are interpolated, and the stride doubles
+    again while the motion stays under half the threshold. Frames are
+    emitted in order.
+    """
+    max_stride = job["sampling"]["max_stride"]
+    threshold = job["sampling"]["motion_threshold"]
+    state = {"stride": max_stride, "keyframe": None}
+    pending = []  # (index, image) of the frames since the last keyframe
+
+    def close_segment():
+        index, image = pending.pop()
+        people, inference_time, scale = infer(image, keypoint_scale)
+        previous_index, previous_people = state["keyframe"]
+        motion, pairs = keyframe_motion(previous_people, people, scale)
+        if motion > threshold and pending:
+            for between, between_image in pending:
+                between_people, between_time, _ = infer(between_image, keypoint_scale)
+                emit(between, between_people, True, between_time)
+            state["stride"] = max(1, state["stride"] // 2)
+        else:
+            for between, _ in pending:
+                alpha = (between - previous_index) / (index - previous_index)
+                emit(
+                    between,
+                    interpolate_people(previous_people, people, pairs, alpha),
+                    False,
+                )
+            if motion <= threshold / 2:
+                state["stride"] = min(max_stride, state["stride"] * 2)
+        emit(index, people, True, inference_time)
+        state["keyframe"] = (index, people)
+        pending.clear()
+
+    for index, image in video_frames(job):
+        if state["keyframe"] is None:
+            people, inference_time, _ = infer(image, keypoint_scale)
+            emit(index, people, True, inference_time)
+            state["keyframe"] = (index, people)
+            continue
+        pending.append((index, image))
+        if len(pending) >= state["stride"]:
+            close_segment()
+    if pending:
+        close_segment()
+
+
+def main():
+    for line in iter(sys.stdin.readline, ""):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            message = json.loads(line)
+            cmd = message.get("cmd")
+            if cmd == "quit":
+                reply({"ok": True})
+                break
+            elif IMPORT_ERROR is not None:
+                reply({"ok": False, "unavailable": True, "error": IMPORT_ERROR})
+            elif cmd == "configure":
+                load_time = configure(message["params"])
+                reply({"ok": True, "load_time": load_time})
+            elif cmd == "process":
+                if wrapper is None:
+                    raise RuntimeError("Worker is not configured")
+                result = process(message)
+                result["ok"] = True
+                reply(result)
+            elif cmd == "process_video":
+                if wrapper is None:
+                    raise RuntimeError("Worker is not configured")
+                reply(process_video(message))
+            else:
+                raise ValueError(f"Unknown command: {cmd}")
+        except Exception as e:
+            traceback.print_exc()
+            reply({"ok": False, "error": str(e)})
+
+    if wrapper is not None:
+        wrapper.stop()
+
+
+if __name__ == "__main__":
+    main()